@@ -0,0 +1,93 @@
+from collections import deque
+from dataclasses import dataclass, field
+import logging
+from typing import Iterator, Mapping
+
+logger = logging.getLogger(__name__)
+
+ROOT = 0
+
+
+@dataclass
+class Automaton:
+    # Trie of all the literals, state 0 is the root. Every state has the state of its
+    # longest proper suffix that is also in the trie to fall back to, and the literals
+    # ending at it as (literal id, length), its own and those of its fall back states.
+    goto: list[dict[str, int]] = field(default_factory=lambda: [{}])
+    fail: list[int] = field(default_factory=lambda: [ROOT])
+    outputs: list[tuple[tuple[int, int], ...]] = field(default_factory=lambda: [()])
+
+    def finditer(self, source_text: str) -> Iterator[tuple[int, int, int]]:
+        # Yields (literal id, start index, end index) for every occurrence of every
+        # literal in one pass over the text, overlapping ones included, by end index
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = ROOT
+        for idx, char in enumerate(source_text):
+            while state != ROOT and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, ROOT)
+            for literal_id, literal_len in outputs[state]:
+                yield literal_id, idx + 1 - literal_len, idx + 1
+
+
+def build(literals: Mapping[int, str]) -> Automaton:
+    automaton = Automaton()
+    goto, fail, outputs = automaton.goto, automaton.fail, automaton.outputs
+    for literal_id, literal in literals.items():
+        if not literal:
+            continue
+        state = ROOT
+        for char in literal:
+            if (next_state := goto[state].get(char)) is None:
+                next_state = goto[state][char] = len(goto)
+                goto.append({})
+                fail.append(ROOT)
+                outputs.append(())
+            state = next_state
+        outputs[state] += ((literal_id, len(literal)),)
+
+    # Breadth first, so the fall back state of every parent is done before its children
+    queue = deque(goto[ROOT].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            fail_state = fail[state]
+            while fail_state != ROOT and char not in goto[fail_state]:
+                fail_state = fail[fail_state]
+            fail_state = goto[fail_state].get(char, ROOT)
+            fail[next_state] = fail_state if fail_state != next_state else ROOT
+            outputs[next_state] += outputs[fail[next_state]]
+
+    logger.debug(f"Built Aho-Corasick automaton of {len(goto)} states")
+    return automaton
+
+
+def check(literals: list[str], source_text: str):
+    found = sorted(build(dict(enumerate(literals))).finditer(source_text))
+    expected_found = sorted(
+        (literal_id, idx, idx + len(literal))
+        for literal_id, literal in enumerate(literals)
+        if literal
+        for idx in range(len(source_text))
+        if source_text.startswith(literal, idx)
+    )
+
+    passed = found == expected_found
+    logger.debug(
+        f"Found {found} == {expected_found} for {literals} in {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check(["he", "she", "his", "hers"], "ushers and his hershey")
+    check(["a", "aa", "aaa"], "aaaa")
+    check(["ERROR", "ERR", "RROR", "OR 5"], "INFO 1 ERROR 5 ERRO")
+    check(["ab", "ab", ""], "xabab")
+    check(["一二", "二三"], "一二三")
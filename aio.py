@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import Executor
+import logging
+from typing import AsyncIterable, AsyncIterator, Protocol
+
+import nfa
+
+logger = logging.getLogger(__name__)
+
+Chunk = str | bytes
+
+# Chars the scanner steps over before handing control back to the event loop
+DEFAULT_YIELD_EVERY = 4 * 1024
+# Chunks at least this long are scanned in the executor, when one is given
+DEFAULT_OFFLOAD_MIN_LEN = 1024 * 1024
+
+
+class ChunkReader(Protocol):
+    # Ex. `asyncio.StreamReader`, read from with `read(n)` as iterating it gives lines
+    async def read(self, n: int = -1) -> Chunk: ...
+
+
+async def chunks(
+    source: AsyncIterable[Chunk] | ChunkReader, chunk_size: int
+) -> AsyncIterator[Chunk]:
+    if isinstance(source, AsyncIterable):
+        async for chunk in source:
+            yield chunk
+        return
+
+    while chunk := await source.read(chunk_size):
+        yield chunk
+
+
+def join(chunks: list[Chunk]) -> Chunk:
+    # Chunks of a stream are all `str` or all bytes
+    if chunks and isinstance(chunks[0], bytes):
+        return b"".join(chunk for chunk in chunks if isinstance(chunk, bytes))
+    return "".join(chunk for chunk in chunks if isinstance(chunk, str))
+
+
+def _feed(scanner: nfa.Scanner, chunk: Chunk) -> tuple[nfa.Scanner, list[nfa.Span]]:
+    # Runs in the executor, the scanner is handed back so process pools work too
+    spans = list(scanner.feed(chunk))
+    return scanner, spans
+
+
+async def scan(
+    program: nfa.Program,
+    source_chunks: AsyncIterable[Chunk],
+    empty: Chunk = "",
+    yield_every: int = DEFAULT_YIELD_EVERY,
+    executor: Executor | None = None,
+    offload_min_len: int = DEFAULT_OFFLOAD_MIN_LEN,
+) -> AsyncIterator[nfa.Span]:
+    # Same spans as `nfa.search_stream`, but chunks are fed to the scanner `yield_every`
+    # chars at a time with a trip through the event loop in between, so other tasks
+    # get to run during a long scan. `empty` is `b""` when the chunks are bytes.
+    loop = asyncio.get_running_loop()
+    scanner = nfa.Scanner(program=program, buffer=empty)
+    async for chunk in source_chunks:
+        if executor is not None and len(chunk) >= offload_min_len:
+            scanner, spans = await loop.run_in_executor(executor, _feed, scanner, chunk)
+            for span in spans:
+                yield span
+            continue
+
+        for piece_idx in range(0, len(chunk), yield_every):
+            for span in scanner.feed(chunk[piece_idx : piece_idx + yield_every]):
+                yield span
+            await asyncio.sleep(0)
+
+    for span in scanner.close():
+        yield span
+
+
+def check(regex: str, source_text: str, yield_every: int):
+    import optimizer
+    import parser
+
+    program = nfa.compile(optimizer.optimize(parser.parse(regex, 0)))
+    expected_spans = list(nfa.search(program, source_text))
+
+    async def source_chunks() -> AsyncIterator[str]:
+        yield source_text
+
+    async def run() -> tuple[list[nfa.Span], int]:
+        # Ticks while the scan runs, so a scan that never gives control back ticks once
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticker = asyncio.create_task(tick())
+        spans = [
+            span
+            async for span in scan(program, source_chunks(), yield_every=yield_every)
+        ]
+        ticker.cancel()
+        return spans, ticks
+
+    spans, ticks = asyncio.run(run())
+    expected_ticks = len(source_text) // yield_every
+    passed = spans == expected_spans and ticks >= expected_ticks
+    logger.debug(
+        f"Async spans {spans[:5]}... == {expected_spans[:5]}... for {regex}, other task "
+        f"ran {ticks} times (at least {expected_ticks}) "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("ERROR.[0-9]+", "INFO 1\nERROR 22\n" * 10_000, yield_every=1024)
+    check("a{2,3}c", "aaaac_aac_ac" * 1000, yield_every=100)
+    check("[BCP]at", "1BatCatPatRat", yield_every=4)
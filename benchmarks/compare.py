@@ -0,0 +1,89 @@
+import argparse
+import json
+import logging
+import sys
+
+import log
+
+logger = logging.getLogger(__name__)
+
+# Slower by more than this fraction is flagged, timings of the same code move around a bit
+DEFAULT_THRESHOLD = 0.10
+
+
+def load_results(path: str) -> tuple[dict, dict[tuple[str, str, str], dict]]:
+    with open(path) as results_file:
+        run = json.load(results_file)
+    return run["meta"], {
+        (result["case"], result["stage"], result["engine"]): result
+        for result in run["results"]
+    }
+
+
+def slowdown(base_result: dict, new_result: dict) -> float:
+    # Searches are compared by throughput, so runs over different corpus sizes still compare
+    if base_result["mb_per_s"] and new_result["mb_per_s"]:
+        return base_result["mb_per_s"] / new_result["mb_per_s"] - 1
+    return new_result["seconds"] / base_result["seconds"] - 1
+
+
+def compare(
+    base_path: str, new_path: str, threshold: float = DEFAULT_THRESHOLD
+) -> list[tuple[str, str, str]]:
+    base_meta, base_results = load_results(base_path)
+    new_meta, new_results = load_results(new_path)
+    if base_meta["size"] != new_meta["size"]:
+        logger.warning(
+            f"Corpus sizes differ ({base_meta['size']} vs {new_meta['size']}), only search "
+            "throughput is comparable"
+        )
+
+    regressions = []
+    for key, new_result in new_results.items():
+        if (base_result := base_results.get(key)) is None:
+            continue
+
+        change = slowdown(base_result, new_result)
+        is_regression = change > threshold
+        if is_regression:
+            regressions.append(key)
+
+        case, stage, engine = key
+        status = "[red]REGRESSION[/]" if is_regression else ""
+        if change < -threshold:
+            status = "[green]faster[/]"
+        matches_changed = new_result["matches"] != base_result["matches"]
+        logger.info(
+            f"{case:<20} {stage:<8} {engine:<8} {base_result['seconds'] * 1000:10.3f} ms -> "
+            f"{new_result['seconds'] * 1000:10.3f} ms {change:+7.1%} {status}"
+            + (
+                f" [yellow]matches {base_result['matches']} -> {new_result['matches']}[/]"
+                if matches_changed
+                else ""
+            )
+        )
+
+    return regressions
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(
+        description="Compare two benchmark runs and flag the regressions"
+    )
+    arg_parser.add_argument("base", help="JSON results of the run to compare against")
+    arg_parser.add_argument("new", help="JSON results of the new run")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = arg_parser.parse_args()
+
+    regressions = compare(args.base, args.new, args.threshold)
+    if regressions:
+        logger.error(f"{len(regressions)} regressions over {args.threshold:.0%}")
+        return 1
+
+    logger.info("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    log.setup()
+    sys.exit(main())
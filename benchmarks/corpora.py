@@ -0,0 +1,39 @@
+import random
+
+# Every corpus is made from a fixed seed, so runs on different days search the same text
+
+
+def log_lines(size: int, seed: int = 1) -> str:
+    rand = random.Random(seed)
+    levels = ["INFO", "INFO", "DEBUG", "WARN", "ERROR"]
+    lines = []
+    text_len = 0
+    line_idx = 0
+    while text_len < size:
+        line = (
+            f"2024-01-01 12:{line_idx % 60:02d}:00 {rand.choice(levels)} request "
+            f"id={rand.randint(0, 99_999)} took {rand.randint(1, 999)}ms\n"
+        )
+        lines.append(line)
+        text_len += len(line)
+        line_idx += 1
+    return "".join(lines)[:size]
+
+
+def dna(size: int, seed: int = 2) -> str:
+    rand = random.Random(seed)
+    return "".join(rand.choices("ACGT", k=size))
+
+
+def repetition(size: int) -> str:
+    # Long runs of the same char that almost match, the worst case for starting a match
+    # at every index (ex. `a*b` has to scan to the end of the run from every start)
+    run = "a" * 999 + "c"
+    return (run * (size // len(run) + 1))[:size]
+
+
+CORPORA = {
+    "logs": log_lines,
+    "dna": dna,
+    "repetition": repetition,
+}
@@ -0,0 +1,68 @@
+import argparse
+import logging
+import random
+import time
+
+from benchmarks import corpora
+import log
+import regex
+
+logger = logging.getLogger(__name__)
+
+PATTERNS = ["took [0-9]+ms", "[a-z]+[0-9]", "ERROR"]
+# Typed at a few places of the text, one char per edit, like in an editor
+TYPED = "INFO 42 took 17ms "
+
+
+def edits(text_len: int, places: int, seed: int = 3) -> list[tuple[int, str]]:
+    rand = random.Random(seed)
+    typed_edits = []
+    for _ in range(places):
+        idx = rand.randrange(text_len)
+        for char in TYPED:
+            typed_edits.append((idx, char))
+            idx += 1
+    return typed_edits
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Time per edit of an incremental search against searching again"
+    )
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 1024])
+    arg_parser.add_argument("--places", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    for size in args.sizes:
+        source_text = corpora.log_lines(size * 1024)
+        typed_edits = edits(len(source_text), args.places)
+        for regex_str in PATTERNS:
+            expression_matcher = regex.compile(regex_str)
+
+            text = source_text
+            start_time = time.perf_counter()
+            for idx, char in typed_edits:
+                text = text[:idx] + char + text[idx:]
+                expression_matcher.search(text)
+            again_seconds = time.perf_counter() - start_time
+
+            incremental_search = expression_matcher.incremental(source_text)
+            start_time = time.perf_counter()
+            for idx, char in typed_edits:
+                incremental_search.apply_edit(idx, idx, char)
+            incremental_seconds = time.perf_counter() - start_time
+
+            assert incremental_search.matches == expression_matcher.search(text)
+            logger.info(
+                f"{size:5d} KB {regex_str:<14} per edit: search again "
+                f"{again_seconds / len(typed_edits) * 1e6:9.1f} µs incremental "
+                f"{incremental_seconds / len(typed_edits) * 1e6:7.1f} µs "
+                f"({again_seconds / incremental_seconds:.0f}x faster)",
+                extra={"markup": False},
+            )
+
+
+if __name__ == "__main__":
+    log.setup()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
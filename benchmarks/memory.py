@@ -0,0 +1,80 @@
+import logging
+import sys
+import time
+import tracemalloc
+from typing import NamedTuple
+
+from benchmarks import corpora
+import log
+import matcher
+import regex
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryResult(NamedTuple):
+    regex: str
+    matches: int
+    peak_bytes: int
+    seconds: float
+
+
+def measure(regex_str: str, source_text: str) -> MemoryResult:
+    expression_matcher = regex.compile(regex_str)
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    # Counted without keeping the matches, so the peak is what searching itself allocates
+    matches = expression_matcher.count(source_text, engine="tree")
+    seconds = time.perf_counter() - start_time
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return MemoryResult(
+        regex=regex_str,
+        matches=matches,
+        peak_bytes=peak_bytes,
+        seconds=seconds,
+    )
+
+
+def object_sizes() -> dict[str, int]:
+    # Bytes of one instance, `__dict__` included for classes that still have one
+    def size_of(instance: object) -> int:
+        instance_dict = getattr(instance, "__dict__", None)
+        return sys.getsizeof(instance) + (
+            sys.getsizeof(instance_dict) if instance_dict is not None else 0
+        )
+
+    return {
+        "GroupState": size_of(matcher.GroupState()),
+        "GroupAllNode": size_of(matcher.GroupAllNode(sub_nodes=[])),
+        "MatchCharNode": size_of(matcher.MatchCharNode(char="a")),
+    }
+
+
+CASES = ["ERROR.request", "id=[0-9]+ took", "[a-z]+", "[e+q]u*e"]
+# One match over the whole text, where anything kept per sub node result adds up
+LONG_MATCH_CASE = ("[a-z ]+", "lorem ipsum " * 20_000)
+
+
+def main():
+    source_text = corpora.log_lines(100 * 1024)
+    for regex_str, case_text in [
+        *((regex_str, source_text) for regex_str in CASES),
+        LONG_MATCH_CASE,
+    ]:
+        result = measure(regex_str, case_text)
+        logger.info(
+            f"{result.regex:<16} matches={result.matches:<6} "
+            f"peak={result.peak_bytes / 1024:8.1f} KiB time={result.seconds:.3f}s",
+            extra={"markup": False},
+        )
+    for name, size in object_sizes().items():
+        logger.info(f"{name:<16} {size} bytes per instance")
+
+
+if __name__ == "__main__":
+    log.setup()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import logging
+import random
+import time
+
+from benchmarks import corpora
+import log
+import regex
+
+logger = logging.getLogger(__name__)
+
+# Alerting style patterns, half plain literals and half with a literal part to trigger on
+WORDS = ["ERROR", "WARN", "timeout", "refused", "panic", "request", "user", "disk"]
+PATTERN_PARTS = ["", " id=[0-9]+", ".*took [0-9]{3}ms", "[a-z_]+[0-9]{2,4}"]
+
+
+def patterns(count: int, seed: int = 4) -> list[str]:
+    # Every pattern is different (ends with its index), like a list of separate alerts
+    rand = random.Random(seed)
+    return [
+        f"{rand.choice(WORDS)}{rand.choice(PATTERN_PARTS)}{idx}" for idx in range(count)
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Per line cost of a pattern set against searching every pattern"
+    )
+    arg_parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 300])
+    arg_parser.add_argument("--lines", type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    lines = corpora.log_lines(args.lines * 80).splitlines()[: args.lines]
+    for count in args.counts:
+        regexes = patterns(count)
+        expression_matchers = [regex.compile(regex_str) for regex_str in regexes]
+        regex_set = regex.compile_set(regexes)
+
+        start_time = time.perf_counter()
+        for line in lines:
+            for expression_matcher in expression_matchers:
+                expression_matcher.search(line)
+        each_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for line in lines:
+            regex_set.search(line)
+        set_seconds = time.perf_counter() - start_time
+
+        logger.info(
+            f"{count:4d} patterns, per line: each {each_seconds / len(lines) * 1e6:9.1f} µs "
+            f"set {set_seconds / len(lines) * 1e6:7.1f} µs "
+            f"({each_seconds / set_seconds:.1f}x faster)"
+        )
+
+
+if __name__ == "__main__":
+    log.setup()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
@@ -0,0 +1,185 @@
+import argparse
+from dataclasses import asdict, dataclass
+from functools import partial
+import json
+import logging
+import platform
+import re
+import sys
+import time
+from typing import Callable, NamedTuple
+
+from benchmarks import corpora
+import log
+import nfa
+import parser
+import regex
+
+logger = logging.getLogger(__name__)
+
+ENGINES: list[regex.Engine] = ["tree", "nfa", "dfa", "codegen", "shiftand", "auto"]
+
+
+class Case(NamedTuple):
+    name: str
+    regex: str
+    corpus: str
+    # Fraction of `--size` the corpus is cut to, worst case inputs are kept short so the
+    # slow engines finish
+    size_factor: float = 1.0
+
+
+CASES = [
+    Case("log_level", "ERROR", "logs"),
+    Case("log_error_id", "ERROR.request.id=[0-9]+", "logs"),
+    Case("log_took_ms", "took [0-9]+ms", "logs"),
+    Case("log_words", "[a-z]+", "logs"),
+    Case("dna_motif", "GA[AT][CG]TC", "dna"),
+    Case("dna_runs", "[GC]{4,}", "dna"),
+    Case("log_short_id", "id=[0-9]{5} ", "logs"),
+    Case("repetition_star", "a*[bd]", "repetition", size_factor=1 / 64),
+    Case("repetition_bounded", "a{1,999}c", "repetition", size_factor=1 / 16),
+    # Same search as above with a range a thousand times bigger, it should not be slower
+    Case("repetition_counted", "a{1,1000000}c", "repetition", size_factor=1 / 16),
+]
+
+
+@dataclass
+class Result:
+    case: str
+    # What was timed, `parse`, `compile` or `search`
+    stage: str
+    # Search engine, `re` for the stdlib baseline, empty for parse and compile
+    engine: str
+    seconds: float
+    mb_per_s: float | None = None
+    matches: int | None = None
+
+
+def best_time(func: Callable[[], object], repeat: int) -> tuple[float, object]:
+    # Fastest of `repeat` runs, slower runs are the machine being busy, not the code
+    best_seconds = float("inf")
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        best_seconds = min(best_seconds, time.perf_counter() - start_time)
+    return best_seconds, result
+
+
+def run_case(
+    case: Case, size: int, engines: list[regex.Engine], repeat: int
+) -> list[Result]:
+    source_text = corpora.CORPORA[case.corpus](int(size * case.size_factor))
+    megabytes = len(source_text.encode()) / 1_000_000
+    results = []
+
+    parse_count = 1_000
+    seconds, _ = best_time(
+        lambda: [parser.parse(case.regex, 0) for _ in range(parse_count)], repeat
+    )
+    results.append(Result(case.name, "parse", "", seconds / parse_count))
+
+    seconds, _ = best_time(
+        lambda: regex.ExpressionMatcher(regex._compile(case.regex)), repeat
+    )
+    results.append(Result(case.name, "compile", "", seconds))
+
+    compiled_re = re.compile(case.regex)
+    seconds, matches = best_time(
+        lambda: sum(1 for _ in compiled_re.finditer(source_text)), repeat
+    )
+    assert isinstance(matches, int)
+    results.append(
+        Result(case.name, "search", "re", seconds, megabytes / seconds, matches)
+    )
+
+    for engine in engines:
+        expression_matcher = regex.compile(case.regex, engine=engine)
+        try:
+            # First search builds the engine (and warms the DFA cache), it is not timed
+            expression_matcher.search(source_text)
+        except nfa.UnsupportedPatternError:
+            logger.info(f"{case.name}: {engine} engine does not support `{case.regex}`")
+            continue
+
+        seconds, found = best_time(
+            partial(expression_matcher.search, source_text), repeat
+        )
+        assert isinstance(found, list)
+        results.append(
+            Result(
+                case.name, "search", engine, seconds, megabytes / seconds, len(found)
+            )
+        )
+
+    return results
+
+
+def log_results(results: list[Result]):
+    for result in results:
+        throughput = (
+            f"{result.mb_per_s:9.2f} MB/s" if result.mb_per_s is not None else ""
+        )
+        matches = f"matches={result.matches}" if result.matches is not None else ""
+        logger.info(
+            f"{result.case:<20} {result.stage:<8} {result.engine:<8} "
+            f"{result.seconds * 1000:10.3f} ms {throughput:>14} {matches}",
+            extra={"markup": False},
+        )
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark the turtle-regex engines"
+    )
+    arg_parser.add_argument(
+        "--size", type=int, default=256 * 1024, help="Corpus size in chars"
+    )
+    arg_parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per timing, best is kept"
+    )
+    arg_parser.add_argument("--engines", default=",".join(ENGINES))
+    arg_parser.add_argument(
+        "--cases", default="", help="Comma separated case names, all if empty"
+    )
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    args = arg_parser.parse_args()
+
+    engines = [engine for engine in args.engines.split(",") if engine]
+    case_names = {name for name in args.cases.split(",") if name}
+    # Debug logging of the engines would be timed too
+    logging.getLogger().setLevel(logging.INFO)
+
+    results = []
+    for case in CASES:
+        if case_names and case.name not in case_names:
+            continue
+        case_results = run_case(case, args.size, engines, args.repeat)
+        log_results(case_results)
+        results.extend(case_results)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {
+                    "meta": {
+                        "python": sys.version,
+                        "platform": platform.platform(),
+                        "size": args.size,
+                        "repeat": args.repeat,
+                        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    },
+                    "results": [asdict(result) for result in results],
+                },
+                output_file,
+                indent=2,
+            )
+        logger.info(f"Results written to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    log.setup()
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+import log
+import regex
+
+logger = logging.getLogger(__name__)
+
+PATTERN_PARTS = [".[0-9]+", "[a-z_]+[0-9]{2,4}", "[BCP]at.*", "[a-f0-9]{8}-", ".{1,9}x"]
+WORDS = ["ERROR", "WARN", "INFO", "user", "took", "id", "GET", "POST"]
+
+
+def patterns(count: int, seed: int = 3) -> list[str]:
+    # Every pattern is different (ends with its index), so none come from the compile cache
+    rand = random.Random(seed)
+    return [
+        f"{rand.choice(WORDS)}{rand.choice(PATTERN_PARTS)}{idx}" for idx in range(count)
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Startup time of compiling patterns against loading them from a bundle"
+    )
+    arg_parser.add_argument("--count", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    regexes = patterns(args.count)
+    regex.set_cache_size(0)
+
+    start_time = time.perf_counter()
+    matchers = {regex_str: regex.compile(regex_str) for regex_str in regexes}
+    compile_seconds = time.perf_counter() - start_time
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bundle_path = os.path.join(temp_dir, "patterns.trxb")
+        regex.save_bundle(bundle_path, matchers)
+
+        start_time = time.perf_counter()
+        matcher_bundle = regex.load_bundle(bundle_path, cache=False)
+        load_seconds = time.perf_counter() - start_time
+
+        # Every match tree decoded, the cost of using all the loaded patterns
+        start_time = time.perf_counter()
+        for regex_str in matcher_bundle:
+            matcher_bundle[regex_str]
+        decode_seconds = time.perf_counter() - start_time
+        bundle_size = os.path.getsize(bundle_path)
+
+    logger.info(f"compile  {args.count} patterns {compile_seconds * 1000:8.2f} ms")
+    logger.info(
+        f"load     {args.count} patterns {load_seconds * 1000:8.2f} ms "
+        f"({compile_seconds / load_seconds:.1f}x faster), bundle {bundle_size / 1024:.1f} KiB"
+    )
+    logger.info(
+        f"decode   {args.count} patterns {decode_seconds * 1000:8.2f} ms "
+        f"({compile_seconds / (load_seconds + decode_seconds):.1f}x faster with load)"
+    )
+
+
+if __name__ == "__main__":
+    log.setup()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
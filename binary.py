@@ -0,0 +1,108 @@
+from enum import Enum
+import logging
+from string import Template
+
+import matcher
+
+logger = logging.getLogger(__name__)
+
+# Bytes like input is matched with patterns of chars up to this one, every char standing
+# for the byte of the same value (same as decoding the input as latin-1, without doing it)
+MAX_BYTE_CHAR = "\xff"
+
+
+class BinaryErrors(Enum):
+    CHAR_NOT_BYTE = Template(
+        "Can not match `${char}` against bytes, only chars up to `\\xff` (standing for the byte of the same value) can be!"
+    )
+
+
+def _byte(char: matcher.Char) -> int:
+    if isinstance(char, int):
+        # Already a byte value, in a tree made for bytes like input
+        return char
+    if char > MAX_BYTE_CHAR:
+        raise ValueError(BinaryErrors.CHAR_NOT_BYTE.value.substitute(char=char))
+    return ord(char)
+
+
+def to_bytes_exp(node: matcher.Node) -> matcher.Node:
+    # Copy of the (optimized) match tree with byte values in place of chars, so every engine
+    # can compare them against the ints that indexing bytes, `mmap` or `memoryview` gives
+    match node:
+        case matcher.MatchCharNode():
+            return matcher.MatchCharNode(char=_byte(node.char))
+        case matcher.MatchLiteralNode():
+            return matcher.MatchBytesLiteralNode(
+                literal=bytes(_byte(char) for char in node.literal)
+            )
+        case matcher.MatchClassNode():
+            return matcher.MatchClassNode(
+                chars=frozenset(_byte(char) for char in node.chars),
+                ranges=tuple(
+                    (_byte(first), _byte(last)) for first, last in node.ranges
+                ),
+            )
+        case matcher.MatchScanNode():
+            char_node = to_bytes_exp(node.char_node)
+            assert isinstance(
+                char_node,
+                (matcher.MatchCharNode, matcher.MatchClassNode, matcher.MatchAnyNode),
+            )
+            return matcher.MatchScanNode(
+                char_node=char_node,
+                min_repeat_count=node.min_repeat_count,
+                max_repeat_count=node.max_repeat_count,
+            )
+        case matcher.GroupAllNode() | matcher.GroupAnyNode():
+            return type(node)(sub_nodes=[to_bytes_exp(sub_node) for sub_node in node])
+        case matcher.GroupGreadyRepeatNode():
+            return matcher.GroupGreadyRepeatNode(
+                sub_nodes=[to_bytes_exp(sub_node) for sub_node in node],
+                min_repeat_count=node.min_repeat_count,
+                max_repeat_count=node.max_repeat_count,
+            )
+
+    return node
+
+
+def check(
+    regex: str, source_bytes: bytes, expected_spans: list[tuple[int, int]] | None
+):
+    import optimizer
+    import parser
+    import regex as regex_
+
+    try:
+        match_exp = to_bytes_exp(optimizer.optimize(parser.parse(regex, 0)))
+    except ValueError:
+        passed = expected_spans is None
+        logger.debug(
+            f"ValueError for {regex} is correctly issued? "
+            f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+        )
+        return
+
+    assert isinstance(match_exp, matcher.GroupNode)
+    spans = [tuple(match) for match in regex_._search(match_exp, source_bytes)]
+    passed = spans == expected_spans
+    logger.debug(
+        f"Byte spans {spans} == {expected_spans} for {regex} in {source_bytes!r} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("ERROR.[0-9]+", b"INFO 1\nERROR 22\n", [(7, 15)])
+    check("[a-c]+x", b"abcx_bbx", [(0, 4), (5, 8)])
+    check("caf\xe9", "caf\xe9 caf\xe9".encode("latin-1"), [(0, 4), (5, 9)])
+    check("a.{2}", bytes([97, 0, 255]), [(0, 3)])
+    check("[\x00-\x1f]+", b"ok\x01\x02ok", [(2, 4)])
+    # Chars over `\xff` have no byte standing for them
+    check("€", b"\xe2\x82\xac", None)
+    check("[一-龥]", b"abc", None)
@@ -0,0 +1,419 @@
+from array import array
+from enum import Enum, IntEnum
+import logging
+import struct
+import sys
+from string import Template
+from typing import Iterable, Literal, NamedTuple
+
+import matcher
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TRXB"
+# Bumped on any change to the layout, bundles of other versions are refused
+BUNDLE_VERSION = 2
+# Repeat counts not set (ex. `a*` has no min or max) are stored as this
+NO_COUNT = -1
+
+# Regex lengths, node op counts, engine indexes and DFA cache sizes
+COLUMN_COUNT = 4
+
+# Ints (lengths, options and node ops) are stored little endian as int32 if they all fit,
+# int64 otherwise (ex. for `a{9999999999}`)
+IntTypecode = Literal["i", "q"]
+INT32: IntTypecode = "i"
+INT64: IntTypecode = "q"
+_INT32_MAX = 2**31 - 1
+
+# Magic, version, int type, then the counts of records and node ops and the sizes of the
+# engine names and regex strings
+_HEADER = struct.Struct("<4sH1sIQII")
+
+
+class BundleErrors(Enum):
+    BAD_MAGIC = Template("Not a turtle-regex bundle, starts with `${magic}`!")
+    BAD_VERSION = Template(
+        "Bundle version ${version} can not be loaded, only version ${expected} can!"
+    )
+    TRUNCATED = Template("Bundle of ${size} bytes is cut short or corrupted!")
+    UNKNOWN_OPCODE = Template("Unknown node opcode ${opcode} at op ${op_idx}!")
+    UNSUPPORTED_NODE = Template("Can not store node `${node}` in a bundle!")
+
+
+class Opcode(IntEnum):
+    # GROUP_ALL/ GROUP_ANY <sub node count>
+    GROUP_ALL = 1
+    GROUP_ANY = 2
+    # REPEAT <min or NO_COUNT> <max or NO_COUNT> <sub node count>
+    REPEAT = 3
+    # CHAR <code point>
+    CHAR = 4
+    ANY = 5
+    # CLASS <char run count> (<first> <last>)... <range count> (<first> <last>)..., the
+    # class chars are stored as runs of consecutive code points
+    CLASS = 6
+    # LITERAL <char count> <code point>...
+    LITERAL = 7
+    # SCAN <min or NO_COUNT> <max or NO_COUNT> <char node>, where the char node is one
+    # of CHAR, ANY or CLASS with its operands
+    SCAN = 8
+
+
+ScanCharNode = matcher.MatchCharNode | matcher.MatchClassNode | matcher.MatchAnyNode
+
+
+class PatternRecord(NamedTuple):
+    regex: str
+    engine: str
+    dfa_cache_size: int
+    # Encoded match tree, only decoded by `match_exp()` so loading a bundle is just
+    # slicing out the records
+    ops: array | memoryview
+
+    @classmethod
+    def encode(
+        cls, regex: str, engine: str, dfa_cache_size: int, match_exp: matcher.GroupNode
+    ) -> PatternRecord:
+        ops = array(INT64)
+        encode_node(match_exp, ops)
+        return cls(regex=regex, engine=engine, dfa_cache_size=dfa_cache_size, ops=ops)
+
+    def match_exp(self) -> matcher.GroupNode:
+        return decode_node(self.ops)
+
+
+def _encode_count(count: int | None) -> int:
+    return NO_COUNT if count is None else count
+
+
+def _code_point_runs(chars: frozenset[matcher.Char]) -> list[tuple[int, int]]:
+    runs: list[tuple[int, int]] = []
+    for code in sorted(map(matcher.code, chars)):
+        if runs and runs[-1][1] == code - 1:
+            runs[-1] = (runs[-1][0], code)
+        else:
+            runs.append((code, code))
+    return runs
+
+
+def encode_node(node: matcher.Node, ops: array):
+    # Nodes are written in pre order, groups first with how many sub nodes follow
+    match node:
+        case matcher.GroupAllNode():
+            ops.extend((Opcode.GROUP_ALL, len(node.sub_nodes)))
+        case matcher.GroupAnyNode():
+            ops.extend((Opcode.GROUP_ANY, len(node.sub_nodes)))
+        case matcher.GroupGreadyRepeatNode():
+            ops.extend(
+                (
+                    Opcode.REPEAT,
+                    _encode_count(node.min_repeat_count),
+                    _encode_count(node.max_repeat_count),
+                    len(node.sub_nodes),
+                )
+            )
+        case matcher.MatchCharNode():
+            ops.extend((Opcode.CHAR, matcher.code(node.char)))
+        case matcher.MatchAnyNode():
+            ops.append(Opcode.ANY)
+        case matcher.MatchLiteralNode():
+            ops.extend((Opcode.LITERAL, len(node.literal)))
+            ops.extend(map(matcher.code, node.literal))
+        case matcher.MatchScanNode():
+            ops.extend(
+                (
+                    Opcode.SCAN,
+                    _encode_count(node.min_repeat_count),
+                    _encode_count(node.max_repeat_count),
+                )
+            )
+            encode_node(node.char_node, ops)
+        case matcher.MatchClassNode():
+            char_runs = _code_point_runs(node.chars)
+            ops.extend((Opcode.CLASS, len(char_runs)))
+            for first, last in char_runs:
+                ops.extend((first, last))
+            ops.append(len(node.ranges))
+            for first, last in node.ranges:
+                ops.extend((matcher.code(first), matcher.code(last)))
+        case _:
+            raise ValueError(BundleErrors.UNSUPPORTED_NODE.value.substitute(node=node))
+
+    if isinstance(node, matcher.GroupNode):
+        for sub_node in node.sub_nodes:
+            encode_node(sub_node, ops)
+
+
+def _decode_char(ops: list[int], op_idx: int) -> tuple[ScanCharNode, int]:
+    # Single char node (the nodes a SCAN repeats) at `op_idx` and the index of the op
+    # after it
+    opcode = ops[op_idx]
+    match opcode:
+        case Opcode.CHAR:
+            return matcher.MatchCharNode(char=chr(ops[op_idx + 1])), op_idx + 2
+        case Opcode.ANY:
+            return matcher.MatchAnyNode(), op_idx + 1
+        case Opcode.CLASS:
+            chars_end = op_idx + 2 + 2 * ops[op_idx + 1]
+            range_count = ops[chars_end]
+            range_ops = ops[chars_end + 1 : chars_end + 1 + 2 * range_count]
+            node = matcher.MatchClassNode(
+                chars=frozenset(
+                    chr(code)
+                    for run_idx in range(op_idx + 2, chars_end, 2)
+                    for code in range(ops[run_idx], ops[run_idx + 1] + 1)
+                ),
+                ranges=tuple(
+                    (chr(range_ops[idx]), chr(range_ops[idx + 1]))
+                    for idx in range(0, len(range_ops), 2)
+                ),
+            )
+            return node, chars_end + 1 + 2 * range_count
+
+    raise ValueError(
+        BundleErrors.UNKNOWN_OPCODE.value.substitute(opcode=opcode, op_idx=op_idx)
+    )
+
+
+def _decode_leaf(ops: list[int], op_idx: int) -> tuple[matcher.Node, int]:
+    # Node without sub nodes at `op_idx` and the index of the op after it
+    match ops[op_idx]:
+        case Opcode.LITERAL:
+            literal_end = op_idx + 2 + ops[op_idx + 1]
+            literal = "".join(map(chr, ops[op_idx + 2 : literal_end]))
+            return matcher.MatchLiteralNode(literal=literal), literal_end
+        case Opcode.SCAN:
+            min_count, max_count = ops[op_idx + 1], ops[op_idx + 2]
+            # Any other opcode for the char node is an unknown one, same as at a node
+            char_node, op_idx = _decode_char(ops, op_idx + 3)
+            node = matcher.MatchScanNode(
+                char_node=char_node,
+                min_repeat_count=None if min_count == NO_COUNT else min_count,
+                max_repeat_count=None if max_count == NO_COUNT else max_count,
+            )
+            return node, op_idx
+
+    return _decode_char(ops, op_idx)
+
+
+def decode_node(ops: array | memoryview) -> matcher.GroupNode:
+    # Stack of (group, sub nodes still to read into it), no recursion so deep trees load too
+    root = None
+    stack: list[list] = []
+    op_idx = 0
+    # Indexing a list of ints is faster than the array/ memoryview the ops are read into
+    op_ints: list[int] = ops.tolist()
+    while op_idx < len(op_ints):
+        opcode = op_ints[op_idx]
+        match opcode:
+            case Opcode.GROUP_ALL | Opcode.GROUP_ANY:
+                node_type = (
+                    matcher.GroupAllNode
+                    if opcode == Opcode.GROUP_ALL
+                    else matcher.GroupAnyNode
+                )
+                node = node_type(sub_nodes=[])
+                sub_node_count = op_ints[op_idx + 1]
+                op_idx += 2
+            case Opcode.REPEAT:
+                min_count, max_count = op_ints[op_idx + 1], op_ints[op_idx + 2]
+                node = matcher.GroupGreadyRepeatNode(
+                    sub_nodes=[],
+                    min_repeat_count=None if min_count == NO_COUNT else min_count,
+                    max_repeat_count=None if max_count == NO_COUNT else max_count,
+                )
+                sub_node_count = op_ints[op_idx + 3]
+                op_idx += 4
+            case _:
+                node, op_idx = _decode_leaf(op_ints, op_idx)
+                sub_node_count = 0
+
+        if stack:
+            parent = stack[-1]
+            parent[0].sub_nodes.append(node)
+            parent[1] -= 1
+        else:
+            root = node
+        if sub_node_count:
+            stack.append([node, sub_node_count])
+        while stack and stack[-1][1] == 0:
+            stack.pop()
+
+    assert isinstance(root, matcher.GroupNode)
+    return root
+
+
+def _little_endian(ints: array) -> bytes:
+    if sys.byteorder == "big":
+        ints = array(ints.typecode, ints)
+        ints.byteswap()
+    return ints.tobytes()
+
+
+def _read_ints(data: memoryview, typecode: IntTypecode) -> array | memoryview:
+    if sys.byteorder == "big":
+        ints = array(typecode, data)
+        ints.byteswap()
+        return ints
+    return data.cast(typecode)
+
+
+def dumps(records: Iterable[PatternRecord]) -> bytes:
+    # Laid out in columns (header, lengths, engines, DFA cache sizes, node ops, engine
+    # names, regex strings) so loading is a few slices instead of a loop of small reads
+    records = list(records)
+    engine_names = list(dict.fromkeys(record.engine for record in records))
+    engines = "\n".join(engine_names).encode()
+    regexes = "".join(record.regex for record in records).encode()
+
+    ints = array(INT64)
+    ints.extend(len(record.regex) for record in records)
+    ints.extend(len(record.ops) for record in records)
+    ints.extend(engine_names.index(record.engine) for record in records)
+    ints.extend(record.dfa_cache_size for record in records)
+    for record in records:
+        ints.extend(record.ops)
+    if -_INT32_MAX - 1 <= min(ints, default=0) and max(ints, default=0) <= _INT32_MAX:
+        ints = array(INT32, ints)
+
+    return b"".join(
+        (
+            _HEADER.pack(
+                MAGIC,
+                BUNDLE_VERSION,
+                ints.typecode.encode(),
+                len(records),
+                len(ints) - COLUMN_COUNT * len(records),
+                len(engines),
+                len(regexes),
+            ),
+            _little_endian(ints),
+            engines,
+            regexes,
+        )
+    )
+
+
+def loads(data: bytes) -> list[PatternRecord]:
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError(
+            BundleErrors.BAD_MAGIC.value.substitute(magic=data[: len(MAGIC)])
+        )
+    if len(data) < _HEADER.size:
+        raise ValueError(BundleErrors.TRUNCATED.value.substitute(size=len(data)))
+    _, version, typecode, record_count, ops_count, engines_size, regexes_size = (
+        _HEADER.unpack_from(data, 0)
+    )
+    if version != BUNDLE_VERSION:
+        raise ValueError(
+            BundleErrors.BAD_VERSION.value.substitute(
+                version=version, expected=BUNDLE_VERSION
+            )
+        )
+    typecode = typecode.decode()
+    if typecode not in (INT32, INT64):
+        raise ValueError(BundleErrors.TRUNCATED.value.substitute(size=len(data)))
+    ints_size = (COLUMN_COUNT * record_count + ops_count) * array(typecode).itemsize
+    if len(data) != _HEADER.size + ints_size + engines_size + regexes_size:
+        raise ValueError(BundleErrors.TRUNCATED.value.substitute(size=len(data)))
+
+    view = memoryview(data)[_HEADER.size :]
+    ints = _read_ints(view[:ints_size], typecode)
+    regex_lens, ops_lens, engine_idxs, dfa_cache_sizes = (
+        ints[column * record_count : (column + 1) * record_count]
+        for column in range(COLUMN_COUNT)
+    )
+    ops = ints[COLUMN_COUNT * record_count :]
+    view = view[ints_size:]
+    engine_names = str(view[:engines_size], "utf-8").split("\n")
+    regexes = str(view[engines_size:], "utf-8")
+
+    records = []
+    regex_idx = ops_idx = 0
+    for regex_len, ops_len, engine_idx, dfa_cache_size in zip(
+        regex_lens, ops_lens, engine_idxs, dfa_cache_sizes
+    ):
+        records.append(
+            PatternRecord(
+                regex=regexes[regex_idx : regex_idx + regex_len],
+                engine=engine_names[engine_idx],
+                dfa_cache_size=dfa_cache_size,
+                ops=ops[ops_idx : ops_idx + ops_len],
+            )
+        )
+        regex_idx += regex_len
+        ops_idx += ops_len
+
+    logger.debug(f"Loaded {len(records)} patterns from bundle version {version}")
+    return records
+
+
+def check(regex: str):
+    import optimizer
+    import parser
+
+    match_exp = optimizer.optimize(parser.parse(regex, 0))
+    data = dumps([PatternRecord.encode(regex, "tree", 1, match_exp)])
+    (record,) = loads(data)
+
+    passed = record.regex == regex and record.match_exp() == match_exp
+    logger.debug(
+        f"Bundle of {regex} in {len(data)} bytes loads back the same "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+def check_error(data: bytes):
+    try:
+        loads(data)
+        message = None
+    except ValueError as e:
+        message = str(e)
+
+    logger.debug(
+        f"Loading bundle {data[:8]!r} fails with: {message} "
+        f"<<<<<<<<<<< {'SUCCESS' if message is not None else 'FAIL'}"
+    )
+
+
+def check_decode_error(ops: list[int]):
+    op_array = array(INT64, ops)
+    try:
+        decode_node(op_array)
+        message = None
+    except ValueError as e:
+        message = str(e)
+
+    logger.debug(
+        f"Decoding node ops {op_array.tolist()} fails with: {message} "
+        f"<<<<<<<<<<< {'SUCCESS' if message is not None else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+if __name__ == "__main__":
+    import log
+    import parser
+
+    log.setup()
+
+    check("ababab[QAD]*")
+    check("ERROR.[0-9]+")
+    check("[a+b]c{2,5}.*")
+    check("a{9999999999}")
+    check("[一-龥]+[a-z_]")
+    check("")
+    check("ab[c]d.*x{2,}[a-f]{3}")
+
+    check_error(b"NOPE" + bytes(6))
+    check_error(_HEADER.pack(MAGIC, BUNDLE_VERSION + 1, b"i", 0, 0, 0, 0))
+    check_error(
+        dumps([PatternRecord.encode("a+", "tree", 1, parser.parse("a+", 0))])[:-1]
+    )
+    check_decode_error([Opcode.GROUP_ALL, 1, 99])
+    # A SCAN of a literal, only single char nodes can be scanned
+    check_decode_error(
+        [Opcode.GROUP_ALL, 1, Opcode.SCAN, 0, NO_COUNT, Opcode.LITERAL, 1, ord("a")]
+    )
@@ -0,0 +1,333 @@
+import builtins
+from dataclasses import dataclass, field
+import itertools
+import linecache
+import logging
+from typing import Callable, Iterator
+
+import matcher
+
+logger = logging.getLogger(__name__)
+
+INDENT = "    "
+
+# Every generated module gets its own file name so tracebacks can show its source
+_generated_ids = itertools.count()
+
+
+@dataclass
+class GeneratedMatcher:
+    source: str
+    filename: str
+    match: Callable[[matcher.Text, int, int], tuple[bool, int]]
+    search: Callable[[matcher.Text, Callable[[int], int] | None], list[tuple[int, int]]]
+    finditer: Callable[
+        [matcher.Text, Callable[[int], int] | None], Iterator[tuple[int, int]]
+    ]
+
+
+@dataclass
+class _Function:
+    name: str
+    lines: list[str] = field(default_factory=list)
+
+    def emit(self, depth: int, line: str):
+        self.lines.append(f"{INDENT * depth}{line}")
+
+
+@dataclass
+class _Generator:
+    # Every group node becomes a function `(s, n, i) -> consumed or -1`, nodes that match
+    # a single char (and repeats of them) are inlined as plain comparisons and loops
+    functions: list[_Function] = field(default_factory=list)
+    temp_ids: Iterator[int] = field(default_factory=itertools.count)
+    # Module level lines defining the char sets used by class nodes
+    constants: list[str] = field(default_factory=list)
+
+    def char_set_constant(self, chars: frozenset[matcher.Char]) -> str:
+        name = f"_chars_{len(self.constants)}"
+        chars_repr = ", ".join(sorted(repr(char) for char in chars))
+        self.constants.append(f"{name} = frozenset({{{chars_repr}}})")
+        return name
+
+    def char_test(
+        self, node: matcher.Node, pos: str, negate: bool = False
+    ) -> str | None:
+        # Python expression that is true if `node` matches (or with `negate`, does not match)
+        # the char at `pos`, which is already known to be < n
+        match node:
+            case matcher.MatchCharNode():
+                return f"s[{pos}] {'!=' if negate else '=='} {node.char!r}"
+            case matcher.MatchAnyNode():
+                return "False" if negate else "True"
+            case matcher.MatchClassNode(ranges=()):
+                chars = self.char_set_constant(node.chars)
+                return f"s[{pos}] {'not in' if negate else 'in'} {chars}"
+            case matcher.MatchClassNode():
+                tests = [f"s[{pos}] in {self.char_set_constant(node.chars)}"] + [
+                    f"{first!r} <= s[{pos}] <= {last!r}" for first, last in node.ranges
+                ]
+                test = " or ".join(tests)
+                return f"not ({test})" if negate else f"({test})"
+            case matcher.GroupAnyNode() if node.sub_nodes and all(
+                isinstance(sub_node, matcher.MatchCharNode) for sub_node in node
+            ):
+                chars = ", ".join(
+                    sorted(
+                        {
+                            repr(sub_node.char)
+                            for sub_node in node
+                            if isinstance(sub_node, matcher.MatchCharNode)
+                        }
+                    )
+                )
+                return f"s[{pos}] {'not in' if negate else 'in'} {{{chars}}}"
+            case matcher.GroupAllNode(sub_nodes=[sub_node]):
+                return self.char_test(sub_node, pos, negate)
+
+        return None
+
+    def emit_node(self, func: _Function, depth: int, node: matcher.Node, on_fail: str):
+        # Matches `node` at `j`, moving `j` past what it consumed or running `on_fail`
+        if (test := self.char_test(node, "j", negate=True)) is not None:
+            if test == "False":
+                func.emit(depth, f"if j >= n: {on_fail}")
+            else:
+                func.emit(depth, f"if j >= n or {test}: {on_fail}")
+            func.emit(depth, "j += 1")
+            return
+
+        match node:
+            case matcher.MatchBytesLiteralNode():
+                # `mmap` and `memoryview` have no `startswith`
+                end = f"j + {len(node.literal)}"
+                func.emit(depth, f"if s[j : {end}] != {node.literal!r}: {on_fail}")
+                func.emit(depth, f"j += {len(node.literal)}")
+            case matcher.MatchLiteralNode():
+                func.emit(depth, f"if not s.startswith({node.literal!r}, j): {on_fail}")
+                func.emit(depth, f"j += {len(node.literal)}")
+            case (
+                matcher.GroupGreadyRepeatNode(sub_nodes=[sub_node])
+                | matcher.MatchScanNode(char_node=sub_node)
+            ) if (test := self.char_test(sub_node, "j")) is not None:
+                start = f"k{next(self.temp_ids)}"
+                func.emit(depth, f"{start} = j")
+                # Bounded repeats only need to see one char past the max to know it failed
+                stop = "n"
+                if node.max_repeat_count is not None:
+                    stop = f"e{next(self.temp_ids)}"
+                    func.emit(
+                        depth, f"{stop} = min(n, j + {node.max_repeat_count + 1})"
+                    )
+                if test == "True":
+                    func.emit(depth, f"j = {stop}")
+                else:
+                    func.emit(depth, f"while j < {stop} and {test}:")
+                    func.emit(depth + 1, "j += 1")
+                checks = self.repeat_count_checks(node, f"j - {start}")
+                if checks is not None:
+                    # Give the scanned chars back, a repeat around it stops before it
+                    func.emit(depth, f"if {checks}:")
+                    func.emit(depth + 1, f"j = {start}")
+                    func.emit(depth + 1, on_fail)
+            case _:
+                consumed = f"c{next(self.temp_ids)}"
+                func.emit(depth, f"{consumed} = {self.function(node)}(s, n, j)")
+                func.emit(depth, f"if {consumed} < 0: {on_fail}")
+                func.emit(depth, f"j += {consumed}")
+
+    def repeat_count_checks(
+        self, node: matcher.GroupGreadyRepeatNode | matcher.MatchScanNode, count: str
+    ) -> str | None:
+        checks = []
+        if node.min_repeat_count:
+            checks.append(f"{count} < {node.min_repeat_count}")
+        if node.max_repeat_count is not None:
+            checks.append(f"{count} > {node.max_repeat_count}")
+        return " or ".join(checks) or None
+
+    def function(self, node: matcher.Node) -> str:
+        func = _Function(name=f"_node_{len(self.functions)}")
+        self.functions.append(func)
+        func.emit(0, f"def {func.name}(s, n, i):")
+
+        match node:
+            case matcher.GroupAllNode(sub_nodes=[]):
+                func.emit(1, "return -1")
+            case matcher.GroupAllNode():
+                func.emit(1, "j = i")
+                for sub_node in node:
+                    self.emit_node(func, 1, sub_node, on_fail="return -1")
+                func.emit(1, "return j - i")
+            case matcher.GroupAnyNode():
+                for sub_node in node:
+                    if (test := self.char_test(sub_node, "i")) is not None:
+                        func.emit(1, f"if i < n and {test}: return 1")
+                    else:
+                        func.emit(1, f"c = {self.function(sub_node)}(s, n, i)")
+                        func.emit(1, "if c >= 0: return c")
+                func.emit(1, "return -1")
+            case matcher.GroupGreadyRepeatNode():
+                # Each sub node that matches counts as one repeat, same as the tree matcher
+                func.emit(1, "j = i")
+                func.emit(1, "count = 0")
+                func.emit(1, "while True:")
+                for sub_node in node:
+                    self.emit_node(func, 2, sub_node, on_fail="break")
+                    func.emit(2, "count += 1")
+                    if node.max_repeat_count is not None:
+                        func.emit(2, f"if count > {node.max_repeat_count}: return -1")
+                if node.min_repeat_count:
+                    func.emit(1, f"if count < {node.min_repeat_count}: return -1")
+                func.emit(1, "return j - i")
+            case _:
+                func.emit(1, "j = i")
+                self.emit_node(func, 1, node, on_fail="return -1")
+                func.emit(1, "return j - i")
+
+        return func.name
+
+
+_ENTRY_POINTS = """
+def match(source_string, source_string_len, index):
+    consumed = {root}(source_string, source_string_len, index)
+    if consumed < 0:
+        return (False, 0)
+    return (True, consumed)
+
+
+def search(source_text, next_candidate=None):
+    n = len(source_text)
+    spans = []
+    i = 0
+    while i < n:
+        if next_candidate is not None:
+            i = next_candidate(i)
+            if i < 0:
+                break
+        consumed = {root}(source_text, n, i)
+        if consumed < 0:
+            i += 1
+        else:
+            spans.append((i, i + consumed))
+            i += consumed or 1
+    return spans
+
+
+def finditer(source_text, next_candidate=None):
+    n = len(source_text)
+    i = 0
+    while i < n:
+        if next_candidate is not None:
+            i = next_candidate(i)
+            if i < 0:
+                break
+        consumed = {root}(source_text, n, i)
+        if consumed < 0:
+            i += 1
+        else:
+            yield (i, i + consumed)
+            i += consumed or 1
+"""
+
+
+def generate(match_exp: matcher.Node) -> str:
+    generator = _Generator()
+    root = generator.function(match_exp)
+    functions = "\n\n".join(
+        "\n".join(func.lines) for func in reversed(generator.functions)
+    )
+    constants = "".join(f"{line}\n" for line in generator.constants)
+    return f"{constants}\n\n{functions}\n\n{_ENTRY_POINTS.format(root=root)}"
+
+
+def compile(match_exp: matcher.Node) -> GeneratedMatcher:
+    source = generate(match_exp)
+    filename = f"<turtle-regex codegen #{next(_generated_ids)}>"
+    logger.debug(f"Generated matcher {filename}:\n{source}", extra={"markup": False})
+
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    namespace: dict = {}
+    exec(builtins.compile(source, filename, "exec"), namespace)
+
+    return GeneratedMatcher(
+        source=source,
+        filename=filename,
+        match=namespace["match"],
+        search=namespace["search"],
+        finditer=namespace["finditer"],
+    )
+
+
+def check(regex: str, source_text: str, optimize: bool = False):
+    import optimizer
+    import parser
+    import regex as regex_
+
+    match_exp = parser.parse(regex, 0)
+    generated_exp = (
+        optimizer.optimize(parser.parse(regex, 0)) if optimize else match_exp
+    )
+    spans = compile(generated_exp).search(source_text, None)
+    expected_spans = [tuple(match) for match in regex_._search(match_exp, source_text)]
+
+    passed = spans == expected_spans
+    logger.debug(
+        f"Generated spans {spans} == {expected_spans} for {regex} in {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_match(match_exp: matcher.GroupNode, source_text: str):
+    result = compile(match_exp).match(source_text, len(source_text), 0)
+    expected_result = matcher.match(match_exp, source_text)
+
+    passed = result == expected_result
+    logger.debug(
+        f"Generated match {result} == {expected_result} for {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+if __name__ == "__main__":
+    import log
+    import optimizer
+    import parser
+
+    log.setup()
+
+    check("[BCP]at", "1BatCatPatRat")
+    check(".[BCP]at", "1BatCatPatRat")
+    check("e{2,4}", "$$OleeeOlaOleOleOla")
+    check("e{2,4}", "eeeee")
+    check("a*", "baab")
+    check("a.*b", "a__b__")
+    check("a[b.]+c", "xab_bc_abbbc")
+    check("[a+b]c", "aaac_bc")
+    check("[a-c]+[xyz]", "abcx_ccaz_bb")
+    check("[ab]{2}c", "abc_abbc_ab")
+    check(".{2,3}", "abcd")
+    # Scans the optimizer puts right under a repeat
+    check("x[a{2}]*", "xaaa", optimize=True)
+    check("[a{2}]*", "aaa", optimize=True)
+    check("[[ab]{2}]*", "abab", optimize=True)
+
+    ab_repeat = matcher.GroupGreadyRepeatNode(
+        min_repeat_count=1,
+        sub_nodes=[
+            matcher.GroupAllNode(
+                sub_nodes=[
+                    matcher.MatchCharNode(char="a"),
+                    matcher.MatchCharNode(char="b"),
+                ]
+            )
+        ],
+    )
+    check_match(ab_repeat, "ababab-suffix")
+    check_match(ab_repeat, "baabab-suffix")
+
+    logger.debug(
+        f"Generated source for `ab*[cd]`:\n{generate(parser.parse('ab*[cd]', 0))}\n\n"
+        f"And for `[a-z]+[一-龥]`:\n{generate(optimizer.optimize(parser.parse('[a-z]+[一-龥]', 0)))}",
+        extra={"markup": False},
+    )
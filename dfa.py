@@ -0,0 +1,395 @@
+from dataclasses import dataclass, field
+import logging
+import sys
+import threading
+from typing import Callable, Iterator, NamedTuple
+
+import matcher
+import nfa
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 10_000
+
+
+class DFACacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    flushes: int
+    size: int
+    max_size: int
+
+
+# Threads in start order and if a match was found, that is still waiting on
+# threads that started earlier to fail
+StateKey = tuple[tuple[nfa.Thread, ...], bool]
+# Transitions are keyed by the char, and the guards too for states with counter sets
+TransitionKey = matcher.Char | None | tuple[matcher.Char | None, int]
+
+
+# Guard bits of a counter set: its newest thread can match one more char without going
+# over the maximum, its oldest thread matched at least the minimum
+NEWEST_UNDER_MAX = 2
+OLDEST_OVER_MIN = 1
+
+# Counter set ops, run on the next state's thread data after a transition (see `CounterOp`)
+EXPIRE, NEW, ADD, ADD_OLDEST, OLDEST_START = range(5)
+
+
+class CounterOp(NamedTuple):
+    op: int
+    # Index of the next state's thread the op is for
+    thread_idx: int
+    # EXPIRE: maximum repeat count, ADD: index of the thread that joins (in start order),
+    # ADD_OLDEST: index of the counter set whose oldest thread joins
+    arg: int = 0
+    # ADD/ ADD_OLDEST: entry index of the joining thread, from the current index
+    entry_offset: int = 0
+    bounded: bool = True
+
+
+class Transition(NamedTuple):
+    next_state: DFAState
+    # Is the current index started as a new thread (last in start order)
+    spawned: bool
+    # Index of the thread (in start order) that found a match, -1 if none did
+    accepted_idx: int
+    # Indexes of the threads (in start order) that next_state's threads came from, -1 for
+    # a counter set made by this transition
+    kept_idxs: tuple[int, ...]
+    counter_ops: tuple[CounterOp, ...] = ()
+
+
+@dataclass(eq=False, slots=True)
+class DFAState:
+    key: StateKey
+    transitions: dict[TransitionKey, Transition] = field(default_factory=dict)
+    # (thread index, min repeat count, max repeat count) of every counter set thread
+    counted: tuple[tuple[int, int, int | None], ...] = ()
+
+    @property
+    def threads(self) -> tuple[nfa.Thread, ...]:
+        return self.key[0]
+
+    @property
+    def has_pending(self) -> bool:
+        return self.key[1]
+
+
+class LazyDFA:
+    # DFA states are built from the NFA program on demand while scanning and every
+    # (state, char) transition is cached, once `cache_size` transitions are cached the
+    # whole cache is flushed so memory stays bounded no matter the pattern. Cached
+    # transitions are read without locking, only building new ones takes the lock.
+    def __init__(self, program: nfa.Program, cache_size: int = DEFAULT_CACHE_SIZE):
+        if cache_size < 1:
+            raise ValueError(f"DFA cache size has to be positive, got {cache_size}!")
+
+        self.program = program
+        self.cache_size = cache_size
+        self.states: dict[StateKey, DFAState] = {}
+        self.cached_transitions = 0
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.lock = threading.Lock()
+
+    def cache_info(self) -> DFACacheInfo:
+        return DFACacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            flushes=self.flushes,
+            size=self.cached_transitions,
+            max_size=self.cache_size,
+        )
+
+    def _state(self, key: StateKey) -> DFAState:
+        if (state := self.states.get(key)) is None:
+            steps = self.program.steps
+            state = self.states[key] = DFAState(
+                key=key,
+                counted=tuple(
+                    (
+                        thread_idx,
+                        steps[step_idx].min_repeat_count,
+                        steps[step_idx].max_repeat_count,
+                    )
+                    for thread_idx, (step_idx, repeat_count) in enumerate(key[0])
+                    if repeat_count == nfa.COUNTED
+                ),
+            )
+        return state
+
+    def _flush(self):
+        logger.debug(f"Flushing DFA cache, {len(self.states)} states")
+        self.states = {}
+        self.cached_transitions = 0
+        self.flushes += 1
+
+    def start_state(self) -> DFAState:
+        return self._state(((), False))
+
+    def transition(
+        self, state: DFAState, char: matcher.Char | None, guards: int = 0
+    ) -> Transition:
+        with self.lock:
+            return self._transition(state, char, guards)
+
+    def _transition(
+        self, state: DFAState, char: matcher.Char | None, guards: int
+    ) -> Transition:
+        # Same as `nfa.advance`, but for the threads' states only, what happens to counter
+        # sets is decided by their guards and recorded as ops to run on their thread data
+        self.misses += 1
+        if self.cached_transitions >= self.cache_size:
+            self._flush()
+            state = self._state(state.key)
+
+        program = self.program
+        threads = list(state.threads)
+        spawned = (
+            not state.has_pending and char is not None and program.start not in threads
+        )
+        if spawned:
+            threads.append(program.start)
+
+        thread_guards = {
+            thread_idx: (guards >> (2 * (len(state.counted) - counted_idx - 1))) & 3
+            for counted_idx, (thread_idx, _, _) in enumerate(state.counted)
+        }
+        next_threads: dict[nfa.Thread, int] = {}
+        counter_ops: list[CounterOp] = []
+        accepted_idx = -1
+        for thread_idx, thread in enumerate(threads):
+            if thread[1] == nfa.COUNTED:
+                curr_step = program.steps[thread[0]]
+                if char is not None and char in curr_step.char_set:
+                    if thread_guards[thread_idx] & NEWEST_UNDER_MAX:
+                        if curr_step.max_repeat_count is not None:
+                            counter_ops.append(
+                                CounterOp(
+                                    EXPIRE,
+                                    len(next_threads),
+                                    curr_step.max_repeat_count,
+                                )
+                            )
+                        next_threads[thread] = thread_idx
+                    continue
+                if not thread_guards[thread_idx] & OLDEST_OVER_MIN:
+                    continue
+                # The repeat ended and goes on as its oldest thread, that has enough
+                thread = (thread[0], curr_step.min_repeat_count)
+
+            result = nfa.step(program, thread, char)
+            if result is None:
+                continue
+            if result is nfa.ACCEPTED:
+                accepted_idx = thread_idx
+                break
+
+            step_idx, repeat_count = result
+            if step_idx < len(program.steps) and program.steps[step_idx].is_counted:
+                counted_thread = (step_idx, nfa.COUNTED)
+                if counted_thread not in next_threads:
+                    counter_ops.append(CounterOp(NEW, len(next_threads)))
+                    next_threads[counted_thread] = -1
+                counter_ops.append(
+                    CounterOp(
+                        ADD_OLDEST if threads[thread_idx][1] == nfa.COUNTED else ADD,
+                        list(next_threads).index(counted_thread),
+                        thread_idx,
+                        1 - repeat_count,
+                        program.steps[step_idx].max_repeat_count is not None,
+                    )
+                )
+            elif result not in next_threads:
+                if threads[thread_idx][1] == nfa.COUNTED:
+                    counter_ops.append(CounterOp(OLDEST_START, len(next_threads)))
+                next_threads[result] = thread_idx
+
+        next_state = self._state(
+            (tuple(next_threads), state.has_pending or accepted_idx >= 0)
+        )
+        transition = Transition(
+            next_state=next_state,
+            spawned=spawned,
+            accepted_idx=accepted_idx,
+            kept_idxs=tuple(next_threads.values()),
+            counter_ops=tuple(counter_ops),
+        )
+        state.transitions[(char, guards) if state.counted else char] = transition
+        self.cached_transitions += 1
+        return transition
+
+    def leftmost_match(
+        self,
+        source_text: matcher.Text,
+        scan_from: int,
+        next_candidate: Callable[[int], int] | None = None,
+        budget: matcher.Budget | None = None,
+    ) -> nfa.Span | None:
+        text_len = len(source_text)
+        state = self.start_state()
+        # Start index (or counter set) of every thread in the current state, in the same order
+        thread_data: list[int | nfa.CounterSet] = []
+        pending: nfa.Span | None = None
+        misses = self.misses
+        steps = 0
+        # Budget steps are counted from where the budget already is
+        budget_steps = budget.steps if budget is not None else 0
+        check_at = (
+            budget.next_check() - budget_steps if budget is not None else sys.maxsize
+        )
+
+        idx = scan_from
+        while idx <= text_len:
+            if (
+                not thread_data
+                and pending is None
+                and next_candidate is not None
+                and (idx := next_candidate(idx)) < 0
+            ):
+                break
+
+            steps += 1
+            if steps >= check_at:
+                assert budget is not None
+                check_at = budget.check(budget_steps + steps) - budget_steps
+            char = source_text[idx] if idx < text_len else None
+            if state.counted:
+                guards = _guards(state.counted, thread_data, idx)
+                transition = state.transitions.get((char, guards)) or self.transition(
+                    state, char, guards
+                )
+            else:
+                transition = state.transitions.get(char) or self.transition(state, char)
+
+            if transition.spawned:
+                thread_data.append(idx)
+            if transition.accepted_idx >= 0:
+                pending = (nfa.start_of(thread_data[transition.accepted_idx]), idx)
+            next_thread_data = [thread_data[i] for i in transition.kept_idxs]
+            if transition.counter_ops:
+                _run_counter_ops(
+                    transition.counter_ops, thread_data, next_thread_data, idx
+                )
+            thread_data = next_thread_data
+
+            state = transition.next_state
+            if pending is not None and not thread_data:
+                break
+            idx += 1
+
+        self.hits += steps - (self.misses - misses)
+        if budget is not None:
+            budget.steps = budget_steps + steps
+        return pending
+
+    def search(
+        self,
+        source_text: matcher.Text,
+        next_candidate: Callable[[int], int] | None = None,
+        budget: matcher.Budget | None = None,
+    ) -> Iterator[nfa.Span]:
+        scan_from = 0
+        while scan_from < len(source_text):
+            span = self.leftmost_match(source_text, scan_from, next_candidate, budget)
+            if span is None:
+                return
+
+            yield span
+            start_idx, end_idx = span
+            scan_from = end_idx if end_idx > start_idx else start_idx + 1
+
+
+def _guards(
+    counted: tuple[tuple[int, int, int | None], ...], thread_data: list, idx: int
+) -> int:
+    # Guard bits of every counter set, 2 per set in thread order
+    guards = 0
+    for thread_idx, min_repeat_count, max_repeat_count in counted:
+        runs = thread_data[thread_idx].runs
+        guards <<= 2
+        newest_run = runs[-1]
+        if (
+            max_repeat_count is None
+            or idx - newest_run[0] - newest_run[2] + 1 < max_repeat_count
+        ):
+            guards |= NEWEST_UNDER_MAX
+        if idx - runs[0][0] >= min_repeat_count:
+            guards |= OLDEST_OVER_MIN
+    return guards
+
+
+def _run_counter_ops(
+    counter_ops: tuple[CounterOp, ...],
+    thread_data: list,
+    next_thread_data: list,
+    idx: int,
+):
+    # Thread data is a `CounterSet` for counter set threads and a start index for the others
+    for op, thread_idx, arg, entry_offset, bounded in counter_ops:
+        if op == ADD:
+            next_thread_data[thread_idx].add(
+                idx + entry_offset, thread_data[arg], bounded
+            )
+        elif op == EXPIRE:
+            next_thread_data[thread_idx].expire(idx + 1 - arg)
+        elif op == NEW:
+            next_thread_data[thread_idx] = nfa.CounterSet()
+        elif op == ADD_OLDEST:
+            next_thread_data[thread_idx].add(
+                idx + entry_offset, nfa.start_of(thread_data[arg]), bounded
+            )
+        else:
+            next_thread_data[thread_idx] = nfa.start_of(next_thread_data[thread_idx])
+
+
+def check(
+    regex: str,
+    source_text: str,
+    expected_spans: list[nfa.Span],
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    expect_flushes: bool = False,
+):
+    import parser
+
+    lazy_dfa = LazyDFA(nfa.compile(parser.parse(regex, 0)), cache_size=cache_size)
+    spans = list(lazy_dfa.search(source_text))
+    cache_info = lazy_dfa.cache_info()
+
+    passed = (
+        spans == expected_spans
+        and (cache_info.flushes > 0) == expect_flushes
+        and cache_info.size <= cache_size
+    )
+    logger.debug(
+        f"DFA spans {spans} == {expected_spans} for {regex} in {source_text}, "
+        f"{cache_info} <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("[BCP]at", "1BatCatPatRat", [(1, 4), (4, 7), (7, 10)])
+    check(".[BCP]at", "1BatCatPatRat", [(0, 4), (6, 10)])
+    check("e{2,4}", "$$OleeeOlaOleOleOla", [(4, 7)])
+    check("e{2,4}", "eeeee", [(1, 5)])
+    check("a*", "baab", [(0, 0), (1, 3), (3, 3)])
+    check("ab*c", "xacabbbbcabbd", [(1, 3), (3, 9)])
+    # Repeat counts are kept in counter sets next to the states, not in them, so any range is
+    # a handful of states
+    check("a{0,50}b", "a" * 40 + "b", [(0, 41)], cache_size=8)
+    check("a{2,1000000}b", "a" * 3000 + "bab", [(0, 3001)], cache_size=8)
+    # Every set of steps the threads are on is its own state, a tiny cache has to be
+    # flushed along the way
+    check(
+        "[ab][ab][ab][ab]c",
+        "abbaabab" * 4 + "abc",
+        [(30, 35)],
+        cache_size=4,
+        expect_flushes=True,
+    )
@@ -0,0 +1,155 @@
+from dataclasses import dataclass
+import logging
+from typing import Sequence
+
+import matcher
+import nfa
+
+logger = logging.getLogger(__name__)
+
+
+def max_len(node: matcher.Node) -> int | None:
+    # Most chars a match of the node consumes, None if there is no limit
+    match node:
+        case matcher.MatchLiteralNode(literal=literal):
+            return len(literal)
+        case matcher.MatchScanNode(max_repeat_count=max_repeat_count):
+            return max_repeat_count
+        case matcher.GroupGreadyRepeatNode(max_repeat_count=None):
+            return None
+        case matcher.GroupGreadyRepeatNode(max_repeat_count=int(max_repeat_count)):
+            sub_len = _sequence_max_len(node.sub_nodes)
+            return None if sub_len is None else max_repeat_count * sub_len
+        case matcher.GroupAnyNode():
+            return _max_or_none([max_len(sub_node) for sub_node in node])
+        case matcher.GroupNode():
+            return _sequence_max_len(node.sub_nodes)
+    return 1
+
+
+def _max_or_none(lens: list[int | None]) -> int | None:
+    # Most of `lens`, None if any of them has no limit
+    limited_lens = [len_ for len_ in lens if len_ is not None]
+    return max(limited_lens, default=0) if len(limited_lens) == len(lens) else None
+
+
+def _sequence_max_len(nodes: Sequence[matcher.Node]) -> int | None:
+    total_len = 0
+    for node in nodes:
+        if (node_len := max_len(node)) is None:
+            return None
+        total_len += node_len
+    return total_len
+
+
+def reach(node: matcher.Node) -> int | None:
+    # Most chars a match attempt of the node looks at from where it starts, None if
+    # there is no limit. Repeats look one char (or one more round) past their maximum,
+    # to fail when going over it.
+    match node:
+        case matcher.MatchLiteralNode(literal=literal):
+            return len(literal)
+        case matcher.MatchScanNode(max_repeat_count=None):
+            return None
+        case matcher.MatchScanNode(max_repeat_count=int(max_repeat_count)):
+            return max_repeat_count + 1
+        case matcher.GroupGreadyRepeatNode(max_repeat_count=None):
+            return None
+        case matcher.GroupGreadyRepeatNode(max_repeat_count=int(max_repeat_count)):
+            sub_len = _sequence_max_len(node.sub_nodes)
+            sub_reach = _sequence_reach(node.sub_nodes)
+            if sub_len is None or sub_reach is None:
+                return None
+            return max_repeat_count * sub_len + sub_reach
+        case matcher.GroupAnyNode():
+            return _max_or_none([reach(sub_node) for sub_node in node])
+        case matcher.GroupNode():
+            return _sequence_reach(node.sub_nodes)
+    return 1
+
+
+def _sequence_reach(nodes: Sequence[matcher.Node]) -> int | None:
+    sequence_reach = 0
+    offset = 0
+    for node in nodes:
+        node_reach, node_len = reach(node), max_len(node)
+        if node_reach is None:
+            return None
+        sequence_reach = max(sequence_reach, offset + node_reach)
+        if node_len is None:
+            return None
+        offset += node_len
+    return sequence_reach
+
+
+@dataclass(frozen=True)
+class Lookback:
+    # How far before an edit the match attempts that could see it start
+    reach: int | None
+    # Every char a match can consume, for patterns the NFA engine runs. There an attempt
+    # only looks at a char once it consumed all the ones before it, so it can not see
+    # past a char outside of these.
+    consumed_chars: nfa.CharSet | None
+
+    def restart_idx(self, source_text: str, idx: int) -> int:
+        # Earliest index a match attempt that looks at `idx` (or the end of the text
+        # there) could start at
+        restart_idx = 0 if self.reach is None else max(idx - self.reach, 0)
+        if self.consumed_chars is not None:
+            consumed_chars = self.consumed_chars
+            run_idx = idx
+            while run_idx > restart_idx and source_text[run_idx - 1] in consumed_chars:
+                run_idx -= 1
+            restart_idx = run_idx
+        return restart_idx
+
+
+def compile(match_exp: matcher.GroupNode) -> Lookback:
+    consumed_chars = None
+    try:
+        steps = nfa.compile(match_exp).steps
+        consumed_chars = nfa.CharSet()
+        for step in steps:
+            consumed_chars |= step.char_set
+    except nfa.UnsupportedPatternError:
+        pass
+
+    lookback = Lookback(reach=reach(match_exp), consumed_chars=consumed_chars)
+    logger.debug(f"Complied lookback: {lookback}")
+    return lookback
+
+
+def check(regex: str, source_text: str, idx: int, expected_restart_idx: int):
+    import optimizer
+    import parser
+
+    lookback = compile(optimizer.optimize(parser.parse(regex, 0)))
+    restart_idx = lookback.restart_idx(source_text, idx)
+
+    passed = restart_idx == expected_restart_idx
+    logger.debug(
+        f"Restart index {restart_idx} == {expected_restart_idx} for an edit at {idx} "
+        f"of {source_text} with {regex} (reach {lookback.reach}) "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("[BCP]at", "1BatCatPatRat", 8, 5)
+    check("id=[0-9]{4}x", "id=1234x id=12345x", 14, 9)
+    check("e{2,4}", "OleeeOla", 6, 6)
+    check("e{2,4}", "OleeeOla", 5, 2)
+    # A word can not go on over a space, whatever its length
+    check("[a-z]+", "the quick brown fox", 13, 10)
+    check("[a-z]+", "thequickbrownfox", 13, 0)
+    check(".*x", "the quick brown fox", 13, 0)
+    # Groups the NFA engine can not run only have their reach to go by
+    check("[ab]{2}[b{1,2}a]", "xxxxabab", 7, 2)
+    check("[ab]{2}[b+a]", "xxxxabab", 7, 0)
+    check("[a-c]+[xyz]", "ab_abc", 5, 3)
+    check("", "abc", 2, 2)
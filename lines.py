@@ -0,0 +1,176 @@
+from dataclasses import dataclass
+import itertools
+import logging
+from typing import Iterable, Iterator, NamedTuple
+
+import matcher
+import regex
+
+logger = logging.getLogger(__name__)
+
+START_ANCHOR = "^"
+END_ANCHOR = "$"
+
+
+class LineMatch(NamedTuple):
+    line_number: int
+    line: str
+    matches: list[regex.Match]
+
+
+@dataclass
+class LinePattern:
+    # None when the pattern is only anchors (ex. `^$`), an empty match at every index
+    expression_matcher: regex.ExpressionMatcher | None
+    anchored_start: bool = False
+    anchored_end: bool = False
+
+    def match_at(self, line: str, idx: int) -> regex.Match | None:
+        # Only the match starting at `idx`, the index right after the line can still be
+        # matched by patterns that consume nothing (ex. `a*$` on `aab`)
+        if self.expression_matcher is None:
+            return regex.Match(start_idx=idx, end_idx=idx)
+        if idx < len(line):
+            return next(
+                self.expression_matcher.finditer(line, start_idx=idx, stop_idx=idx + 1),
+                None,
+            )
+
+        is_match, consumed = matcher.match(self.expression_matcher.match_exp, line, idx)
+        return regex.Match(start_idx=idx, end_idx=idx + consumed) if is_match else None
+
+    def first_at_end(self, line: str) -> regex.Match | None:
+        # A match that ends where the line does can start inside of an earlier match that
+        # did not (ex. `a.a$` on `aaaa`), so the search goes on from right after every one
+        line_len = len(line)
+        start_idx = 0
+        while start_idx < line_len and self.expression_matcher is not None:
+            found = next(
+                self.expression_matcher.finditer(line, start_idx=start_idx), None
+            )
+            if found is None:
+                return None
+            if found.end_idx == line_len:
+                return found
+            start_idx = found.start_idx + 1
+        return self.match_at(line, line_len)
+
+    def finditer(self, line: str) -> Iterator[regex.Match]:
+        match self.anchored_start, self.anchored_end:
+            case True, True:
+                # A failed anchor stops the line right away, no other index is tried
+                found = self.match_at(line, 0)
+                if found is not None and found.end_idx == len(line):
+                    yield found
+            case True, False:
+                if (found := self.match_at(line, 0)) is not None:
+                    yield found
+            case False, True:
+                if (found := self.first_at_end(line)) is not None:
+                    yield found
+            case _:
+                if self.expression_matcher is None:
+                    yield regex.Match(start_idx=0, end_idx=0)
+                else:
+                    yield from self.expression_matcher.finditer(line)
+
+    def is_match(self, line: str) -> bool:
+        return next(self.finditer(line), None) is not None
+
+
+def compile(regex_str: str, engine: regex.Engine = "auto") -> LinePattern:
+    # `^` and `$` are anchors only at the very start/ end of the pattern, anywhere else
+    # they are plain chars, same as outside of line mode
+    anchored_start = regex_str.startswith(START_ANCHOR)
+    if anchored_start:
+        regex_str = regex_str[len(START_ANCHOR) :]
+    anchored_end = regex_str.endswith(END_ANCHOR)
+    if anchored_end:
+        regex_str = regex_str[: -len(END_ANCHOR)]
+
+    expression_matcher = regex.compile(regex_str, engine=engine) if regex_str else None
+    return LinePattern(
+        expression_matcher=expression_matcher,
+        anchored_start=anchored_start,
+        anchored_end=anchored_end,
+    )
+
+
+def grep(
+    pattern: LinePattern,
+    lines: Iterable[str],
+    max_count: int | None = None,
+    all_matches: bool = True,
+) -> Iterator[LineMatch]:
+    # Yields the lines with a match as they are read, stopping after `max_count` of them
+    # without reading the rest. Without `all_matches` only the first match of a line is
+    # searched for, enough to know the line matches.
+    if max_count is not None and max_count <= 0:
+        return
+
+    matched_count = 0
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip("\r\n")
+        if all_matches:
+            matches = list(pattern.finditer(line))
+        else:
+            matches = list(itertools.islice(pattern.finditer(line), 1))
+        if not matches:
+            continue
+
+        yield LineMatch(line_number=line_number, line=line, matches=matches)
+        matched_count += 1
+        if max_count is not None and matched_count >= max_count:
+            return
+
+
+def check(
+    regex_str: str,
+    source_lines: list[str],
+    expected_line_matches: list[tuple[int, list[regex.Match]]],
+    max_count: int | None = None,
+):
+    for engine in ("tree", "nfa", "dfa", "codegen"):
+        line_matches = [
+            (line_match.line_number, line_match.matches)
+            for line_match in grep(
+                compile(regex_str, engine=engine), source_lines, max_count=max_count
+            )
+        ]
+        passed = line_matches == expected_line_matches
+        logger.debug(
+            f"Line matches ({engine}) {line_matches} == {expected_line_matches} for "
+            f"{regex_str} in {source_lines} <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+            extra={"markup": False},
+        )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    from regex import Match
+
+    lines = ["ERROR 1 ERROR 2\n", "INFO ERROR 3\n", "\n", "ERROR\n"]
+    check(
+        "ERROR",
+        lines,
+        [
+            (1, [Match(0, 5), Match(8, 13)]),
+            (2, [Match(5, 10)]),
+            (4, [Match(0, 5)]),
+        ],
+    )
+    check("^ERROR", lines, [(1, [Match(0, 5)]), (4, [Match(0, 5)])])
+    check("ERROR.[0-9]$", lines, [(1, [Match(8, 15)]), (2, [Match(5, 12)])])
+    check("^ERROR$", lines, [(4, [Match(0, 5)])])
+    check("^$", lines, [(3, [Match(0, 0)])])
+    crlf_lines = ["ERROR 1\r\n", "INFO ERROR 2\r\n", "\r\n"]
+    check("ERROR.[0-9]$", crlf_lines, [(1, [Match(0, 7)]), (2, [Match(5, 12)])])
+    check("^$", crlf_lines, [(3, [Match(0, 0)])])
+    check("ERROR", lines, [(1, [Match(0, 5), Match(8, 13)])], max_count=1)
+    check("a.a$", ["aaaa", "aaab"], [(1, [Match(1, 4)])])
+    check("a*$", ["aab", "baa"], [(1, [Match(3, 3)]), (2, [Match(1, 3)])])
+    check("^a*", ["aab", "baa"], [(1, [Match(0, 2)]), (2, [Match(0, 0)])])
+    check("x^y$z", ["x^y$z", "xyz"], [(1, [Match(0, 5)])])
@@ -1,8 +1,16 @@
+import argparse
 import logging
+import os
 from pprint import pformat
 import sys
-from typing import Sequence
+from typing import Iterable, Sequence, get_args
 
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+import lines
+import matcher
 import regex
 import log
 
@@ -13,44 +21,199 @@ def hightlight(matches: Sequence[regex.Match], source_text: str) -> str:
     last_ended_idx = 0
     string_fragments = []
     for match in matches:
-        prefix_str = source_text[last_ended_idx : match.start_idx]
-        match_str = source_text[match.start_idx : match.end_idx]
-        suffix_str = source_text[match.end_idx :]
+        prefix_str = escape(source_text[last_ended_idx : match.start_idx])
+        match_str = escape(source_text[match.start_idx : match.end_idx])
+
+        last_ended_idx = match.end_idx
+        string_fragments.extend([prefix_str, "[blue]", match_str, "[/]"])
+    string_fragments.append(escape(source_text[last_ended_idx:]))
+
+    return "".join(string_fragments)
+
+
+def stats_table(stats: matcher.SearchStats) -> Table:
+    table = Table(title="Search profile")
+    table.add_column("Node")
+    table.add_column("Visits", justify="right")
+    table.add_column("Successes", justify="right")
+    table.add_column("Time (ms)", justify="right")
+
+    for node_stats in sorted(
+        stats.node_stats.values(), key=lambda node_stats: -node_stats.visits
+    ):
+        table.add_row(
+            escape(str(node_stats.node)),
+            str(node_stats.visits),
+            str(node_stats.successes),
+            f"{node_stats.seconds * 1000:.3f}" if node_stats.node.is_group else "",
+        )
+
+    table.caption = (
+        f"{stats.searches} searches, {stats.matches} matches, "
+        f"{stats.start_positions} start positions tried, {stats.steps} steps, "
+        f"{stats.frames_pushed} frames pushed, {stats.search_seconds * 1000:.3f} ms "
+        f"searching ({stats.match_seconds * 1000:.3f} ms matching)"
+    )
+    return table
+
+
+def grep_lines(args: argparse.Namespace) -> int:
+    # Output is only the matching lines (or their count), so it can be piped on
+    line_pattern = lines.compile(args.regex, engine=args.engine)
+    if args.file is not None:
+        with open(args.file) as source_lines:
+            return print_lines(args, line_pattern, source_lines)
+    source_lines = (
+        args.source_text.splitlines() if args.source_text is not None else sys.stdin
+    )
+    return print_lines(args, line_pattern, source_lines)
+
+
+def print_lines(
+    args: argparse.Namespace,
+    line_pattern: lines.LinePattern,
+    source_lines: Iterable[str],
+) -> int:
+    line_matches = lines.grep(
+        line_pattern,
+        source_lines,
+        max_count=args.max_count,
+        all_matches=args.highlight and not args.count,
+    )
 
-        last_ended_idx = match.end_idx + 1
-        string_fragments.extend([prefix_str, "[blue]", match_str, "[/]", suffix_str])
+    if args.count:
+        match_count = sum(1 for _ in line_matches)
+        print(match_count)
+        return 0 if match_count else 1
 
-    return "".join(string_fragments) or source_text
+    console = Console(highlight=False, soft_wrap=True)
+    match_count = 0
+    for line_match in line_matches:
+        if args.highlight:
+            console.print(hightlight(line_match.matches, line_match.line))
+        else:
+            print(line_match.line)
+        match_count += 1
+    return 0 if match_count else 1
 
 
 def main() -> int:
-    if len(sys.argv) < 2:
-        logger.error("No regular expression passed in cmd args.")
-        return 1
+    arg_parser = argparse.ArgumentParser(description="Search text with turtle-regex")
+    arg_parser.add_argument("regex", help="Regular expression to search for")
+    arg_parser.add_argument(
+        "source_text", nargs="?", help="Text to search, stdin is read if not given"
+    )
+    arg_parser.add_argument("--engine", choices=get_args(regex.Engine), default="auto")
+    arg_parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Print which engine and prefilter search with the pattern and why",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print search statistics (steps, frames, visits per node) when done",
+    )
+    arg_parser.add_argument(
+        "--file",
+        metavar="PATH",
+        help="File to search, memory mapped and searched as bytes with matches at byte "
+        "offsets (read line by line with `--lines`)",
+    )
+    arg_parser.add_argument(
+        "--lines",
+        action="store_true",
+        help="Search line by line and print the matching lines, `^`/`$` anchor the "
+        "pattern to the start/ end of a line",
+    )
+    arg_parser.add_argument(
+        "-c", "--count", action="store_true", help="Only print how many lines match"
+    )
+    arg_parser.add_argument(
+        "-m",
+        "--max-count",
+        type=int,
+        metavar="N",
+        help="Stop reading after N matching lines",
+    )
+    arg_parser.add_argument(
+        "-l",
+        dest="max_count",
+        action="store_const",
+        const=1,
+        help="Stop reading at the first matching line, same as `-m 1`",
+    )
+    arg_parser.add_argument(
+        "--no-highlight",
+        dest="highlight",
+        action="store_false",
+        help="Print the matching lines without highlighting the matches",
+    )
+    args = arg_parser.parse_args()
+    if args.file is not None and args.source_text is not None:
+        arg_parser.error("source_text and --file can not both be given")
 
-    regex_str = sys.argv[1]
+    if args.lines:
+        # Logging would end up in between the matching lines
+        logging.getLogger().setLevel(logging.WARNING)
+        try:
+            return grep_lines(args)
+        except BrokenPipeError:
+            # The reader stopped early (ex. `| head`), point stdout at devnull so flushing
+            # it on exit does not fail again
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 0
+        except Exception as e:
+            logger.exception(e)
+            return 2
+    if args.count or args.max_count is not None or not args.highlight:
+        arg_parser.error("-c, -l, -m and --no-highlight only work with --lines")
+
+    regex_str = args.regex
     logger.info(
         f"[violet]Hello from turtle-regex! Looking for pattern=[/][blue]`{regex_str}`[/]..."
     )
 
-    if len(sys.argv) > 2:
-        source_text = sys.argv[2]
-    else:
-        logger.info("[yellow]Enter multiple lines (Ctrl+D to finish):[/]")
-        lines = []
-        for line in sys.stdin:
-            lines.append(line)
-        source_text = "".join(lines)
-
     try:
-        matches = regex.search(regex_str, source_text)
-        logger.info(pformat(matches))
-        matches_heading = "[green]Matches are:[/]" if matches else "[red]No matches:[/]"
-        logger.info(f"{matches_heading} {hightlight(matches, source_text)}")
+        expression_matcher = regex.compile(
+            regex_str, engine=args.engine, profile=args.profile
+        )
+        if args.explain:
+            logger.info(expression_matcher.explain(), extra={"markup": False})
+        if args.file is not None:
+            match_count = 0
+            for match in expression_matcher.finditer_file(args.file):
+                logger.info(match)
+                match_count += 1
+            logger.info(f"[green]Found {match_count} matches[/]")
+        elif args.source_text is not None or args.profile:
+            if args.source_text is not None:
+                source_text = args.source_text
+            else:
+                # Profiling follows the selected engine, so stdin is searched all at once
+                logger.info("[yellow]Enter multiple lines (Ctrl+D to finish):[/]")
+                source_text = sys.stdin.read()
+            matches = expression_matcher.search(source_text)
+            logger.info(pformat(matches))
+            matches_heading = (
+                "[green]Matches are:[/]" if matches else "[red]No matches:[/]"
+            )
+            logger.info(f"{matches_heading} {hightlight(matches, source_text)}")
+        else:
+            # Matches are reported as they are found, without holding all of stdin
+            logger.info("[yellow]Enter multiple lines (Ctrl+D to finish):[/]")
+            match_count = 0
+            for match in expression_matcher.search_stream(sys.stdin):
+                logger.info(match)
+                match_count += 1
+            logger.info(f"[green]Found {match_count} matches[/]")
     except Exception as e:
         logger.exception(e)
         return 1
 
+    if args.profile:
+        Console().print(stats_table(expression_matcher.stats()))
+
     return 0
 
 
@@ -1,14 +1,95 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
+from enum import Enum
 import logging
+import mmap
+from string import Template
+import sys
+import time
 from typing import ClassVar, Iterator, Literal, MutableSequence, Protocol
 
 logger = logging.getLogger(__name__)
 
 IS_DONE_TYPE = Literal[True]
 
+# Chars of a match tree, byte values in trees made for bytes like input (see `binary.py`)
+Char = str | int
+# Texts the engines search, indexing a bytes like one gives the byte values
+Text = str | bytes | bytearray | memoryview | mmap.mmap
+# Texts with a `find`, all of them but `memoryview`
+FindableText = str | bytes | bytearray | mmap.mmap
+
+# How many steps run between looking at the clock, for budgets with a timeout
+DEADLINE_CHECK_STEPS = 1024
+
+
+class MatcherErrors(Enum):
+    MAX_STEPS_EXCEEDED = Template(
+        "Match step budget of ${max_steps} steps exceeded, after ${steps} steps!"
+    )
+    TIMEOUT_EXCEEDED = Template(
+        "Match timeout of ${timeout}s exceeded, after ${steps} steps!"
+    )
+
+
+class BudgetExceededError(RuntimeError):
+    def __init__(self, message: str, steps: int):
+        super().__init__(message)
+        self.steps = steps
+
 
 @dataclass
+class Budget:
+    # Limits on how much work a search can do, shared by every match the search tries. A
+    # step is one node visited by `match` (one char for the NFA/ DFA engines).
+    max_steps: int | None = None
+    # Seconds from when the budget is made
+    timeout: float | None = None
+    steps: int = 0
+    deadline: float | None = None
+    # Step count at which the clock is looked at next, only moved on by `check`
+    clock_check_at: int = sys.maxsize
+
+    def __post_init__(self):
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+        if self.deadline is not None:
+            self.clock_check_at = self.steps + DEADLINE_CHECK_STEPS
+
+    def next_check(self) -> int:
+        # Step count at which `check` has to be called next, so loops only compare ints
+        if self.max_steps is not None:
+            return min(self.max_steps + 1, self.clock_check_at)
+        return self.clock_check_at
+
+    def check(self, steps: int) -> int:
+        self.steps = steps
+        if self.deadline is not None and steps >= self.clock_check_at:
+            self.clock_check_at = steps + DEADLINE_CHECK_STEPS
+        if self.max_steps is not None and steps > self.max_steps:
+            raise BudgetExceededError(
+                MatcherErrors.MAX_STEPS_EXCEEDED.value.substitute(
+                    max_steps=self.max_steps, steps=steps
+                ),
+                steps=steps,
+            )
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceededError(
+                MatcherErrors.TIMEOUT_EXCEEDED.value.substitute(
+                    timeout=self.timeout, steps=steps
+                ),
+                steps=steps,
+            )
+        return self.next_check()
+
+    def step(self, count: int = 1):
+        # For loops that can afford a method call per step (or per `count` steps at once)
+        self.steps += count
+        if self.steps >= self.next_check():
+            self.check(self.steps)
+
+
+@dataclass(slots=True)
 class GroupState:
     str_idx: int = 0
     consumed: int = 0
@@ -17,7 +98,8 @@ class GroupState:
     is_done: bool = False
     has_match: bool = False
     group_iter: Iterator | None = None
-    debug_results: list = field(default_factory=list)
+    # Result of every sub node, only kept when matching with `trace=True`
+    debug_results: list | None = None
 
     IS_DONE: ClassVar[IS_DONE_TYPE] = True
 
@@ -33,14 +115,17 @@ class Node(Protocol):
     def __iter__(self) -> Iterator[Node]: ...
     def is_group_match(self, state: GroupState) -> bool: ...
     def is_match(
-        self, source_string: str, source_string_len: int, index: int
+        self, source_string: Text, source_string_len: int, index: int
     ) -> bool: ...
+    def match_len(
+        self, source_string: Text, source_string_len: int, index: int
+    ) -> int: ...
     def process_sub_node_result(
         self, state: GroupState, result_of_node_match: bool, consumed: int
     ): ...
 
 
-@dataclass
+@dataclass(slots=True)
 class GroupNode(ABC):
     sub_nodes: MutableSequence[Node]
     is_group: bool = True
@@ -51,7 +136,10 @@ class GroupNode(ABC):
     def __iter__(self):
         return iter(self.sub_nodes)
 
-    def is_match(self, source_string: str, source_string_len: int, index: int):
+    def is_match(self, source_string: Text, source_string_len: int, index: int):
+        assert False
+
+    def match_len(self, source_string: Text, source_string_len: int, index: int):
         assert False
 
     def is_group_match(self, state: GroupState) -> bool:
@@ -65,12 +153,13 @@ class GroupNode(ABC):
     ): ...
 
 
-@dataclass
+@dataclass(slots=True)
 class GroupAnyNode(GroupNode):
     def process_sub_node_result(
         self, state: GroupState, result_of_node_match: bool, consumed: int
     ):
-        state.debug_results.append(result_of_node_match)
+        if state.debug_results is not None:
+            state.debug_results.append(result_of_node_match)
 
         if state.end_of_strig:
             state.consumed = 0
@@ -84,12 +173,13 @@ class GroupAnyNode(GroupNode):
             state.has_match = True
 
 
-@dataclass
+@dataclass(slots=True)
 class GroupAllNode(GroupNode):
     def process_sub_node_result(
         self, state: GroupState, result_of_node_match: bool, consumed: int
     ):
-        state.debug_results.append(result_of_node_match)
+        if state.debug_results is not None:
+            state.debug_results.append(result_of_node_match)
 
         if not result_of_node_match or state.end_of_strig:
             state.group_iter = None
@@ -101,7 +191,7 @@ class GroupAllNode(GroupNode):
         state.consumed += consumed
 
 
-@dataclass
+@dataclass(slots=True)
 class GroupGreadyRepeatNode(GroupNode):
     # TODO: (Hristo) Fix range matching for upper limit (if exceeded only stop, match is still true)
     # TODO: (Hristo) Fix Matching `.` any char is not lazy so consumes all
@@ -111,7 +201,8 @@ class GroupGreadyRepeatNode(GroupNode):
     def process_sub_node_result(
         self, state: GroupState, result_of_node_match: bool, consumed: int
     ):
-        state.debug_results.append(result_of_node_match)
+        if state.debug_results is not None:
+            state.debug_results.append(result_of_node_match)
 
         if not result_of_node_match or state.end_of_strig:
             if (
@@ -141,6 +232,8 @@ class GroupGreadyRepeatNode(GroupNode):
 
 
 class BaseNode:
+    __slots__ = ()
+
     is_group: bool
     str_idx: int = 0
     consumed: int = 0
@@ -162,33 +255,188 @@ class BaseNode:
         ...
 
 
-@dataclass
+@dataclass(slots=True)
 class MatchAnyNode(BaseNode):
     is_group: bool = False
 
-    def is_match(self, source_string: str, source_string_len: int, index: int):
+    def is_match(self, source_string: Text, source_string_len: int, index: int):
         return index < source_string_len
 
+    def match_len(self, source_string: Text, source_string_len: int, index: int):
+        return 1 if index < source_string_len else -1
 
-@dataclass
+
+@dataclass(slots=True)
 class MatchCharNode(BaseNode):
-    char: str
+    char: Char
     is_group: bool = False
 
-    def is_match(self, source_string: str, source_string_len: int, index: int):
+    def is_match(self, source_string: Text, source_string_len: int, index: int):
         return (index < source_string_len) and (source_string[index] == self.char)
 
+    def match_len(self, source_string: Text, source_string_len: int, index: int):
+        if index < source_string_len and source_string[index] == self.char:
+            return 1
+        return -1
+
+
+def code(char: Char) -> int:
+    return ord(char) if isinstance(char, str) else char
+
+
+def in_ranges(char: Char, ranges: tuple[tuple[Char, Char], ...]) -> bool:
+    # The ends of the ranges are `str` in trees made for `str` input and byte values
+    # otherwise, same as the chars of the texts they are checked against
+    if isinstance(char, str):
+        return any(
+            isinstance(first, str) and isinstance(last, str) and first <= char <= last
+            for first, last in ranges
+        )
+    return any(
+        isinstance(first, int) and isinstance(last, int) and first <= char <= last
+        for first, last in ranges
+    )
+
+
+def find(source_text: FindableText, literal: str | bytes, index: int) -> int:
+    # Literals are `str` in trees made for `str` input and bytes otherwise, so one of the
+    # other kind is never in the text
+    if isinstance(source_text, str):
+        return source_text.find(literal, index) if isinstance(literal, str) else -1
+    return -1 if isinstance(literal, str) else source_text.find(literal, index)
+
+
+@dataclass(slots=True)
+class MatchClassNode(BaseNode):
+    # Matches any one of `chars` in one set lookup, ranges too big to keep as sets of chars
+    # (ex. `[一-龥]`) are kept as (first, last) pairs
+    chars: frozenset[Char]
+    ranges: tuple[tuple[Char, Char], ...] = ()
+    is_group: bool = False
+
+    def is_match(self, source_string: Text, source_string_len: int, index: int):
+        if index >= source_string_len:
+            return False
+
+        char = source_string[index]
+        return char in self.chars or in_ranges(char, self.ranges)
+
+    def match_len(self, source_string: Text, source_string_len: int, index: int):
+        return 1 if self.is_match(source_string, source_string_len, index) else -1
+
+
+@dataclass(slots=True)
+class MatchLiteralNode(BaseNode):
+    # Run of chars in a row matched with one `str.startswith`, made by the optimizer out
+    # of the char node per char the parser makes
+    literal: str | bytes
+    is_group: bool = False
+
+    def is_match(self, source_string: Text, source_string_len: int, index: int):
+        literal = self.literal
+        if isinstance(source_string, str) and isinstance(literal, str):
+            return source_string.startswith(literal, index)
+        return source_string[index : index + len(literal)] == literal
+
+    def match_len(self, source_string: Text, source_string_len: int, index: int):
+        literal = self.literal
+        if isinstance(source_string, str) and isinstance(literal, str):
+            matched = source_string.startswith(literal, index)
+        else:
+            matched = source_string[index : index + len(literal)] == literal
+        return len(literal) if matched else -1
+
+
+@dataclass(slots=True)
+class MatchBytesLiteralNode(MatchLiteralNode):
+    # Literal of a tree made for bytes like input, compared as a slice since `mmap` and
+    # `memoryview` have no `startswith`
+    def is_match(self, source_string: Text, source_string_len: int, index: int):
+        return source_string[index : index + len(self.literal)] == self.literal
+
+    def match_len(self, source_string: Text, source_string_len: int, index: int):
+        literal_len = len(self.literal)
+        if source_string[index : index + literal_len] == self.literal:
+            return literal_len
+        return -1
+
+
+@dataclass(slots=True)
+class MatchScanNode(BaseNode):
+    # Repeat of a single char node (ex. `.*`, `[a-z]+`) made by the optimizer, stepping
+    # over the chars in one loop instead of a group frame and a step per repeat. Same as
+    # the repeat it replaces, going over `max_repeat_count` chars is no match.
+    char_node: MatchCharNode | MatchClassNode | MatchAnyNode
+    min_repeat_count: int | None = None
+    max_repeat_count: int | None = None
+    is_group: bool = False
+
+    def is_match(self, source_string: Text, source_string_len: int, index: int):
+        return self.match_len(source_string, source_string_len, index) >= 0
+
+    def match_len(self, source_string: Text, source_string_len: int, index: int):
+        # Seeing one char past the max is enough to know the repeat failed
+        stop_idx = source_string_len
+        if self.max_repeat_count is not None:
+            stop_idx = min(stop_idx, index + self.max_repeat_count + 1)
+
+        end_idx = index
+        char_node = self.char_node
+        match char_node:
+            case MatchAnyNode():
+                end_idx = stop_idx
+            case MatchCharNode():
+                char = char_node.char
+                while end_idx < stop_idx and source_string[end_idx] == char:
+                    end_idx += 1
+            case MatchClassNode(ranges=()):
+                chars = char_node.chars
+                while end_idx < stop_idx and source_string[end_idx] in chars:
+                    end_idx += 1
+            case _:
+                while end_idx < stop_idx and char_node.is_match(
+                    source_string, source_string_len, end_idx
+                ):
+                    end_idx += 1
+
+        count = end_idx - index
+        if (self.min_repeat_count is not None and count < self.min_repeat_count) or (
+            self.max_repeat_count is not None and count > self.max_repeat_count
+        ):
+            return -1
+        return count
+
 
 def match(
-    start_node: GroupNode, source_string: str, start_index: int = 0
+    start_node: GroupNode,
+    source_string: Text,
+    start_index: int = 0,
+    budget: Budget | None = None,
+    trace: bool = False,
 ) -> tuple[bool, int]:
     SOURCE_STRING_LEN = len(source_string)
     stack: list[tuple[Node, GroupState]] = [
-        (start_node, GroupState(str_idx=start_index, group_iter=iter(start_node)))
+        (
+            start_node,
+            GroupState(
+                str_idx=start_index,
+                group_iter=iter(start_node),
+                debug_results=[] if trace else None,
+            ),
+        )
     ]
 
+    # Steps are counted in a local, the budget is only called when the count gets to `check_at`
+    steps = budget.steps if budget is not None else 0
+    check_at = budget.next_check() if budget is not None else sys.maxsize
+
     result = (False, -1)
     while stack:
+        steps += 1
+        if steps >= check_at:
+            assert budget is not None
+            check_at = budget.check(steps)
+
         curr_group, curr_state = stack[-1]
         curr_node = next(curr_state)
 
@@ -199,6 +447,12 @@ def match(
             curr_state.end_of_strig = (
                 curr_state.str_idx + curr_state.consumed
             ) < SOURCE_STRING_LEN
+            if trace:
+                logger.debug(
+                    f"Group {curr_group} at {curr_state.str_idx} matched={has_group_match} "
+                    f"consumed={curr_state.consumed}, sub node results "
+                    f"{curr_state.debug_results}"
+                )
 
             if stack:
                 parent_group, parent_state = stack[-1]
@@ -213,16 +467,127 @@ def match(
             new_group_state = GroupState(
                 str_idx=curr_state.str_idx + curr_state.consumed,
                 group_iter=iter(curr_node),
+                debug_results=[] if trace else None,
             )
             stack.append((curr_node, new_group_state))
         else:
-            has_node_match = curr_node.is_match(
+            consumed = curr_node.match_len(
                 source_string,
                 SOURCE_STRING_LEN,
                 curr_state.str_idx + curr_state.consumed,
             )
-            curr_group.process_sub_node_result(curr_state, has_node_match, 1)
+            curr_group.process_sub_node_result(curr_state, consumed >= 0, consumed)
 
+    if budget is not None:
+        budget.steps = steps
+    return result
+
+
+@dataclass(slots=True)
+class NodeStats:
+    node: Node
+    visits: int = 0
+    successes: int = 0
+    # Only for group nodes, from entering the group to it being done (sub nodes included)
+    seconds: float = 0.0
+
+
+@dataclass
+class SearchStats:
+    searches: int = 0
+    start_positions: int = 0
+    matches: int = 0
+    steps: int = 0
+    frames_pushed: int = 0
+    search_seconds: float = 0.0
+    match_seconds: float = 0.0
+    # Keyed by `id(node)`, nodes compare by value so two equal nodes would share stats
+    node_stats: dict[int, NodeStats] = field(default_factory=dict)
+
+    def of_node(self, node: Node) -> NodeStats:
+        if (node_stats := self.node_stats.get(id(node))) is None:
+            node_stats = self.node_stats[id(node)] = NodeStats(node=node)
+        return node_stats
+
+
+def match_profiled(
+    start_node: GroupNode,
+    source_string: Text,
+    start_index: int,
+    stats: SearchStats,
+    budget: Budget | None = None,
+) -> tuple[bool, int]:
+    # Same as `match`, but recording what every step does in `stats`. Kept as its own
+    # function so `match` does not have to check if it is profiling on every step.
+    match_started = time.perf_counter()
+    SOURCE_STRING_LEN = len(source_string)
+    stack: list[tuple[Node, GroupState]] = [
+        (start_node, GroupState(str_idx=start_index, group_iter=iter(start_node)))
+    ]
+    stack_started = [match_started]
+    stats.of_node(start_node).visits += 1
+    stats.frames_pushed += 1
+
+    steps = budget.steps if budget is not None else 0
+    check_at = budget.next_check() if budget is not None else sys.maxsize
+    start_steps = steps
+
+    result = (False, -1)
+    while stack:
+        steps += 1
+        if steps >= check_at:
+            assert budget is not None
+            stats.steps += steps - start_steps
+            start_steps = steps
+            check_at = budget.check(steps)
+
+        curr_group, curr_state = stack[-1]
+        curr_node = next(curr_state)
+
+        if curr_node == GroupState.IS_DONE:
+            curr_state.is_done = True
+            stack.pop()
+            group_stats = stats.of_node(curr_group)
+            group_stats.seconds += time.perf_counter() - stack_started.pop()
+            has_group_match = curr_group.is_group_match(curr_state)
+            group_stats.successes += has_group_match
+            curr_state.end_of_strig = (
+                curr_state.str_idx + curr_state.consumed
+            ) < SOURCE_STRING_LEN
+
+            if stack:
+                parent_group, parent_state = stack[-1]
+                parent_group.process_sub_node_result(
+                    parent_state, has_group_match, curr_state.consumed
+                )
+            else:
+                result = (has_group_match, curr_state.consumed)
+                break
+
+        elif curr_node.is_group:
+            new_group_state = GroupState(
+                str_idx=curr_state.str_idx + curr_state.consumed,
+                group_iter=iter(curr_node),
+            )
+            stack.append((curr_node, new_group_state))
+            stack_started.append(time.perf_counter())
+            stats.of_node(curr_node).visits += 1
+            stats.frames_pushed += 1
+        else:
+            consumed = curr_node.match_len(
+                source_string,
+                SOURCE_STRING_LEN,
+                curr_state.str_idx + curr_state.consumed,
+            )
+            node_stats = stats.of_node(curr_node)
+            node_stats.visits += 1
+            node_stats.successes += consumed >= 0
+            curr_group.process_sub_node_result(curr_state, consumed >= 0, consumed)
+
+    if budget is not None:
+        budget.steps = steps
+    stats.steps += steps - start_steps
+    stats.match_seconds += time.perf_counter() - match_started
     return result
 
 
@@ -258,7 +623,7 @@ def test_greedy_repeat_zero_or_many(string: str):
     return match(match_exp, string)
 
 
-def test_greedy_repeat_one_or_many(string: str):
+def test_greedy_repeat_one_or_many(string: str, trace: bool = False):
     match_exp = GroupGreadyRepeatNode(
         min_repeat_count=1,
         sub_nodes=[
@@ -270,7 +635,7 @@ def test_greedy_repeat_one_or_many(string: str):
             )
         ],
     )
-    return match(match_exp, string)
+    return match(match_exp, string, trace=trace)
 
 
 def check(
@@ -284,6 +649,50 @@ def check(
     )
 
 
+def check_budget(
+    budget: Budget, string: str, expect_exceeded: bool, match_count: int = 1
+):
+    # `match_count` matches share the budget, same as the start indexes of a search
+    match_exp = GroupGreadyRepeatNode(
+        sub_nodes=[
+            GroupAllNode(sub_nodes=[MatchCharNode(char="a"), MatchCharNode(char="b")])
+        ]
+    )
+    try:
+        for _ in range(match_count):
+            match(match_exp, string, budget=budget)
+        is_exceeded = False
+    except BudgetExceededError as e:
+        logger.debug(f"{e} (steps={e.steps})")
+        is_exceeded = True
+
+    logger.debug(
+        f"Budget exceeded {is_exceeded}=={expect_exceeded}, after {budget.steps} steps "
+        f"<<<<<<<<<<< {'SUCCESS' if is_exceeded == expect_exceeded else 'FAIL'}"
+    )
+
+
+def check_profiled(string: str):
+    a_node, b_node = MatchCharNode(char="a"), MatchCharNode(char="b")
+    ab_node = GroupAllNode(sub_nodes=[a_node, b_node])
+    match_exp = GroupGreadyRepeatNode(min_repeat_count=1, sub_nodes=[ab_node])
+
+    stats = SearchStats()
+    result = match_profiled(match_exp, string, 0, stats)
+    passed = (
+        result == match(match_exp, string)
+        and stats.of_node(ab_node).visits == 3
+        and stats.of_node(ab_node).successes == 2
+        and stats.of_node(a_node).visits == 3
+        and stats.of_node(b_node).successes == 2
+        and stats.frames_pushed == 4
+    )
+    logger.debug(
+        f"Profiled match {result} for {string}, {stats.steps} steps, "
+        f"{stats.frames_pushed} frames <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
 def test_all():
     import log
 
@@ -306,6 +715,18 @@ def test_all():
     check(test_greedy_repeat_one_or_many("ababab-suffix"), True, 6)
     check(test_greedy_repeat_one_or_many("baabab-suffix"), False, 0)
 
+    logger.debug("Test tracing sub node results:")
+    check(test_greedy_repeat_one_or_many("abab-suffix", trace=True), True, 4)
+
+    logger.debug("Test profiled match:")
+    check_profiled("abab-suffix")
+
+    logger.debug("Test step budget:")
+    check_budget(Budget(max_steps=1_000), "ab" * 1_000, expect_exceeded=True)
+    check_budget(Budget(max_steps=1_000), "ab" * 10, expect_exceeded=False)
+    check_budget(Budget(timeout=0.0), "ab" * 1_000, expect_exceeded=True)
+    check_budget(Budget(timeout=0.0), "ab", expect_exceeded=True, match_count=5_000)
+
 
 if __name__ == "__main__":
     test_all()
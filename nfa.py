@@ -0,0 +1,502 @@
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+import logging
+from string import Template
+import sys
+from typing import Callable, Iterable, Iterator, Literal
+
+import matcher
+
+logger = logging.getLogger(__name__)
+
+# (index of the step the thread is on, how many times that step has repeated so far)
+Thread = tuple[int, int]
+Span = tuple[int, int]
+# Repeat count of the thread standing for all threads in a counted step (see `CounterSet`)
+COUNTED = -1
+ACCEPTED_TYPE = Literal[True]
+ACCEPTED: ACCEPTED_TYPE = True
+
+
+class NFAErrors(Enum):
+    UNSUPPORTED_NODE = Template(
+        "NFA engine can not compile `${node}`, only nodes matching a single char can be used here!"
+    )
+    UNSUPPORTED_REPEAT = Template(
+        "NFA engine can only repeat a single char, `.` or `[...]` node, got `${node}`!"
+    )
+
+
+class UnsupportedPatternError(ValueError):
+    def __init__(self, message: str, reason: str = "not supported"):
+        super().__init__(message)
+        # A few words on why, for `explain()` (see `planner.py`)
+        self.reason = reason
+
+
+@dataclass(frozen=True, slots=True)
+class CharSet:
+    chars: frozenset[matcher.Char] = frozenset()
+    ranges: tuple[tuple[matcher.Char, matcher.Char], ...] = ()
+    any_char: bool = False
+
+    def __contains__(self, char: matcher.Char) -> bool:
+        return (
+            self.any_char or char in self.chars or matcher.in_ranges(char, self.ranges)
+        )
+
+    def __or__(self, other: CharSet) -> CharSet:
+        return CharSet(
+            chars=self.chars | other.chars,
+            ranges=self.ranges + other.ranges,
+            any_char=self.any_char or other.any_char,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Step:
+    char_set: CharSet
+    is_repeat: bool = False
+    min_repeat_count: int = 0
+    max_repeat_count: int | None = None
+    # Repeats with an upper limit or a minimum over 1, their threads are kept in a
+    # `CounterSet` instead of one thread per repeat count
+    is_counted: bool = False
+
+
+@dataclass(slots=True)
+class CounterSet:
+    # Every thread in a counted repeat step, as the index it entered the step at (its repeat
+    # count is how many chars it matched since) and the index it started at. The threads
+    # all step over the same chars, so the set moves on as a whole in one step no matter
+    # the counts, and a thread that entered earlier also started earlier, so once the
+    # repeat ends the oldest thread still under the maximum is the one that goes on.
+    #
+    # Kept as runs of [first entry index, first start index, length] where both go up by
+    # one per thread, so a new thread at every index (ex. `a{1,1000000}` over a long run
+    # of `a`s) is still a single run.
+    runs: deque[list[int]] = field(default_factory=deque)
+
+    def add(self, entry_idx: int, start_idx: int, bounded: bool):
+        if not self.runs:
+            self.runs.append([entry_idx, start_idx, 1])
+            return
+        if not bounded:
+            # Without a maximum the oldest thread never drops out, so it always goes on
+            return
+
+        last_run = self.runs[-1]
+        first_entry_idx, first_start_idx, length = last_run
+        if entry_idx < first_entry_idx + length:
+            # Same entry index as the newest thread, that one started earlier
+            return
+        if (
+            entry_idx == first_entry_idx + length
+            and start_idx == first_start_idx + length
+        ):
+            last_run[2] += 1
+        else:
+            self.runs.append([entry_idx, start_idx, 1])
+
+    def expire(self, min_entry_idx: int):
+        # Drops the threads that entered before `min_entry_idx`, they went over the maximum
+        runs = self.runs
+        while runs:
+            first_run = runs[0]
+            first_entry_idx, _, length = first_run
+            if first_entry_idx >= min_entry_idx:
+                return
+            if first_entry_idx + length <= min_entry_idx:
+                runs.popleft()
+                continue
+            dropped = min_entry_idx - first_entry_idx
+            first_run[0] += dropped
+            first_run[1] += dropped
+            first_run[2] -= dropped
+            return
+
+    @property
+    def oldest(self) -> tuple[int, int]:
+        # (entry index, start index)
+        first_entry_idx, first_start_idx, _ = self.runs[0]
+        return first_entry_idx, first_start_idx
+
+    @property
+    def newest_entry_idx(self) -> int:
+        first_entry_idx, _, length = self.runs[-1]
+        return first_entry_idx + length - 1
+
+
+def start_of(thread_data: int | CounterSet) -> int:
+    # Start index a thread (or a counter set, its oldest thread) would match from
+    return thread_data.oldest[1] if isinstance(thread_data, CounterSet) else thread_data
+
+
+# A step no char can ever satisfy, used for groups the tree matcher never matches (ex. empty)
+NEVER_STEP = Step(char_set=CharSet())
+
+
+@dataclass(frozen=True, slots=True)
+class Program:
+    steps: tuple[Step, ...]
+    start: Thread = (0, 0)
+
+
+def _char_set(node: matcher.Node) -> CharSet | None:
+    match node:
+        case matcher.MatchCharNode():
+            return CharSet(chars=frozenset((node.char,)))
+        case matcher.MatchClassNode():
+            return CharSet(chars=node.chars, ranges=node.ranges)
+        case matcher.MatchAnyNode():
+            return CharSet(any_char=True)
+        case matcher.GroupAnyNode():
+            char_set = CharSet()
+            for sub_node in node.sub_nodes:
+                if (sub_char_set := _char_set(sub_node)) is None:
+                    return None
+                char_set |= sub_char_set
+            return char_set
+        case matcher.GroupAllNode(sub_nodes=[sub_node]):
+            return _char_set(sub_node)
+
+    return None
+
+
+def _compile_steps(node: matcher.Node) -> list[Step]:
+    match node:
+        case matcher.GroupAllNode(sub_nodes=[]):
+            return [NEVER_STEP]
+        case matcher.GroupAllNode():
+            return [step for sub_node in node for step in _compile_steps(sub_node)]
+        case matcher.MatchLiteralNode():
+            return [
+                Step(char_set=CharSet(chars=frozenset((char,))))
+                for char in node.literal
+            ]
+        case (
+            matcher.GroupGreadyRepeatNode(sub_nodes=[sub_node])
+            | matcher.MatchScanNode(char_node=sub_node)
+        ) if (char_set := _char_set(sub_node)) is not None:
+            min_repeat_count = node.min_repeat_count or 0
+            is_counted = node.max_repeat_count is not None or min_repeat_count > 1
+            return [
+                Step(
+                    char_set=char_set,
+                    is_repeat=True,
+                    min_repeat_count=min_repeat_count,
+                    max_repeat_count=node.max_repeat_count,
+                    is_counted=is_counted,
+                )
+            ]
+        case matcher.GroupGreadyRepeatNode():
+            raise UnsupportedPatternError(
+                NFAErrors.UNSUPPORTED_REPEAT.value.substitute(node=node),
+                reason="repeats more than a single char",
+            )
+
+    if (char_set := _char_set(node)) is None:
+        raise UnsupportedPatternError(
+            NFAErrors.UNSUPPORTED_NODE.value.substitute(node=node),
+            reason="has a group that is not a single char",
+        )
+    return [Step(char_set=char_set)]
+
+
+def compile(match_exp: matcher.Node) -> Program:
+    program = Program(steps=tuple(_compile_steps(match_exp)))
+    logger.debug(f"Complied NFA program: {program}")
+    return program
+
+
+def step(
+    program: Program, thread: Thread, char: matcher.Char | None
+) -> Thread | ACCEPTED_TYPE | None:
+    # Advances a thread over `char` (None at the end of the text). The tree matcher never
+    # backtracks, so a repeat only hands over to the next step once `char` does not fit it.
+    steps = program.steps
+    step_idx, repeat_count = thread
+    while step_idx < len(steps):
+        curr_step = steps[step_idx]
+        if char is not None and char in curr_step.char_set:
+            if not curr_step.is_repeat:
+                return (step_idx + 1, 0)
+
+            repeat_count += 1
+            if curr_step.max_repeat_count is None:
+                # Past the minimum, unbounded repeats behave the same for any count
+                return (step_idx, min(repeat_count, curr_step.min_repeat_count))
+            if repeat_count > curr_step.max_repeat_count:
+                return None
+            return (step_idx, repeat_count)
+
+        if not curr_step.is_repeat or repeat_count < curr_step.min_repeat_count:
+            return None
+        step_idx, repeat_count = step_idx + 1, 0
+
+    return ACCEPTED
+
+
+def add_thread(
+    program: Program,
+    threads: dict[Thread, int | CounterSet],
+    thread: Thread,
+    start_idx: int,
+    idx: int,
+):
+    # Adds a thread that stepped over the char at `idx`, threads in a counted step join its
+    # counter set (made at this point of the start order if there is none yet)
+    step_idx, repeat_count = thread
+    curr_step = program.steps[step_idx] if step_idx < len(program.steps) else None
+    if curr_step is None or not curr_step.is_counted:
+        threads.setdefault(thread, start_idx)
+        return
+
+    counter_set = threads.get((step_idx, COUNTED))
+    if counter_set is None:
+        counter_set = threads[(step_idx, COUNTED)] = CounterSet()
+    assert isinstance(counter_set, CounterSet)
+    counter_set.add(
+        idx + 1 - repeat_count,
+        start_idx,
+        bounded=curr_step.max_repeat_count is not None,
+    )
+
+
+def advance(
+    program: Program,
+    threads: dict[Thread, int | CounterSet],
+    idx: int,
+    char: matcher.Char | None,
+    pending: Span | None,
+) -> tuple[dict[Thread, int | CounterSet], Span | None]:
+    # Steps every thread (mapped to the index it started at) over the char at `idx`.
+    # Threads sit in start order, so when two land on the same state the earlier start is
+    # kept, and once one accepts, every thread queued after it started later and is dropped.
+    if pending is None and char is not None:
+        threads.setdefault(program.start, idx)
+
+    next_threads: dict[Thread, int | CounterSet] = {}
+    for thread, thread_data in threads.items():
+        if isinstance(thread_data, CounterSet):
+            step_idx = thread[0]
+            curr_step = program.steps[step_idx]
+            if char is not None and char in curr_step.char_set:
+                if curr_step.max_repeat_count is not None:
+                    thread_data.expire(idx + 1 - curr_step.max_repeat_count)
+                if thread_data.runs:
+                    next_threads[thread] = thread_data
+                continue
+
+            # The repeat ended, it goes on as its oldest thread (if that one has enough)
+            entry_idx, start_idx = thread_data.oldest
+            thread = (step_idx, idx - entry_idx)
+        else:
+            start_idx = thread_data
+
+        result = step(program, thread, char)
+        if result is None:
+            continue
+        if result is ACCEPTED:
+            pending = (start_idx, idx)
+            break
+        add_thread(program, next_threads, result, start_idx, idx)
+
+    return next_threads, pending
+
+
+def leftmost_match(
+    program: Program,
+    source_text: matcher.Text,
+    scan_from: int,
+    next_candidate: Callable[[int], int] | None = None,
+    budget: matcher.Budget | None = None,
+) -> Span | None:
+    # Runs a thread for every start index in one pass, every char stepped over is a step
+    # of the budget
+    text_len = len(source_text)
+    threads: dict[Thread, int | CounterSet] = {}
+    pending: Span | None = None
+    steps = budget.steps if budget is not None else 0
+    check_at = budget.next_check() if budget is not None else sys.maxsize
+
+    idx = scan_from
+    while idx <= text_len:
+        steps += 1
+        if steps >= check_at:
+            assert budget is not None
+            check_at = budget.check(steps)
+
+        # Nothing is running, so skip right to the next index a match could start at
+        if (
+            not threads
+            and pending is None
+            and next_candidate is not None
+            and (idx := next_candidate(idx)) < 0
+        ):
+            break
+
+        char = source_text[idx] if idx < text_len else None
+        threads, pending = advance(program, threads, idx, char, pending)
+
+        if pending is not None and not threads:
+            break
+        idx += 1
+
+    if budget is not None:
+        budget.steps = steps
+    return pending
+
+
+def _next_scan_from(span: Span) -> int:
+    start_idx, end_idx = span
+    return end_idx if end_idx > start_idx else start_idx + 1
+
+
+def search(
+    program: Program,
+    source_text: matcher.Text,
+    next_candidate: Callable[[int], int] | None = None,
+    budget: matcher.Budget | None = None,
+) -> Iterator[Span]:
+    scan_from = 0
+    while scan_from < len(source_text):
+        span = leftmost_match(program, source_text, scan_from, next_candidate, budget)
+        if span is None:
+            return
+
+        yield span
+        scan_from = _next_scan_from(span)
+
+
+@dataclass
+class Scanner:
+    # Same search as `search`, but over text that arrives in chunks. Threads only hold
+    # the index they started at, so the text is only kept from where the search could have
+    # to restart, which is the end of a match still waiting on earlier threads to fail.
+    program: Program
+    # Text not yet needed any more is dropped, `buffer[0]` is at `buffer_start` in the stream
+    # (bytes when searching bytes, with a program compiled from a bytes match tree)
+    buffer: str | bytes = ""
+    buffer_start: int = 0
+    # Index in the stream of the next char to step the threads over
+    idx: int = 0
+    threads: dict[Thread, int | CounterSet] = field(default_factory=dict)
+    pending: Span | None = None
+
+    def feed(self, chunk: str | bytes) -> Iterator[Span]:
+        # Chunks are of the same kind as the buffer they go on
+        buffer = self.buffer
+        if isinstance(buffer, str):
+            assert isinstance(chunk, str)
+            self.buffer = buffer + chunk
+        else:
+            assert isinstance(chunk, bytes)
+            self.buffer = buffer + chunk
+        yield from self._scan(at_end=False)
+
+        keep_from = self.idx if self.pending is None else _next_scan_from(self.pending)
+        self.buffer = self.buffer[keep_from - self.buffer_start :]
+        self.buffer_start = keep_from
+
+    def close(self) -> Iterator[Span]:
+        yield from self._scan(at_end=True)
+        self.buffer = self.buffer[:0]
+        self.buffer_start = self.idx
+
+    def _scan(self, at_end: bool) -> Iterator[Span]:
+        program, buffer, buffer_start = self.program, self.buffer, self.buffer_start
+        buffer_end = buffer_start + len(buffer)
+        threads, pending = self.threads, self.pending
+
+        idx = self.idx
+        while idx < buffer_end or (at_end and idx == buffer_end):
+            char = buffer[idx - buffer_start] if idx < buffer_end else None
+            threads, pending = advance(program, threads, idx, char, pending)
+
+            if pending is not None and not threads:
+                yield pending
+                idx = _next_scan_from(pending)
+                pending = None
+                continue
+            idx += 1
+
+        self.idx = min(idx, buffer_end)
+        self.threads, self.pending = threads, pending
+
+
+def search_stream(program: Program, chunks: Iterable[str]) -> Iterator[Span]:
+    scanner = Scanner(program=program)
+    for chunk in chunks:
+        yield from scanner.feed(chunk)
+    yield from scanner.close()
+
+
+def check(regex: str, source_text: str, expected_spans: list[Span] | None):
+    import parser
+
+    try:
+        spans = list(search(compile(parser.parse(regex, 0)), source_text))
+    except UnsupportedPatternError:
+        passed = expected_spans is None
+        logger.debug(
+            f"UnsupportedPatternError for {regex} is correctly issued? "
+            f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+        )
+        return
+
+    passed = spans == expected_spans
+    logger.debug(
+        f"NFA spans {spans} == {expected_spans} for {regex} in {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_stream(regex: str, chunks: list[str], max_buffer_len: int):
+    import parser
+
+    program = compile(parser.parse(regex, 0))
+    scanner = Scanner(program=program)
+    spans = []
+    buffer_len = 0
+    for chunk in chunks:
+        spans.extend(scanner.feed(chunk))
+        buffer_len = max(buffer_len, len(scanner.buffer))
+    spans.extend(scanner.close())
+    expected_spans = list(search(program, "".join(chunks)))
+
+    passed = spans == expected_spans and buffer_len <= max_buffer_len
+    logger.debug(
+        f"NFA stream spans {spans} == {expected_spans} for {regex} in {chunks}, kept at most "
+        f"{buffer_len} chars <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("[BCP]at", "1BatCatPatRat", [(1, 4), (4, 7), (7, 10)])
+    check(".[BCP]at", "1BatCatPatRat", [(0, 4), (6, 10)])
+    check("e{2,4}", "$$OleeeOlaOleOleOla", [(4, 7)])
+    # Going over the upper limit fails the whole repeat, same as the tree matcher
+    check("e{2,4}", "eeeee", [(1, 5)])
+    check("ab*c", "xacabbbbcabbd", [(1, 3), (3, 9)])
+    check("a*", "baab", [(0, 0), (1, 3), (3, 3)])
+    # Greedy repeats never give chars back
+    check("a.*b", "a__b__", [])
+    check("[a+]", "aaa", None)
+    # Threads in a counted repeat are one counter set, however big the range
+    check("a{1,1000000}c", "a" * 5000 + "c", [(0, 5001)])
+    check("a{2,3}c", "aaaac_aac_ac", [(1, 5), (6, 9)])
+    check("xa{2000000,}", "xaaa", [])
+    check("b[ab]{1,9999999999}", "ab" * 3000, [(1, 6000)])
+
+    # Matches crossing chunk boundaries, only the tail a restart needs is kept
+    check_stream("[BCP]at", ["1Ba", "tCatP", "a", "tRat"], max_buffer_len=0)
+    check_stream("ab*c", ["xacabb", "bbcab", "bd"], max_buffer_len=0)
+    check_stream("e{2,4}", ["ee", "e", "ee"], max_buffer_len=0)
+    check_stream("a*", ["b", "a", "ab", ""], max_buffer_len=0)
+    check_stream(".[BCP]at", ["1BatC", "atPatRat"], max_buffer_len=0)
@@ -0,0 +1,313 @@
+from dataclasses import fields, is_dataclass
+import logging
+
+import matcher
+
+logger = logging.getLogger(__name__)
+
+CHAR_LEAF_NODES = (matcher.MatchCharNode, matcher.MatchClassNode, matcher.MatchAnyNode)
+
+
+def fold_char_classes(node: matcher.Node) -> matcher.Node:
+    # Turns `[...]` groups holding only single char nodes into one class node, so matching
+    # them is a set lookup instead of a group with a node per char
+    match node:
+        case matcher.GroupAnyNode():
+            sub_nodes = [fold_char_classes(sub_node) for sub_node in node]
+            if not all(isinstance(sub_node, CHAR_LEAF_NODES) for sub_node in sub_nodes):
+                return matcher.GroupAnyNode(sub_nodes=sub_nodes)
+            if any(
+                isinstance(sub_node, matcher.MatchAnyNode) for sub_node in sub_nodes
+            ):
+                return matcher.MatchAnyNode()
+
+            chars: set[matcher.Char] = set()
+            ranges: list[tuple[matcher.Char, matcher.Char]] = []
+            for sub_node in sub_nodes:
+                match sub_node:
+                    case matcher.MatchCharNode():
+                        chars.add(sub_node.char)
+                    case matcher.MatchClassNode():
+                        chars |= sub_node.chars
+                        ranges.extend(sub_node.ranges)
+
+            if len(chars) == 1 and not ranges:
+                return matcher.MatchCharNode(char=chars.pop())
+            return matcher.MatchClassNode(chars=frozenset(chars), ranges=tuple(ranges))
+        case matcher.GroupAllNode():
+            return matcher.GroupAllNode(
+                sub_nodes=[fold_char_classes(sub_node) for sub_node in node]
+            )
+        case matcher.GroupGreadyRepeatNode():
+            return matcher.GroupGreadyRepeatNode(
+                sub_nodes=[fold_char_classes(sub_node) for sub_node in node],
+                min_repeat_count=node.min_repeat_count,
+                max_repeat_count=node.max_repeat_count,
+            )
+
+    return node
+
+
+def flatten_groups(node: matcher.Node) -> matcher.Node:
+    # Splices groups into a parent group of the same type (ex. the `GroupAllNode`s of
+    # nested sequences) and replaces groups of a single sub node with that node, so
+    # matching pushes fewer group frames. Empty groups never match, so are kept as is.
+    match node:
+        case matcher.GroupAllNode() | matcher.GroupAnyNode():
+            group_type = type(node)
+            sub_nodes: list[matcher.Node] = []
+            for sub_node in node:
+                sub_node = flatten_groups(sub_node)
+                if (
+                    isinstance(sub_node, matcher.GroupNode)
+                    and type(sub_node) is group_type
+                    and sub_node.sub_nodes
+                ):
+                    sub_nodes.extend(sub_node.sub_nodes)
+                else:
+                    sub_nodes.append(sub_node)
+
+            if len(sub_nodes) == 1:
+                return sub_nodes[0]
+            return group_type(sub_nodes=sub_nodes)
+        case matcher.GroupGreadyRepeatNode():
+            return matcher.GroupGreadyRepeatNode(
+                sub_nodes=[flatten_groups(sub_node) for sub_node in node],
+                min_repeat_count=node.min_repeat_count,
+                max_repeat_count=node.max_repeat_count,
+            )
+
+    return node
+
+
+def fuse_literals(node: matcher.Node) -> matcher.Node:
+    # Turns chars in a row into one literal node matched with `str.startswith`. Only in
+    # sequences, the sub nodes of `[...]` are alternatives and every sub node of a
+    # repeat counts as a repeat.
+    match node:
+        case matcher.GroupAllNode():
+            sub_nodes: list[matcher.Node] = []
+            chars: list[str] = []
+            for sub_node in [*node, None]:
+                # Only `str` chars are joined, trees made for bytes have bytes literals
+                if isinstance(sub_node, matcher.MatchCharNode) and isinstance(
+                    sub_node.char, str
+                ):
+                    chars.append(sub_node.char)
+                    continue
+
+                if len(chars) > 1:
+                    sub_nodes.append(matcher.MatchLiteralNode(literal="".join(chars)))
+                elif chars:
+                    sub_nodes.append(matcher.MatchCharNode(char=chars[0]))
+                chars = []
+                if sub_node is not None:
+                    sub_nodes.append(fuse_literals(sub_node))
+            return matcher.GroupAllNode(sub_nodes=sub_nodes)
+        case matcher.GroupAnyNode():
+            return matcher.GroupAnyNode(
+                sub_nodes=[fuse_literals(sub_node) for sub_node in node]
+            )
+        case matcher.GroupGreadyRepeatNode():
+            return matcher.GroupGreadyRepeatNode(
+                sub_nodes=[fuse_literals(sub_node) for sub_node in node],
+                min_repeat_count=node.min_repeat_count,
+                max_repeat_count=node.max_repeat_count,
+            )
+
+    return node
+
+
+def fuse_scans(node: matcher.Node) -> matcher.Node:
+    # Turns repeats of a single char node (ex. `.*`, `[a-z]+`) into scan nodes, that
+    # step over all the chars they match in one tight loop
+    match node:
+        case matcher.GroupGreadyRepeatNode(sub_nodes=[sub_node]) if isinstance(
+            sub_node, CHAR_LEAF_NODES
+        ):
+            return matcher.MatchScanNode(
+                char_node=sub_node,
+                min_repeat_count=node.min_repeat_count,
+                max_repeat_count=node.max_repeat_count,
+            )
+        case matcher.GroupAllNode() | matcher.GroupAnyNode():
+            return type(node)(sub_nodes=[fuse_scans(sub_node) for sub_node in node])
+        case matcher.GroupGreadyRepeatNode():
+            return matcher.GroupGreadyRepeatNode(
+                sub_nodes=[fuse_scans(sub_node) for sub_node in node],
+                min_repeat_count=node.min_repeat_count,
+                max_repeat_count=node.max_repeat_count,
+            )
+
+    return node
+
+
+def dump(node: matcher.Node, depth: int = 0) -> str:
+    # One line per node, with sub nodes indented under their group
+    node_fields = ", ".join(
+        f"{node_field.name}={getattr(node, node_field.name)!r}"
+        for node_field in (fields(node) if is_dataclass(node) else ())
+        if node_field.name not in ("sub_nodes", "is_group")
+    )
+    lines = [f"{'    ' * depth}{type(node).__name__}({node_fields})"]
+    if isinstance(node, matcher.GroupNode):
+        lines.extend(dump(sub_node, depth + 1) for sub_node in node)
+    return "\n".join(lines)
+
+
+def optimize(match_exp: matcher.GroupNode) -> matcher.GroupNode:
+    optimized_exp = fuse_scans(
+        fuse_literals(flatten_groups(fold_char_classes(match_exp)))
+    )
+    # The root has to stay a sequence, even if it was flattened down to one node
+    if not isinstance(optimized_exp, matcher.GroupAllNode):
+        optimized_exp = matcher.GroupAllNode(sub_nodes=[optimized_exp])
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            f"Match tree before optimizing:\n{dump(match_exp)}\n"
+            f"Optimized match tree:\n{dump(optimized_exp)}",
+            extra={"markup": False},
+        )
+    return optimized_exp
+
+
+def check(regex: str, expected_match_exp: matcher.Node):
+    import parser
+
+    match_exp = optimize(parser.parse(regex, 0))
+    passed = match_exp == expected_match_exp
+    logger.debug(
+        f"Optimized exp {match_exp} == {expected_match_exp} for {regex} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+if __name__ == "__main__":
+    import log
+    import parser
+
+    log.setup()
+
+    from matcher import (
+        GroupAllNode,
+        GroupAnyNode,
+        GroupGreadyRepeatNode,
+        MatchAnyNode,
+        MatchCharNode,
+        MatchClassNode,
+        MatchLiteralNode,
+        MatchScanNode,
+    )
+
+    check(
+        "[QAD]*",
+        GroupAllNode(
+            sub_nodes=[MatchScanNode(char_node=MatchClassNode(chars=frozenset("QAD")))]
+        ),
+    )
+    check(
+        "[a-z0-9_]",
+        GroupAllNode(
+            sub_nodes=[
+                MatchClassNode(chars=frozenset("abcdefghijklmnopqrstuvwxyz0123456789_"))
+            ]
+        ),
+    )
+    check("[[ab]c]", GroupAllNode(sub_nodes=[MatchClassNode(chars=frozenset("abc"))]))
+    check("[b]", GroupAllNode(sub_nodes=[MatchCharNode(char="b")]))
+    check("[a.]", GroupAllNode(sub_nodes=[MatchAnyNode()]))
+    check("[]", GroupAllNode(sub_nodes=[MatchClassNode(chars=frozenset())]))
+    # Repeats have to keep being tried in order, so are not folded
+    check(
+        "[a+b]",
+        GroupAllNode(
+            sub_nodes=[
+                GroupAnyNode(
+                    sub_nodes=[
+                        MatchScanNode(
+                            char_node=MatchCharNode(char="a"), min_repeat_count=1
+                        ),
+                        MatchCharNode(char="b"),
+                    ]
+                )
+            ]
+        ),
+    )
+    check(
+        "ERROR.*took [0-9]+ms",
+        GroupAllNode(
+            sub_nodes=[
+                MatchLiteralNode(literal="ERROR"),
+                MatchScanNode(char_node=MatchAnyNode()),
+                MatchLiteralNode(literal="took "),
+                MatchScanNode(
+                    char_node=MatchClassNode(chars=frozenset("0123456789")),
+                    min_repeat_count=1,
+                ),
+                MatchLiteralNode(literal="ms"),
+            ]
+        ),
+    )
+    # The single char groups are collapsed first, so the chars around them join up
+    check(
+        "a[b]c{2,3}",
+        GroupAllNode(
+            sub_nodes=[
+                MatchLiteralNode(literal="ab"),
+                MatchScanNode(
+                    char_node=MatchCharNode(char="c"),
+                    min_repeat_count=2,
+                    max_repeat_count=3,
+                ),
+            ]
+        ),
+    )
+    # Every sub node of a repeat is a repeat, so the chars in it are not joined up
+    check(
+        "[ab+]*",
+        GroupAllNode(
+            sub_nodes=[
+                GroupGreadyRepeatNode(
+                    sub_nodes=[
+                        GroupAnyNode(
+                            sub_nodes=[
+                                MatchCharNode(char="a"),
+                                MatchScanNode(
+                                    char_node=MatchCharNode(char="b"),
+                                    min_repeat_count=1,
+                                ),
+                            ]
+                        )
+                    ]
+                )
+            ]
+        ),
+    )
+    check(
+        "[[a+][b+]]",
+        GroupAllNode(
+            sub_nodes=[
+                GroupAnyNode(
+                    sub_nodes=[
+                        MatchScanNode(
+                            char_node=MatchCharNode(char="a"), min_repeat_count=1
+                        ),
+                        MatchScanNode(
+                            char_node=MatchCharNode(char="b"), min_repeat_count=1
+                        ),
+                    ]
+                )
+            ]
+        ),
+    )
+    check(
+        "x[]",
+        GroupAllNode(
+            sub_nodes=[MatchCharNode(char="x"), MatchClassNode(chars=frozenset())]
+        ),
+    )
+
+    logger.debug(
+        f"Match tree dump of `ab[cd]+[x.]`:\n{dump(parser.parse('ab[cd]+[x.]', 0))}",
+        extra={"markup": False},
+    )
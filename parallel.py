@@ -0,0 +1,211 @@
+import bisect
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import itertools
+import logging
+import os
+from typing import TYPE_CHECKING, Iterable, Iterator, Protocol, Sequence
+
+if TYPE_CHECKING:
+    # Only for the annotations, `regex` imports this module
+    import regex
+
+logger = logging.getLogger(__name__)
+
+Span = tuple[int, int]
+
+# Texts shorter than this are searched in the calling process, starting workers costs more
+MIN_SHARD_SIZE = 64 * 1024
+# More shards than workers, so a worker that got an easy shard can pick up another one
+SHARDS_PER_WORKER = 4
+# Texts `search_many` searches per batch, each batch is one round trip to a worker
+DEFAULT_CHUNKSIZE = 1024
+# Batches waiting on every worker, so texts are only read from the iterable as needed
+BATCHES_PER_WORKER = 2
+
+
+class ShardSearcher(Protocol):
+    def finditer(
+        self,
+        source_text: str,
+        engine: regex.Engine | None = None,
+        start_idx: int = 0,
+        stop_idx: int | None = None,
+    ) -> Iterator[Span]: ...
+
+    def search_batch(
+        self,
+        source_texts: Sequence[str],
+        mode: regex.SearchManyMode,
+        engine: regex.Engine | None = None,
+    ) -> list: ...
+
+
+# Set once per worker process by `_init_worker`, so the matcher and text are sent to every
+# worker once instead of with every shard
+_worker_searcher: ShardSearcher | None = None
+_worker_source_text = ""
+_worker_engine: regex.Engine | None = None
+
+
+def _init_worker(
+    searcher: ShardSearcher, source_text: str, engine: regex.Engine | None
+):
+    global _worker_searcher, _worker_source_text, _worker_engine
+    _worker_searcher = searcher
+    _worker_source_text = source_text
+    _worker_engine = engine
+
+
+def _search_shard(shard: Span) -> list[Span]:
+    assert _worker_searcher is not None
+    start_idx, stop_idx = shard
+    return [
+        (match[0], match[1])
+        for match in _worker_searcher.finditer(
+            _worker_source_text, _worker_engine, start_idx=start_idx, stop_idx=stop_idx
+        )
+    ]
+
+
+def _search_batch(source_texts: Sequence[str], mode: regex.SearchManyMode) -> list:
+    assert _worker_searcher is not None
+    return _worker_searcher.search_batch(source_texts, mode, _worker_engine)
+
+
+def _next_scan_from(span: Span) -> int:
+    start_idx, end_idx = span
+    return end_idx if end_idx > start_idx else start_idx + 1
+
+
+def split(text_len: int, shard_count: int) -> list[Span]:
+    shard_size = max(-(-text_len // shard_count), 1)
+    return [
+        (start_idx, min(start_idx + shard_size, text_len))
+        for start_idx in range(0, text_len, shard_size)
+    ]
+
+
+def _resync_idx(shard_spans: list[Span], shard_starts: list[int], idx: int) -> int:
+    # First index from `idx` on that the shard's own search also tried a match at, which
+    # is every index except the ones inside of a match it found
+    span_idx = bisect.bisect_left(shard_starts, idx) - 1
+    if span_idx >= 0:
+        start_idx, end_idx = shard_spans[span_idx]
+        if start_idx < idx < end_idx:
+            return end_idx
+    return idx
+
+
+def reconcile(
+    searcher: ShardSearcher,
+    source_text: str,
+    engine: regex.Engine | None,
+    shard_results: Iterator[tuple[Span, list[Span]]],
+) -> Iterator[Span]:
+    # Every shard was searched as if a match could start at its first index. That is only
+    # true if no match from an earlier shard runs over into it, otherwise the search goes on
+    # from where that match ended, until it lands on an index the shard's search also tried
+    # a match at. Matching only depends on the text from the index on, so from there both
+    # find the same matches.
+    scan_from = 0
+    for (shard_start, shard_stop), shard_spans in shard_results:
+        if scan_from <= shard_start:
+            yield from shard_spans
+            if shard_spans:
+                scan_from = _next_scan_from(shard_spans[-1])
+            continue
+
+        shard_starts = [start_idx for start_idx, _ in shard_spans]
+        rescanned = searcher.finditer(
+            source_text, engine, start_idx=scan_from, stop_idx=shard_stop
+        )
+        while scan_from < shard_stop:
+            resync_idx = _resync_idx(shard_spans, shard_starts, scan_from)
+            span = next(rescanned, None)
+            if span is None or span[0] >= resync_idx:
+                if resync_idx < shard_stop:
+                    logger.debug(
+                        f"Shard {shard_start}:{shard_stop} resynced at {resync_idx}"
+                    )
+                    resynced_spans = shard_spans[
+                        bisect.bisect_left(shard_starts, resync_idx) :
+                    ]
+                    yield from resynced_spans
+                    if resynced_spans:
+                        scan_from = _next_scan_from(resynced_spans[-1])
+                break
+
+            yield (span[0], span[1])
+            scan_from = _next_scan_from(span)
+
+
+def search(
+    searcher: ShardSearcher,
+    source_text: str,
+    workers: int | None = None,
+    engine: regex.Engine | None = None,
+    min_shard_size: int = MIN_SHARD_SIZE,
+) -> Iterator[Span]:
+    workers = workers or os.cpu_count() or 1
+    shard_count = min(
+        workers * SHARDS_PER_WORKER, len(source_text) // max(min_shard_size, 1)
+    )
+    if workers < 2 or shard_count < 2:
+        logger.debug("Text too short to search in parallel, searching in one process")
+        for match in searcher.finditer(source_text, engine):
+            yield (match[0], match[1])
+        return
+
+    shards = split(len(source_text), shard_count)
+    logger.debug(f"Searching {len(shards)} shards with {workers} workers")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(searcher, source_text, engine),
+    ) as pool:
+        yield from reconcile(
+            searcher, source_text, engine, zip(shards, pool.map(_search_shard, shards))
+        )
+
+
+def search_many(
+    searcher: ShardSearcher,
+    source_texts: Iterable[str],
+    mode: regex.SearchManyMode,
+    engine: regex.Engine | None = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    workers: int | None = 1,
+) -> Iterator:
+    workers = workers or os.cpu_count() or 1
+    batches = itertools.batched(source_texts, max(chunksize, 1))
+    batch_offsets = itertools.count(0, max(chunksize, 1))
+
+    def batch_results(batch_offset: int, results: list) -> list:
+        # Indexes are found per batch, so have to be moved to where the batch starts
+        if mode == "indices":
+            return [batch_offset + text_idx for text_idx in results]
+        return results
+
+    if workers < 2:
+        for batch_offset, batch in zip(batch_offsets, batches):
+            yield from batch_results(
+                batch_offset, searcher.search_batch(batch, mode, engine)
+            )
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(searcher, "", engine),
+    ) as pool:
+        in_flight: deque[tuple[int, Future]] = deque()
+        for batch_offset, batch in zip(batch_offsets, batches):
+            in_flight.append((batch_offset, pool.submit(_search_batch, batch, mode)))
+            if len(in_flight) >= workers * BATCHES_PER_WORKER:
+                batch_offset, future = in_flight.popleft()
+                yield from batch_results(batch_offset, future.result())
+
+        while in_flight:
+            batch_offset, future = in_flight.popleft()
+            yield from batch_results(batch_offset, future.result())
@@ -18,6 +18,13 @@ class ParserErrors(Enum):
     PARSE_RANGE_INVALID = Template(
         "SyntaxError: Repeat range invalid, min=${min_} > max=${max_}!"
     )
+    PARSE_CHAR_RANGE_INVALID = Template(
+        "SyntaxError: Char range invalid, `${first}` comes after `${last}`!"
+    )
+
+
+# Char ranges up to this size are turned into sets of chars, bigger ones are compared against
+MAX_EXPANDED_CHAR_RANGE = 256
 
 
 class ParsedRange(NamedTuple):
@@ -79,6 +86,21 @@ def parse_range(regex: str, str_idx: int, str_len: int):
     return ParsedRange(min_=min_repeat_count, max_=max_repeat_count, str_idx=idx)
 
 
+def parse_char_range(first: str, last: str) -> matcher.MatchClassNode:
+    if first > last:
+        raise SyntaxError(
+            ParserErrors.PARSE_CHAR_RANGE_INVALID.value.substitute(
+                first=first, last=last
+            )
+        )
+
+    if ord(last) - ord(first) < MAX_EXPANDED_CHAR_RANGE:
+        return matcher.MatchClassNode(
+            chars=frozenset(chr(code) for code in range(ord(first), ord(last) + 1))
+        )
+    return matcher.MatchClassNode(chars=frozenset(), ranges=((first, last),))
+
+
 def add_range_wrapped(
     curr_group_node: matcher.GroupNode, min_: int | None = None, max_: int | None = None
 ):
@@ -119,6 +141,21 @@ def parse(regex: str, str_idx: int) -> matcher.GroupNode:
                 str_idx = parsed_range.str_idx
             case ".":
                 curr_group_node.sub_nodes.append(matcher.MatchAnyNode())
+            case "-" if (
+                isinstance(curr_group_node, matcher.GroupAnyNode)
+                and curr_group_node.sub_nodes
+                and isinstance(curr_group_node.sub_nodes[-1], matcher.MatchCharNode)
+                and str_idx + 1 < regex_len
+                and regex[str_idx + 1] != "]"
+            ):
+                # Char range inside of `[...]` (ex. `[a-z]`), a `-` anywhere else is just a char
+                first_char_node = curr_group_node.sub_nodes.pop()
+                assert isinstance(first_char_node, matcher.MatchCharNode)
+                assert isinstance(first_char_node.char, str)
+                curr_group_node.sub_nodes.append(
+                    parse_char_range(first_char_node.char, regex[str_idx + 1])
+                )
+                str_idx += 1
             case _:
                 curr_group_node.sub_nodes.append(matcher.MatchCharNode(char=curr_char))
 
@@ -157,6 +194,7 @@ if __name__ == "__main__":
         GroupAnyNode,
         GroupAllNode,
         MatchCharNode,
+        MatchClassNode,
         GroupGreadyRepeatNode,
     )
 
@@ -299,3 +337,46 @@ if __name__ == "__main__":
 
     # Should error with - SyntaxError: Repeat range invalid, min=10 > max=9!
     check("a{10,      9      }", None)
+
+    check(
+        "[a-c0-2_-]+",
+        GroupAllNode(
+            sub_nodes=[
+                GroupGreadyRepeatNode(
+                    sub_nodes=[
+                        GroupAnyNode(
+                            sub_nodes=[
+                                MatchClassNode(chars=frozenset("abc")),
+                                MatchClassNode(chars=frozenset("012")),
+                                MatchCharNode(char="_"),
+                                MatchCharNode(char="-"),
+                            ],
+                            is_group=True,
+                        )
+                    ],
+                    is_group=True,
+                    min_repeat_count=1,
+                    max_repeat_count=None,
+                )
+            ],
+            is_group=True,
+        ),
+    )
+
+    check(
+        "[一-龥]",
+        GroupAllNode(
+            sub_nodes=[
+                GroupAnyNode(
+                    sub_nodes=[
+                        MatchClassNode(chars=frozenset(), ranges=(("一", "龥"),))
+                    ],
+                    is_group=True,
+                )
+            ],
+            is_group=True,
+        ),
+    )
+
+    # Should error with - SyntaxError: Char range invalid, `z` comes after `a`!
+    check("[z-a]", None)
@@ -0,0 +1,203 @@
+from enum import Enum
+from functools import cached_property
+import logging
+from string import Template
+from typing import Callable, Iterator, Literal, NamedTuple, Protocol
+
+import codegen
+import matcher
+import nfa
+import prefilter
+import shiftand
+
+logger = logging.getLogger(__name__)
+
+# Engines the planner picks from (see `regex.Engine`)
+PlannedEngine = Literal["tree", "codegen", "shiftand", "literal"]
+
+
+class PlannerErrors(Enum):
+    NOT_A_LITERAL = Template(
+        "Literal engine can only search for plain text (ex. `ERROR`), got `${match_exp}`!"
+    )
+
+
+class Plannable(Protocol):
+    # The matcher being planned for, building an engine (ex. `generated`) is how the
+    # planner finds out if it can run the pattern, and keeps it built for searching
+    match_exp: matcher.GroupNode
+    profile: bool
+
+    @cached_property
+    def search_prefilter(self) -> prefilter.Prefilter | None: ...
+
+    @cached_property
+    def literal(self) -> str | bytes: ...
+
+    @cached_property
+    def shiftand_program(self) -> shiftand.Program: ...
+
+    @cached_property
+    def generated(self) -> codegen.GeneratedMatcher: ...
+
+
+class Plan(NamedTuple):
+    engine: PlannedEngine
+    prefilter: prefilter.Prefilter | None
+    # Why the engine was picked (and the ones before it were not), in the order checked
+    reasons: tuple[str, ...]
+
+    def describe(self) -> str:
+        lines = [f"Engine: {self.engine}"]
+        lines.extend(f"- {reason}" for reason in self.reasons)
+        lines.append(f"Prefilter: {describe_prefilter(self.prefilter)}")
+        return "\n".join(lines)
+
+
+def literal(match_exp: matcher.GroupNode) -> str | bytes:
+    # The text a pattern of only plain chars matches
+    match match_exp:
+        case matcher.GroupAllNode(sub_nodes=[matcher.MatchLiteralNode() as node]):
+            return node.literal
+        case matcher.GroupAllNode(sub_nodes=[matcher.MatchCharNode(char=char)]):
+            return char if isinstance(char, str) else bytes((char,))
+
+    raise nfa.UnsupportedPatternError(
+        PlannerErrors.NOT_A_LITERAL.value.substitute(match_exp=match_exp)
+    )
+
+
+def search_literal(
+    literal: str | bytes,
+    source_text: matcher.FindableText,
+    next_candidate: Callable[[int], int] | None = None,
+    budget: matcher.Budget | None = None,
+) -> Iterator[nfa.Span]:
+    # Every match is found with one `find`, `next_candidate` only moves the search on
+    # (ex. to a start index) and is asked once per match. Every char `find` steps over
+    # (to the end of the match, or of the text) is a step of the budget.
+    literal_len = len(literal)
+    idx = 0
+    while True:
+        if next_candidate is not None and (idx := next_candidate(idx)) < 0:
+            return
+        found_idx = matcher.find(source_text, literal, idx)
+        if budget is not None:
+            end_idx = len(source_text) if found_idx < 0 else found_idx + literal_len
+            budget.step(max(end_idx - idx, 1))
+        if found_idx < 0:
+            return
+        yield (found_idx, found_idx + literal_len)
+        idx = found_idx + literal_len
+
+
+def describe_prefilter(search_prefilter: prefilter.Prefilter | None) -> str:
+    if search_prefilter is None:
+        return "none, every index of the text is tried"
+
+    parts = []
+    if search_prefilter.prefix:
+        parts.append(f"jumps to the prefix {search_prefilter.prefix!r} with find")
+    if search_prefilter.inner:
+        max_offset = search_prefilter.inner_max_offset
+        parts.append(
+            f"skips text without {search_prefilter.inner!r} "
+            f"({search_prefilter.inner_min_offset} to "
+            f"{'any' if max_offset is None else max_offset} chars into a match)"
+        )
+    if search_prefilter.first_chars:
+        first_chars = sorted(search_prefilter.first_chars, key=str)
+        parts.append(f"jumps to one of the first chars {first_chars}")
+    return ", ".join(parts)
+
+
+def plan(plannable: Plannable) -> Plan:
+    # Tried from the most to the least specialized engine, the first one that can run the
+    # pattern is used. Whatever the engine, the prefilter skips ahead between candidates.
+    search_prefilter = plannable.search_prefilter
+    reasons: list[str] = []
+    if plannable.profile:
+        reasons.append(
+            "profiling, only the tree engine counts the visits of every node"
+        )
+        return Plan("tree", search_prefilter, tuple(reasons))
+
+    try:
+        found_literal = plannable.literal
+        reasons.append(f"plain literal {found_literal!r}, every match is one find")
+        return Plan("literal", None, tuple(reasons))
+    except nfa.UnsupportedPatternError:
+        reasons.append("not a plain literal")
+
+    if search_prefilter and search_prefilter.has_literal:
+        # Between candidates found by a literal there is little left to scan, the
+        # generated code tries a candidate fastest
+        reasons.append("has a literal to find candidates with")
+    else:
+        try:
+            program = plannable.shiftand_program
+            reasons.append(
+                f"always matches {program.width} chars, all positions are stepped "
+                "at once (Shift-And)"
+            )
+            return Plan("shiftand", search_prefilter, tuple(reasons))
+        except nfa.UnsupportedPatternError as e:
+            reasons.append(f"not for the Shift-And engine, {e.reason}")
+
+    try:
+        generated = plannable.generated
+        reasons.append(
+            f"general pattern, run as {len(generated.source.splitlines())} lines of "
+            "generated Python code"
+        )
+        return Plan("codegen", search_prefilter, tuple(reasons))
+    except (RecursionError, SyntaxError) as e:
+        # Ex. groups nested deeper than Python can compile
+        reasons.append(f"code generation failed ({type(e).__name__}: {e})")
+
+    reasons.append("walks the match tree, the reference matcher")
+    return Plan("tree", search_prefilter, tuple(reasons))
+
+
+def check(
+    regex: str,
+    expected_engine: str,
+    profile: bool = False,
+    expected_reason: str | None = None,
+):
+    import regex as regex_
+
+    expression_matcher = regex_.compile(regex, profile=profile)
+    found_plan = expression_matcher.plan
+    passed = found_plan.engine == expected_engine and (
+        expected_reason is None or expected_reason in found_plan.reasons
+    )
+    logger.debug(
+        f"Planned engine {found_plan.engine} == {expected_engine} for {regex}:\n"
+        f"{expression_matcher.explain()}\n<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("ERROR", "literal")
+    check("x", "literal")
+    check("ERROR.[0-9]+", "codegen")
+    check("id=[0-9]{5} ", "codegen")
+    check("[a-f0-9]{8}", "shiftand")
+    check(".[BCP]at", "codegen")
+    check(
+        "[a-z]+[0-9]",
+        "codegen",
+        expected_reason="not for the Shift-And engine, not fixed width",
+    )
+    check(
+        "[a-f0-9]{70}",
+        "codegen",
+        expected_reason="not for the Shift-And engine, longer than 64 chars",
+    )
+    check("[BCP]at", "tree", profile=True)
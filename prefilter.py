@@ -0,0 +1,379 @@
+from dataclasses import dataclass, field
+import logging
+
+import matcher
+
+logger = logging.getLogger(__name__)
+
+# First char sets up to this size are found with one `str.find` per char, bigger ones by
+# checking char by char
+MAX_FIND_FIRST_CHARS = 8
+
+
+@dataclass(frozen=True)
+class Prefilter:
+    # Every match starts with `prefix`, literals are bytes for trees made for bytes like
+    # input (see `binary.py`)
+    prefix: str | bytes = ""
+    # Every match contains `inner` starting between `inner_min_offset` and
+    # `inner_max_offset` (None for no upper limit) chars after the start of the match
+    inner: str | bytes = ""
+    inner_min_offset: int = 0
+    inner_max_offset: int | None = None
+    # Every match starts with one of these chars
+    first_chars: frozenset[matcher.Char] = frozenset()
+
+    @property
+    def has_literal(self) -> bool:
+        return bool(self.prefix or self.inner)
+
+    def finder(self, source_text: matcher.FindableText) -> CandidateFinder:
+        return CandidateFinder(prefilter=self, source_text=source_text)
+
+    def could_match(self, source_text: str) -> bool:
+        # Quick check for a whole text, before setting up a search of it
+        return (not self.prefix or matcher.find(source_text, self.prefix, 0) >= 0) and (
+            not self.inner or matcher.find(source_text, self.inner, 0) >= 0
+        )
+
+
+@dataclass
+class CandidateFinder:
+    # Finds the indexes a match could start at, asked for with indexes that never go
+    # down, so where every needle was last found can be reused instead of searching again
+    prefilter: Prefilter
+    source_text: matcher.FindableText
+    # Keyed by needle and if it is the inner literal, which is searched for at an offset
+    # so it can not share where it was found with a first char that is the same string
+    found_at: dict[tuple[str | bytes, bool], int] = field(default_factory=dict)
+
+    def find(self, needle: str | bytes, idx: int, is_inner: bool = False) -> int:
+        found_idx = self.found_at.get((needle, is_inner), -2)
+        if found_idx == -1 or found_idx >= idx:
+            return found_idx
+
+        found_idx = matcher.find(self.source_text, needle, idx)
+        self.found_at[(needle, is_inner)] = found_idx
+        return found_idx
+
+    def next_inner(self, idx: int) -> int:
+        prefilter = self.prefilter
+        inner_idx = self.find(
+            prefilter.inner, idx + prefilter.inner_min_offset, is_inner=True
+        )
+        if inner_idx < 0:
+            return -1
+        if prefilter.inner_max_offset is None:
+            return idx
+        return max(idx, inner_idx - prefilter.inner_max_offset)
+
+    def next_first_char(self, idx: int) -> int:
+        first_chars = self.prefilter.first_chars
+        if len(first_chars) <= MAX_FIND_FIRST_CHARS:
+            found = [
+                char_idx
+                for char in first_chars
+                if (
+                    char_idx := self.find(
+                        char if isinstance(char, str) else bytes((char,)), idx
+                    )
+                )
+                >= 0
+            ]
+            return min(found, default=-1)
+
+        source_text = self.source_text
+        for char_idx in range(idx, len(source_text)):
+            if source_text[char_idx] in first_chars:
+                return char_idx
+        return -1
+
+    def __call__(self, idx: int) -> int:
+        # Smallest index >= `idx` a match could start at, -1 if there is none left
+        prefilter = self.prefilter
+        while idx < len(self.source_text):
+            candidate_idx = idx
+            if prefilter.inner:
+                candidate_idx = self.next_inner(candidate_idx)
+            if candidate_idx >= 0 and prefilter.prefix:
+                candidate_idx = self.find(prefilter.prefix, candidate_idx)
+            elif candidate_idx >= 0 and prefilter.first_chars:
+                candidate_idx = self.next_first_char(candidate_idx)
+
+            if candidate_idx < 0:
+                return -1
+            if candidate_idx == idx:
+                return idx
+            idx = candidate_idx
+
+        return -1
+
+
+def _sequence(node: matcher.Node) -> list[matcher.Node]:
+    match node:
+        case matcher.GroupAllNode():
+            return [item for sub_node in node for item in _sequence(sub_node)]
+        case matcher.MatchLiteralNode():
+            return [matcher.MatchCharNode(char=char) for char in node.literal]
+    return [node]
+
+
+def _literal_char(node: matcher.Node) -> matcher.Char | None:
+    match node:
+        case matcher.MatchCharNode():
+            return node.char
+        case (
+            matcher.GroupAnyNode(sub_nodes=[sub_node])
+            | matcher.GroupAllNode(sub_nodes=[sub_node])
+        ):
+            return _literal_char(sub_node)
+
+    return None
+
+
+def _join(chars: list[matcher.Char]) -> str | bytes:
+    # The chars of a tree are all `str` or all byte values
+    if chars and isinstance(chars[0], int):
+        return bytes(char for char in chars if isinstance(char, int))
+    return "".join(char for char in chars if isinstance(char, str))
+
+
+def _add_widths(width_a: int | None, width_b: int | None) -> int | None:
+    return None if width_a is None or width_b is None else width_a + width_b
+
+
+def width(node: matcher.Node) -> tuple[int, int | None]:
+    # Least and most chars the node can consume when it matches (None for no upper limit)
+    match node:
+        case (
+            matcher.MatchCharNode() | matcher.MatchClassNode() | matcher.MatchAnyNode()
+        ):
+            return 1, 1
+        case matcher.MatchLiteralNode():
+            return len(node.literal), len(node.literal)
+        case matcher.MatchScanNode():
+            return node.min_repeat_count or 0, node.max_repeat_count
+        case matcher.GroupAllNode():
+            min_width, max_width = 0, 0
+            for sub_node in node:
+                sub_min_width, sub_max_width = width(sub_node)
+                min_width += sub_min_width
+                max_width = _add_widths(max_width, sub_max_width)
+            return min_width, max_width
+        case matcher.GroupAnyNode(sub_nodes=[_, *_]):
+            widths = [width(sub_node) for sub_node in node]
+            max_widths = [sub_max_width for _, sub_max_width in widths]
+            return min(sub_min_width for sub_min_width, _ in widths), (
+                None if None in max_widths else max(filter(None, max_widths), default=0)
+            )
+        case matcher.GroupGreadyRepeatNode(sub_nodes=[sub_node]):
+            sub_min_width, sub_max_width = width(sub_node)
+            if sub_max_width is None or node.max_repeat_count is None:
+                return sub_min_width * (node.min_repeat_count or 0), None
+            return (
+                sub_min_width * (node.min_repeat_count or 0),
+                sub_max_width * node.max_repeat_count,
+            )
+
+    return 0, None
+
+
+def first_chars(node: matcher.Node) -> frozenset[matcher.Char] | None:
+    # Chars every match of the node starts with, None if that could be any char or if the
+    # node can match without consuming anything
+    match node:
+        case matcher.MatchCharNode():
+            return frozenset((node.char,))
+        case matcher.MatchLiteralNode():
+            return frozenset(node.literal[:1])
+        case matcher.MatchClassNode(ranges=()):
+            return node.chars
+        case matcher.MatchAnyNode() | matcher.MatchClassNode():
+            return None
+        case matcher.GroupAnyNode(sub_nodes=[_, *_]):
+            chars: frozenset[matcher.Char] = frozenset()
+            for sub_node in node:
+                if (sub_chars := first_chars(sub_node)) is None:
+                    return None
+                chars |= sub_chars
+            return chars
+        case matcher.GroupAllNode():
+            chars = frozenset()
+            for sub_node in node:
+                if width(sub_node)[0] > 0:
+                    sub_chars = first_chars(sub_node)
+                    return None if sub_chars is None else chars | sub_chars
+                # A repeat that can match nothing lets the next node start the match
+                if (sub_chars := repeat_first_chars(sub_node)) is None:
+                    return None
+                chars |= sub_chars
+            return None
+        case (
+            matcher.GroupGreadyRepeatNode(sub_nodes=[sub_node])
+            | matcher.MatchScanNode(char_node=sub_node)
+        ) if node.min_repeat_count:
+            return first_chars(sub_node)
+
+    return None
+
+
+def repeat_first_chars(node: matcher.Node) -> frozenset[matcher.Char] | None:
+    match node:
+        case matcher.GroupGreadyRepeatNode(sub_nodes=[sub_node]) if (
+            width(sub_node)[0] > 0
+        ):
+            return first_chars(sub_node)
+        case matcher.MatchScanNode():
+            return first_chars(node.char_node)
+
+    return None
+
+
+def _literal_runs(
+    match_exp: matcher.Node,
+) -> list[tuple[str | bytes, int, int | None]]:
+    # Runs of literal chars, with the least and most offset they can be at in a match
+    sequence = _sequence(match_exp)
+    literals: list[tuple[str | bytes, int, int | None]] = []
+    literal_chars: list[matcher.Char] = []
+    min_offset, max_offset = 0, 0
+    for node in [*sequence, None]:
+        if node is not None and (char := _literal_char(node)) is not None:
+            literal_chars.append(char)
+            continue
+
+        if literal_chars:
+            literal = _join(literal_chars)
+            literals.append((literal, min_offset, max_offset))
+            min_offset += len(literal)
+            max_offset = _add_widths(max_offset, len(literal))
+            literal_chars = []
+
+        if node is not None:
+            node_min_width, node_max_width = width(node)
+            min_offset += node_min_width
+            max_offset = _add_widths(max_offset, node_max_width)
+
+    return literals
+
+
+def required_literals(match_exp: matcher.Node) -> list[str | bytes]:
+    # Every literal (of more than one char) that all matches contain, ex. to skip the
+    # patterns of a set that can not match a text (see `regex.RegexSet`)
+    return list(
+        dict.fromkeys(
+            literal for literal, _, _ in _literal_runs(match_exp) if len(literal) > 1
+        )
+    )
+
+
+def analyze(match_exp: matcher.Node) -> Prefilter | None:
+    literals = _literal_runs(match_exp)
+    prefix: str | bytes = ""
+    if literals and literals[0][1] == 0 and literals[0][2] == 0:
+        prefix = literals.pop(0)[0]
+
+    inner, inner_min_offset, inner_max_offset = max(
+        literals, key=lambda literal: len(literal[0]), default=("", 0, None)
+    )
+    if len(inner) <= len(prefix):
+        inner, inner_min_offset, inner_max_offset = "", 0, None
+
+    chars = frozenset() if prefix else (first_chars(match_exp) or frozenset())
+
+    if not (prefix or inner or chars):
+        logger.debug(f"No prefilter for match expression: {match_exp}")
+        return None
+
+    prefilter = Prefilter(
+        prefix=prefix,
+        inner=inner,
+        inner_min_offset=inner_min_offset,
+        inner_max_offset=inner_max_offset,
+        first_chars=chars,
+    )
+    logger.debug(f"Prefilter for match expression: {prefilter}")
+    return prefilter
+
+
+def check(regex: str, expected_prefilter: Prefilter | None):
+    import parser
+
+    prefilter = analyze(parser.parse(regex, 0))
+    passed = prefilter == expected_prefilter
+    logger.debug(
+        f"Prefilter {prefilter} == {expected_prefilter} for {regex} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_required(regex: str, expected_literals: list[str]):
+    import optimizer
+    import parser
+
+    literals = required_literals(optimizer.optimize(parser.parse(regex, 0)))
+    passed = literals == expected_literals
+    logger.debug(
+        f"Required literals {literals} == {expected_literals} for {regex} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+def check_candidates(regex: str, source_text: str, expected_candidates: list[int]):
+    import parser
+
+    prefilter = analyze(parser.parse(regex, 0))
+    assert prefilter is not None
+
+    next_candidate = prefilter.finder(source_text)
+    candidates = []
+    idx = next_candidate(0)
+    while idx >= 0:
+        candidates.append(idx)
+        idx = next_candidate(idx + 1)
+
+    passed = candidates == expected_candidates
+    logger.debug(
+        f"Candidates {candidates} == {expected_candidates} for {regex} in {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("ERROR.[0123456789]+", Prefilter(prefix="ERROR"))
+    check(
+        "[0-9]+ms",
+        Prefilter(inner="ms", inner_min_offset=1, first_chars=frozenset("0123456789")),
+    )
+    check(
+        ".[BCP]at",
+        Prefilter(inner="at", inner_min_offset=2, inner_max_offset=2),
+    )
+    check(
+        "[BCP]at",
+        Prefilter(
+            inner="at",
+            inner_min_offset=1,
+            inner_max_offset=1,
+            first_chars=frozenset("BCP"),
+        ),
+    )
+    check(
+        "x*y.*ERROR",
+        Prefilter(inner="ERROR", inner_min_offset=1, first_chars=frozenset("xy")),
+    )
+    check("a*", None)
+    check(".*", None)
+
+    check_candidates("ERROR.[0123456789]+", "INFO 1\nERROR 2\nERROR 3", [7, 15])
+    check_candidates("[BCP]at", "1BatCatPatRat", [1, 4, 7])
+    check_candidates(".[BCP]at", "1BatCatPatRat", [0, 3, 6, 9])
+
+    check_required("ERROR.*took [0-9]+ms", ["ERROR", "took ", "ms"])
+    check_required("ab[c]d[xy]ab", ["abcd", "ab"])
+    check_required("a.b[ab]", [])
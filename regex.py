@@ -1,63 +1,1112 @@
-from dataclasses import dataclass
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from functools import cached_property
+import itertools
 import logging
-from typing import NamedTuple, Sequence
+import mmap
+import os
+import threading
+import time
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Mapping,
+    NamedTuple,
+    Sequence,
+    TextIO,
+    get_args,
+)
+import ahocorasick
+import aio
+import binary
+import bundle
+import codegen
+import dfa
+import incremental
 import matcher
+import nfa
+import optimizer
+import parallel
 import parser
+import planner
+import prefilter
+import shiftand
+import vectorized
 
 logger = logging.getLogger(__name__)
 
+# `auto` leaves it to the planner (see `planner.py`, and `ExpressionMatcher.explain()`)
+Engine = Literal["auto", "tree", "nfa", "dfa", "codegen", "shiftand", "literal"]
+ENGINES: tuple[Engine, ...] = get_args(Engine)
+# Bytes like input is searched byte by byte, with matches at byte offsets (see `binary.py`)
+Text = matcher.Text
+# What `search_many` yields, a list of matches for every text, the indexes of the texts
+# with any match, or if there is any match for every text
+SearchManyMode = Literal["matches", "indices", "any"]
+
+DEFAULT_CACHE_SIZE = 512
+
+# How many chars `search_stream` reads at a time from file like objects
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# How many bytes of a memory mapped file are searched at a time, the pages before each
+# window are handed back to the OS once searched, so resident memory stays around this
+FILE_WINDOW_SIZE = 16 * 1024 * 1024
+
+# Longer matches are cut short in debug logs, long repeats can match millions of chars
+MAX_LOGGED_MATCH_LEN = 200
+
 
 class Match(NamedTuple):
     start_idx: int
     end_idx: int
 
 
-def _search(match_exp: matcher.GroupNode, source_text: str) -> Sequence[Match]:
-    matches = []
+class SetMatch(NamedTuple):
+    pattern_id: int
+    start_idx: int
+    end_idx: int
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    max_size: int
+    size: int
+
+
+def _finditer(
+    match_exp: matcher.GroupNode,
+    source_text: Text,
+    next_candidate: Callable[[int], int] | None = None,
+    budget: matcher.Budget | None = None,
+    stats: matcher.SearchStats | None = None,
+) -> Iterator[Match]:
+    # Checked once, so the per index logging does not build strings nobody will see
+    is_debug = logger.isEnabledFor(logging.DEBUG)
 
     idx = 0
     while idx < len(source_text):
-        is_match, consumed = matcher.match(match_exp, source_text, idx)
+        # Jump right over the indexes the prefilter already ruled out
+        if next_candidate is not None and (idx := next_candidate(idx)) < 0:
+            break
+
+        if stats is None:
+            is_match, consumed = matcher.match(match_exp, source_text, idx, budget)
+        else:
+            stats.start_positions += 1
+            is_match, consumed = matcher.match_profiled(
+                match_exp, source_text, idx, stats, budget
+            )
         if is_match:
-            logger.debug(f"Text match: {source_text[idx : idx + consumed]}")
-            matches.append(Match(start_idx=idx, end_idx=idx + consumed))
-            idx += consumed
+            if is_debug:
+                logged_len = min(consumed, MAX_LOGGED_MATCH_LEN)
+                logger.debug(f"Text match: {source_text[idx : idx + logged_len]}")
+            yield Match(start_idx=idx, end_idx=idx + consumed)
+            # Zero width matches (ex. `a*`) still have to move the search forward
+            idx += consumed or 1
         else:
-            logger.debug(f"No match:   {source_text[idx]}")
+            if is_debug:
+                logger.debug(f"No match:   {source_text[idx]}")
             idx += 1
 
-    return matches
+
+def _search(
+    match_exp: matcher.GroupNode,
+    source_text: Text,
+    next_candidate: Callable[[int], int] | None = None,
+    budget: matcher.Budget | None = None,
+) -> Sequence[Match]:
+    return list(_finditer(match_exp, source_text, next_candidate, budget))
+
+
+def _profiled(matches: Iterator[Match], stats: matcher.SearchStats) -> Iterator[Match]:
+    # Time is only counted while searching, not while the caller works on a match
+    stats.searches += 1
+    started = time.perf_counter()
+    for match in matches:
+        stats.matches += 1
+        stats.search_seconds += time.perf_counter() - started
+        yield match
+        started = time.perf_counter()
+    stats.search_seconds += time.perf_counter() - started
+
+
+def _to_matches(spans: Iterable[nfa.Span]) -> Iterator[Match]:
+    for start_idx, end_idx in spans:
+        yield Match(start_idx=start_idx, end_idx=end_idx)
+
+
+def _bounded_candidates(
+    next_candidate: Callable[[int], int] | None, start_idx: int, stop_idx: int
+) -> Callable[[int], int]:
+    def bounded_next_candidate(idx: int) -> int:
+        idx = max(idx, start_idx)
+        if next_candidate is not None and idx < stop_idx:
+            idx = next_candidate(idx)
+        return idx if 0 <= idx < stop_idx else -1
+
+    return bounded_next_candidate
+
+
+def _intersected_candidates(
+    next_candidate: Callable[[int], int], other_next_candidate: Callable[[int], int]
+) -> Callable[[int], int]:
+    # Indexes both find, each one skips ahead from where the other stopped
+    def intersected_next_candidate(idx: int) -> int:
+        while (candidate_idx := next_candidate(idx)) >= 0:
+            if (idx := other_next_candidate(candidate_idx)) in (candidate_idx, -1):
+                return idx
+        return -1
+
+    return intersected_next_candidate
+
+
+def _budget(max_steps: int | None, timeout: float | None) -> matcher.Budget | None:
+    if max_steps is None and timeout is None:
+        return None
+    return matcher.Budget(max_steps=max_steps, timeout=timeout)
 
 
 def _compile(regex: str) -> matcher.GroupNode:
-    match_exp = parser.parse(regex, 0)
-    logger.debug(f"Complied match expression: {match_exp}")
+    match_exp = optimizer.optimize(parser.parse(regex, 0))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Complied match expression: {match_exp}")
     return match_exp
 
 
 @dataclass
 class ExpressionMatcher:
     match_exp: matcher.GroupNode
+    engine: Engine = "tree"
+    dfa_cache_size: int = dfa.DEFAULT_CACHE_SIZE
+    # Record search statistics (see `stats()`), matching takes a slower path that keeps
+    # count of every step
+    profile: bool = False
+    # Made for bytes like input, chars in the match tree are byte values
+    is_bytes: bool = False
+    _stats: matcher.SearchStats = field(
+        default_factory=matcher.SearchStats, init=False, repr=False, compare=False
+    )
+
+    @cached_property
+    def search_prefilter(self) -> prefilter.Prefilter | None:
+        return prefilter.analyze(self.match_exp)
+
+    @cached_property
+    def nfa_program(self) -> nfa.Program:
+        return nfa.compile(self.match_exp)
+
+    @cached_property
+    def candidate_mask(self) -> vectorized.CandidateMask | None:
+        # Only with NumPy installed (the `numpy` extra), for patterns starting with a char
+        try:
+            return vectorized.compile(self.match_exp)
+        except nfa.UnsupportedPatternError:
+            return None
+
+    @cached_property
+    def lookback(self) -> incremental.Lookback:
+        return incremental.compile(self.match_exp)
+
+    @cached_property
+    def literal(self) -> str | bytes:
+        return planner.literal(self.match_exp)
+
+    @cached_property
+    def plan(self) -> planner.Plan:
+        return planner.plan(self)
+
+    def explain(self) -> str:
+        # The engine `auto` picks for this pattern, and why
+        explanation = self.plan.describe()
+        if self.candidate_mask is not None and vectorized.preferred(
+            self.search_prefilter
+        ):
+            explanation += (
+                f"\nTexts of {vectorized.MIN_TEXT_LEN}+ chars: candidates are masked by "
+                f"their first {self.candidate_mask.width} chars a block at a time (NumPy)"
+            )
+        return explanation
+
+    def _resolve_engine(self, engine: Engine | None) -> Engine:
+        engine = engine or self.engine
+        return self.plan.engine if engine == "auto" else engine
+
+    @cached_property
+    def shiftand_program(self) -> shiftand.Program:
+        return shiftand.compile(self.match_exp)
+
+    @cached_property
+    def lazy_dfa(self) -> dfa.LazyDFA:
+        return dfa.LazyDFA(self.nfa_program, cache_size=self.dfa_cache_size)
+
+    def dfa_cache_info(self) -> dfa.DFACacheInfo:
+        return self.lazy_dfa.cache_info()
+
+    @cached_property
+    def generated(self) -> codegen.GeneratedMatcher:
+        return codegen.compile(self.match_exp)
+
+    @cached_property
+    def bytes_matcher(self) -> ExpressionMatcher:
+        # Searches bytes like input for the same pattern, every engine works on it as is
+        # since the match tree holds the byte values that indexing the input gives
+        bytes_exp = binary.to_bytes_exp(self.match_exp)
+        assert isinstance(bytes_exp, matcher.GroupNode)
+        bytes_matcher = ExpressionMatcher(
+            match_exp=bytes_exp,
+            engine=self.engine,
+            dfa_cache_size=self.dfa_cache_size,
+            profile=self.profile,
+            is_bytes=True,
+        )
+        bytes_matcher._stats = self._stats
+        return bytes_matcher
+
+    def __getstate__(self) -> dict:
+        # Only the match tree and options are pickled (ex. to send to worker processes),
+        # the engines are built again on first use
+        return {
+            "match_exp": self.match_exp,
+            "engine": self.engine,
+            "dfa_cache_size": self.dfa_cache_size,
+            "profile": self.profile,
+            "is_bytes": self.is_bytes,
+            "_stats": matcher.SearchStats(),
+        }
+
+    def stats(self) -> matcher.SearchStats:
+        # Totals of every search since the matcher was made (or `reset_stats()`), node stats
+        # and steps are only counted by the tree engine
+        return self._stats
+
+    def reset_stats(self):
+        self._stats = matcher.SearchStats()
+        if "bytes_matcher" in self.__dict__:
+            self.bytes_matcher._stats = self._stats
+
+    def finditer(
+        self,
+        source_text: Text,
+        engine: Engine | None = None,
+        start_idx: int = 0,
+        stop_idx: int | None = None,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> Iterator[Match]:
+        # Matches are found one at a time as they are asked for, so stopping early skips
+        # scanning the rest of the text. Only matches starting from `start_idx` and before
+        # `stop_idx` are searched for, they can still end after `stop_idx`. Going over
+        # `max_steps` or `timeout` seconds raises `matcher.BudgetExceededError`.
+        if not isinstance(source_text, str) and not self.is_bytes:
+            return self.bytes_matcher.finditer(
+                source_text, engine, start_idx, stop_idx, max_steps, timeout
+            )
+        engine = self._resolve_engine(engine)
+        budget = _budget(max_steps, timeout)
+        if engine == "codegen" and budget is not None:
+            # The generated code does not count the chars its loops step over, the tree
+            # matcher counts every node it visits
+            engine = "tree"
+        next_candidate = self._next_candidate(source_text, engine, stop_idx)
+        if start_idx > 0 or stop_idx is not None:
+            stop_idx = len(source_text) if stop_idx is None else stop_idx
+            next_candidate = _bounded_candidates(next_candidate, start_idx, stop_idx)
+            return itertools.takewhile(
+                lambda match: match.start_idx < stop_idx,
+                self._finditer(source_text, engine, next_candidate, budget),
+            )
+        return self._finditer(source_text, engine, next_candidate, budget)
+
+    def _next_candidate(
+        self, source_text: Text, engine: Engine, stop_idx: int | None = None
+    ) -> Callable[[int], int] | None:
+        search_prefilter = self.search_prefilter
+        next_candidate = None
+        if engine == "literal":
+            # The literal engine does nothing but `find` its literal
+            pass
+        elif (
+            self.candidate_mask is not None
+            and vectorized.preferred(search_prefilter)
+            and len(source_text) >= vectorized.MIN_TEXT_LEN
+            and vectorized.supports(source_text)
+        ):
+            # Without a literal of a few chars to `find`, the first chars of a match are
+            # checked for a whole block of the text at once
+            next_candidate = self.candidate_mask.finder(source_text, stop_idx=stop_idx)
+            if (
+                search_prefilter
+                and search_prefilter.has_literal
+                and not isinstance(source_text, memoryview)
+            ):
+                # A single char literal can still rule out a lot further into the match
+                # (ex. `c` of `[ab]{1000}c`)
+                next_candidate = _intersected_candidates(
+                    next_candidate, search_prefilter.finder(source_text)
+                )
+        elif search_prefilter and not isinstance(source_text, memoryview):
+            # Literals are looked for with `find`, that `memoryview` does not have
+            next_candidate = search_prefilter.finder(source_text)
+        return next_candidate
+
+    def _finditer(
+        self,
+        source_text: Text,
+        engine: Engine,
+        next_candidate: Callable[[int], int] | None,
+        budget: matcher.Budget | None,
+    ) -> Iterator[Match]:
+        if self.profile:
+            return _profiled(
+                self._engine_finditer(source_text, engine, next_candidate, budget),
+                self._stats,
+            )
+        return self._engine_finditer(source_text, engine, next_candidate, budget)
+
+    def _engine_finditer(
+        self,
+        source_text: Text,
+        engine: Engine,
+        next_candidate: Callable[[int], int] | None,
+        budget: matcher.Budget | None,
+    ) -> Iterator[Match]:
+        match engine:
+            case "tree":
+                return _finditer(
+                    self.match_exp,
+                    source_text,
+                    next_candidate,
+                    budget,
+                    self._stats if self.profile else None,
+                )
+            case "nfa":
+                return _to_matches(
+                    nfa.search(self.nfa_program, source_text, next_candidate, budget)
+                )
+            case "dfa":
+                return _to_matches(
+                    self.lazy_dfa.search(source_text, next_candidate, budget)
+                )
+            case "codegen":
+                return _to_matches(self.generated.finditer(source_text, next_candidate))
+            case "shiftand":
+                return _to_matches(
+                    shiftand.search(
+                        self.shiftand_program, source_text, next_candidate, budget
+                    )
+                )
+            case "literal" if not isinstance(source_text, memoryview):
+                return _to_matches(
+                    planner.search_literal(
+                        self.literal, source_text, next_candidate, budget
+                    )
+                )
+            case "literal":
+                # `memoryview` has no `find`, the tree matcher still runs the literal
+                return self._engine_finditer(
+                    source_text, "tree", next_candidate, budget
+                )
+            case _:
+                raise ValueError(f"Unknown search engine `{engine}`!")
+
+    def search(
+        self,
+        source_text: Text,
+        engine: Engine | None = None,
+        max_steps: int | None = None,
+        timeout: float | None = None,
+    ) -> Sequence[Match]:
+        if not isinstance(source_text, str) and not self.is_bytes:
+            return self.bytes_matcher.search(source_text, engine, max_steps, timeout)
+        engine = self._resolve_engine(engine)
+        if (
+            engine == "codegen"
+            and not self.profile
+            and max_steps is None
+            and timeout is None
+        ):
+            # The generated search collects the spans without going through a generator
+            next_candidate = self._next_candidate(source_text, engine)
+            return list(_to_matches(self.generated.search(source_text, next_candidate)))
+        return list(
+            self.finditer(source_text, engine, max_steps=max_steps, timeout=timeout)
+        )
+
+    def search_parallel(
+        self,
+        source_text: str,
+        workers: int | None = None,
+        engine: Engine | None = None,
+        min_shard_size: int = parallel.MIN_SHARD_SIZE,
+    ) -> Sequence[Match]:
+        # Same matches as `search`, found by searching shards of the text in worker processes
+        spans = parallel.search(
+            self,
+            source_text,
+            workers=workers,
+            engine=engine or self.engine,
+            min_shard_size=min_shard_size,
+        )
+        return list(_to_matches(spans))
+
+    def search_many(
+        self,
+        source_texts: Iterable[str],
+        mode: SearchManyMode = "matches",
+        engine: Engine | None = None,
+        chunksize: int = parallel.DEFAULT_CHUNKSIZE,
+        workers: int | None = 1,
+    ) -> Iterator:
+        # Searches every text, `chunksize` texts at a time, so the engine is picked once per
+        # batch and batches are what is sent to worker processes (with `workers` > 1)
+        return parallel.search_many(
+            self,
+            source_texts,
+            mode=mode,
+            engine=engine or self.engine,
+            chunksize=chunksize,
+            workers=workers,
+        )
+
+    def search_batch(
+        self,
+        source_texts: Sequence[str],
+        mode: SearchManyMode = "matches",
+        engine: Engine | None = None,
+    ) -> list:
+        engine = engine or self.engine
+        search_prefilter = self.search_prefilter
+        could_match = (
+            search_prefilter.could_match if search_prefilter else lambda text: True
+        )
+
+        match mode:
+            case "matches":
+                return [
+                    self.search(text, engine) if could_match(text) else []
+                    for text in source_texts
+                ]
+            case "any":
+                return [
+                    could_match(text) and self.first(text, engine) is not None
+                    for text in source_texts
+                ]
+            case "indices":
+                return [
+                    text_idx
+                    for text_idx, text in enumerate(source_texts)
+                    if could_match(text) and self.first(text, engine) is not None
+                ]
+            case _:
+                raise ValueError(f"Unknown search many mode `{mode}`!")
+
+    def first(self, source_text: Text, engine: Engine | None = None) -> Match | None:
+        return next(self.finditer(source_text, engine), None)
+
+    def any(self, source_text: Text, engine: Engine | None = None) -> bool:
+        return self.first(source_text, engine) is not None
+
+    def count(self, source_text: Text, engine: Engine | None = None) -> int:
+        return sum(1 for _ in self.finditer(source_text, engine))
+
+    def finditer_file(
+        self, file_path: str | os.PathLike, engine: Engine | None = None
+    ) -> Iterator[Match]:
+        # Searches the file's bytes in place through a memory map, nothing is read into
+        # Python objects or decoded, so memory stays flat for any size of file. Matches
+        # are at byte offsets, the file is unmapped once the matches run out.
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # Empty files can not be memory mapped
+                yield from self.finditer(b"", engine)
+                return
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    buffer.madvise(mmap.MADV_SEQUENTIAL)
+                yield from self._finditer_mapped(buffer, engine)
+
+    def _finditer_mapped(
+        self, buffer: mmap.mmap, engine: Engine | None
+    ) -> Iterator[Match]:
+        # Same matches as one search of the whole buffer, a window's last match can run
+        # past its end, the next window then starts where that match ended
+        released_idx = 0
+        window_start_idx = 0
+        while window_start_idx < len(buffer):
+            window_stop_idx = min(window_start_idx + FILE_WINDOW_SIZE, len(buffer))
+            next_window_idx = window_stop_idx
+            for match in self.finditer(
+                buffer, engine, start_idx=window_start_idx, stop_idx=window_stop_idx
+            ):
+                yield match
+                next_window_idx = max(next_window_idx, match.end_idx)
+
+            # Nothing before the next window is looked at again
+            release_idx = next_window_idx // mmap.PAGESIZE * mmap.PAGESIZE
+            if hasattr(mmap, "MADV_DONTNEED") and release_idx > released_idx:
+                buffer.madvise(
+                    mmap.MADV_DONTNEED, released_idx, release_idx - released_idx
+                )
+                released_idx = release_idx
+            window_start_idx = next_window_idx
+
+    def search_file(
+        self, file_path: str | os.PathLike, engine: Engine | None = None
+    ) -> Sequence[Match]:
+        return list(self.finditer_file(file_path, engine))
+
+    def search_stream(self, source: Iterable[str] | TextIO) -> Iterator[Match]:
+        # Yields matches (with offsets from the start of the stream) as the chunks come in,
+        # text is only kept while a match crossing chunk boundaries could still need it
+        chunks = source
+        if (read := getattr(source, "read", None)) is not None:
+            chunks = iter(lambda: read(STREAM_CHUNK_SIZE), "")
+
+        try:
+            program = self.nfa_program
+        except nfa.UnsupportedPatternError:
+            logger.warning(
+                "Pattern is not supported by the NFA engine, reading the whole stream "
+                "into memory before searching"
+            )
+            yield from self.search("".join(chunks))
+            return
+
+        for start_idx, end_idx in nfa.search_stream(program, chunks):
+            yield Match(start_idx=start_idx, end_idx=end_idx)
+
+    async def afinditer(
+        self,
+        source: AsyncIterable[aio.Chunk] | aio.ChunkReader,
+        yield_every: int = aio.DEFAULT_YIELD_EVERY,
+        executor: Executor | None = None,
+        offload_min_len: int = aio.DEFAULT_OFFLOAD_MIN_LEN,
+    ) -> AsyncIterator[Match]:
+        # `search_stream` for asyncio, over an async iterable of chunks or a reader like
+        # `asyncio.StreamReader` (bytes chunks give byte offsets). The scan gives control
+        # back to the event loop every `yield_every` chars, and with an `executor` chunks
+        # of at least `offload_min_len` are scanned in it.
+        source_chunks = aio.chunks(source, STREAM_CHUNK_SIZE)
+        first_chunk = await anext(source_chunks, "")
+        expression_matcher = self
+        if isinstance(first_chunk, bytes) and not self.is_bytes:
+            expression_matcher = self.bytes_matcher
+
+        async def all_chunks() -> AsyncIterator[aio.Chunk]:
+            yield first_chunk
+            async for chunk in source_chunks:
+                yield chunk
+
+        try:
+            program = expression_matcher.nfa_program
+        except nfa.UnsupportedPatternError:
+            logger.warning(
+                "Pattern is not supported by the NFA engine, reading the whole stream "
+                "into memory before searching"
+            )
+            source_text = aio.join([chunk async for chunk in all_chunks()])
+            if executor is None:
+                matches = expression_matcher.search(source_text)
+            else:
+                matches = await asyncio.get_running_loop().run_in_executor(
+                    executor, expression_matcher.search, source_text
+                )
+            for match in matches:
+                yield match
+            return
+
+        async for start_idx, end_idx in aio.scan(
+            program,
+            all_chunks(),
+            empty=first_chunk[:0],
+            yield_every=yield_every,
+            executor=executor,
+            offload_min_len=offload_min_len,
+        ):
+            yield Match(start_idx=start_idx, end_idx=end_idx)
+
+    async def asearch(
+        self,
+        source: AsyncIterable[aio.Chunk] | aio.ChunkReader,
+        yield_every: int = aio.DEFAULT_YIELD_EVERY,
+        executor: Executor | None = None,
+        offload_min_len: int = aio.DEFAULT_OFFLOAD_MIN_LEN,
+    ) -> Sequence[Match]:
+        return [
+            match
+            async for match in self.afinditer(
+                source,
+                yield_every=yield_every,
+                executor=executor,
+                offload_min_len=offload_min_len,
+            )
+        ]
+
+    def incremental(self, source_text: str) -> IncrementalSearch:
+        # Matches of the text kept up to date as it is edited, see `IncrementalSearch`
+        return IncrementalSearch(self, source_text)
+
+
+class _CompileCache:
+    # Least recently used cache of Matcher objects, keyed by the regex string and the
+    # compile options, so `search`/ `compile` in a hot loop only parse a pattern once
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.matchers: OrderedDict[tuple, ExpressionMatcher] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> ExpressionMatcher | None:
+        with self.lock:
+            expression_matcher = self.matchers.get(key)
+            if expression_matcher is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.matchers.move_to_end(key)
+            return expression_matcher
+
+    def put(self, key: tuple, expression_matcher: ExpressionMatcher):
+        with self.lock:
+            if self.max_size <= 0:
+                return
+            self.matchers[key] = expression_matcher
+            self.matchers.move_to_end(key)
+            while len(self.matchers) > self.max_size:
+                self.matchers.popitem(last=False)
+
+    def resize(self, max_size: int):
+        with self.lock:
+            self.max_size = max_size
+            while len(self.matchers) > max(max_size, 0):
+                self.matchers.popitem(last=False)
+
+    def purge(self):
+        with self.lock:
+            self.matchers.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> CacheInfo:
+        with self.lock:
+            return CacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                max_size=self.max_size,
+                size=len(self.matchers),
+            )
+
+
+_cache = _CompileCache(max_size=DEFAULT_CACHE_SIZE)
+# Bundles loaded with `cache`, looked in by `compile` before parsing a regex
+_bundles: list[MatcherBundle] = []
+
+
+def set_cache_size(max_size: int):
+    # 0 turns caching off
+    _cache.resize(max_size)
+
+
+def purge():
+    # Also forgets the bundles loaded with `cache`
+    _cache.purge()
+    with _cache.lock:
+        _bundles.clear()
+
+
+def cache_info() -> CacheInfo:
+    return _cache.info()
+
+
+def search(regex: str, source_text: Text) -> Sequence[Match]:
+    return compile(regex).search(source_text)
+
+
+def finditer(regex: str, source_text: Text) -> Iterator[Match]:
+    return compile(regex).finditer(source_text)
+
+
+def afinditer(
+    regex: str, source: AsyncIterable[aio.Chunk] | aio.ChunkReader
+) -> AsyncIterator[Match]:
+    return compile(regex).afinditer(source)
+
+
+async def asearch(
+    regex: str, source: AsyncIterable[aio.Chunk] | aio.ChunkReader
+) -> Sequence[Match]:
+    return await compile(regex).asearch(source)
+
+
+def search_file(regex: str, file_path: str | os.PathLike) -> Sequence[Match]:
+    return compile(regex).search_file(file_path)
+
+
+def compile(
+    regex: str,
+    engine: Engine = "auto",
+    dfa_cache_size: int = dfa.DEFAULT_CACHE_SIZE,
+    codegen: bool = False,
+    profile: bool = False,
+) -> ExpressionMatcher:
+    engine = "codegen" if codegen else engine
+    if profile:
+        # Not cached, every profiled matcher keeps its own stats
+        return ExpressionMatcher(
+            match_exp=_compile(regex),
+            engine=engine,
+            dfa_cache_size=dfa_cache_size,
+            profile=True,
+        )
+
+    cache_key = (regex, engine, dfa_cache_size)
+    if (expression_matcher := _cache.get(cache_key)) is not None:
+        return expression_matcher
+
+    for matcher_bundle in _bundles:
+        if (
+            expression_matcher := matcher_bundle.find(regex, engine, dfa_cache_size)
+        ) is not None:
+            break
+    else:
+        expression_matcher = ExpressionMatcher(
+            match_exp=_compile(regex), engine=engine, dfa_cache_size=dfa_cache_size
+        )
+    _cache.put(cache_key, expression_matcher)
+    return expression_matcher
+
+
+def save_bundle(file_path: str, matchers: Mapping[str, ExpressionMatcher]):
+    # Saves compiled matchers keyed by their regex string, so a later `load_bundle` can
+    # skip parsing and optimizing them
+    data = bundle.dumps(
+        bundle.PatternRecord.encode(
+            regex,
+            expression_matcher.engine,
+            expression_matcher.dfa_cache_size,
+            expression_matcher.match_exp,
+        )
+        for regex, expression_matcher in matchers.items()
+    )
+    with open(file_path, "wb") as bundle_file:
+        bundle_file.write(data)
+
+
+class MatcherBundle(Mapping[str, ExpressionMatcher]):
+    # Matchers of a loaded bundle by regex string, each match tree is decoded the first
+    # time its matcher is asked for
+    def __init__(self, records: Iterable[bundle.PatternRecord]):
+        self.records = {record.regex: record for record in records}
+        self.matchers: dict[str, ExpressionMatcher] = {}
+
+    def __getitem__(self, regex: str) -> ExpressionMatcher:
+        if (expression_matcher := self.matchers.get(regex)) is None:
+            record = self.records[regex]
+            if (engine := record.engine) not in ENGINES:
+                raise ValueError(f"Unknown search engine `{engine}` in bundle!")
+            expression_matcher = self.matchers[regex] = ExpressionMatcher(
+                match_exp=record.match_exp(),
+                engine=engine,
+                dfa_cache_size=record.dfa_cache_size,
+            )
+        return expression_matcher
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def find(
+        self, regex: str, engine: Engine, dfa_cache_size: int
+    ) -> ExpressionMatcher | None:
+        record = self.records.get(regex)
+        if (
+            record is None
+            or record.engine != engine
+            or record.dfa_cache_size != dfa_cache_size
+        ):
+            return None
+        return self[regex]
+
+
+def load_bundle(file_path: str, cache: bool = True) -> MatcherBundle:
+    # With `cache`, `compile`/ `search` of a bundled regex (with the same options) takes
+    # its matcher from the bundle instead of parsing the regex
+    with open(file_path, "rb") as bundle_file:
+        matcher_bundle = MatcherBundle(bundle.loads(bundle_file.read()))
+
+    if cache:
+        with _cache.lock:
+            _bundles.append(matcher_bundle)
+    return matcher_bundle
+
+
+class RegexSet:
+    # Patterns searched together, by their index in `patterns`. One Aho-Corasick pass over
+    # the text finds the patterns that are a plain literal, and the literals every match
+    # of each other pattern contains (see `prefilter.required_literals`), so only those
+    # with all their literals in the text (or without any, that start with a char found
+    # in the text) are searched.
+    def __init__(self, patterns: Sequence[str], engine: Engine = "auto"):
+        self.patterns = tuple(patterns)
+        self.matchers = [compile(pattern, engine=engine) for pattern in self.patterns]
+        # Patterns that are a plain literal, matched by the automaton alone
+        plain_literals: dict[int, str] = {}
+        # Literals every match of the other patterns contains
+        pattern_literals: dict[int, list[str]] = {}
+        self.first_char_ids: dict[matcher.Char, list[int]] = {}
+        self.always_ids: list[int] = []
+
+        for pattern_id, expression_matcher in enumerate(self.matchers):
+            match expression_matcher.match_exp:
+                case matcher.GroupAllNode(
+                    sub_nodes=[
+                        matcher.MatchLiteralNode(literal=str() as literal)
+                        | matcher.MatchCharNode(char=str() as literal)
+                    ]
+                ):
+                    plain_literals[pattern_id] = literal
+                    continue
+
+            match_exp = expression_matcher.match_exp
+            required_literals = prefilter.required_literals(match_exp)
+            search_prefilter = expression_matcher.search_prefilter
+            if required_literals:
+                pattern_literals[pattern_id] = [
+                    literal for literal in required_literals if isinstance(literal, str)
+                ]
+            elif search_prefilter is None:
+                self.always_ids.append(pattern_id)
+            elif search_prefilter.prefix or search_prefilter.inner:
+                # Only single char literals are left, found same as first chars
+                needle = search_prefilter.prefix or search_prefilter.inner
+                assert isinstance(needle, str)
+                self.first_char_ids.setdefault(needle, []).append(pattern_id)
+            elif search_prefilter.first_chars:
+                for char in search_prefilter.first_chars:
+                    self.first_char_ids.setdefault(char, []).append(pattern_id)
+            else:
+                self.always_ids.append(pattern_id)
+
+        # Only the literal of each pattern that the fewest other patterns share (the
+        # longest of those) goes in the automaton, a literal common to many patterns
+        # (ex. `took `) would be found on most lines and tell little. The rest are checked
+        # with `in` once that one is found.
+        shared_counts: dict[str, int] = {}
+        for required_literals in pattern_literals.values():
+            for literal in required_literals:
+                shared_counts[literal] = shared_counts.get(literal, 0) + 1
+
+        # Every distinct literal once, with the patterns it is the whole of or the key of
+        literal_ids: dict[str, int] = {}
+        self.literal_pattern_ids: list[list[int]] = []
+        self.key_pattern_ids: list[list[tuple[int, list[str]]]] = []
+
+        def literal_id(literal: str) -> int:
+            if (found_id := literal_ids.get(literal)) is None:
+                found_id = literal_ids[literal] = len(literal_ids)
+                self.literal_pattern_ids.append([])
+                self.key_pattern_ids.append([])
+            return found_id
+
+        for pattern_id, literal in plain_literals.items():
+            self.literal_pattern_ids[literal_id(literal)].append(pattern_id)
+        for pattern_id, required_literals in pattern_literals.items():
+            key = min(
+                required_literals,
+                key=lambda literal: (shared_counts[literal], -len(literal)),
+            )
+            other_literals = [
+                literal for literal in required_literals if literal != key
+            ]
+            self.key_pattern_ids[literal_id(key)].append((pattern_id, other_literals))
+
+        self.automaton = (
+            ahocorasick.build({id_: literal for literal, id_ in literal_ids.items()})
+            if literal_ids
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _scan(self, source_text: str) -> tuple[dict[int, list[Match]], set[int]]:
+        # Matches of the literal patterns, and the other patterns that could match
+        literal_matches: dict[int, list[Match]] = {}
+        candidate_ids = set(self.always_ids)
+        if self.automaton is not None:
+            literal_pattern_ids = self.literal_pattern_ids
+            found_ids: set[int] = set()
+            for found_id, start_idx, end_idx in self.automaton.finditer(source_text):
+                found_ids.add(found_id)
+                for pattern_id in literal_pattern_ids[found_id]:
+                    # Occurrences overlapping the last match are skipped, same as
+                    # searching for the literal alone
+                    pattern_matches = literal_matches.setdefault(pattern_id, [])
+                    if not pattern_matches or start_idx >= pattern_matches[-1].end_idx:
+                        pattern_matches.append(
+                            Match(start_idx=start_idx, end_idx=end_idx)
+                        )
+
+            for found_id in found_ids:
+                for pattern_id, other_literals in self.key_pattern_ids[found_id]:
+                    if all(literal in source_text for literal in other_literals):
+                        candidate_ids.add(pattern_id)
+
+        if self.first_char_ids:
+            for char in self.first_char_ids.keys() & set(source_text):
+                candidate_ids.update(self.first_char_ids[char])
+        return literal_matches, candidate_ids
+
+    def search(self, source_text: str, engine: Engine | None = None) -> list[SetMatch]:
+        # The matches of every pattern (the same as searching for it alone), by start index
+        literal_matches, candidate_ids = self._scan(source_text)
+        pattern_matches = {
+            pattern_id: self.matchers[pattern_id].search(source_text, engine)
+            for pattern_id in candidate_ids
+        } | literal_matches
+        return sorted(
+            (
+                SetMatch(pattern_id=pattern_id, start_idx=start_idx, end_idx=end_idx)
+                for pattern_id, matches in pattern_matches.items()
+                for start_idx, end_idx in matches
+            ),
+            key=lambda set_match: (set_match.start_idx, set_match.pattern_id),
+        )
+
+    def matching_ids(self, source_text: str, engine: Engine | None = None) -> list[int]:
+        # Ids of the patterns with any match, only searching each one up to its first match
+        literal_matches, candidate_ids = self._scan(source_text)
+        return sorted(
+            [
+                pattern_id
+                for pattern_id in candidate_ids
+                if self.matchers[pattern_id].any(source_text, engine)
+            ]
+            + list(literal_matches)
+        )
+
+
+def compile_set(patterns: Sequence[str], engine: Engine = "auto") -> RegexSet:
+    return RegexSet(patterns, engine=engine)
+
+
+class IncrementalSearch:
+    # Matches of a text that is edited, as found by `ExpressionMatcher.search`. After an
+    # edit the text is only searched again from the earliest index a match attempt could
+    # have looked at the edit from (see `incremental.py`), until the search gets to an
+    # index past the edit that the search before the edit went on from too. From there
+    # the text and so the matches are the same as before, only moved.
+    #
+    # Matches are kept in two lists split at the last edit, the ones after it by their
+    # offsets from the end of the text, so an edit does not change them. Only matches
+    # between the last edit and the next one move across, so the time an edit takes
+    # does not grow with the text (besides copying it).
+    def __init__(self, expression_matcher: ExpressionMatcher, source_text: str):
+        self.expression_matcher = expression_matcher
+        self.source_text = source_text
+        self._before: list[Match] = list(expression_matcher.search(source_text))
+        # (start, end) offsets from the end of the text, the match right after the split
+        # is last
+        self._after: list[nfa.Span] = []
+
+    @property
+    def matches(self) -> list[Match]:
+        text_len = len(self.source_text)
+        return self._before + [
+            Match(start_idx=start_idx + text_len, end_idx=end_idx + text_len)
+            for start_idx, end_idx in reversed(self._after)
+        ]
 
-    def search(self, source_text: str):
-        return _search(self.match_exp, source_text)
+    def _split_at(self, idx: int):
+        # Moves the matches across, so the ones starting before `idx` are in `_before`
+        before, after = self._before, self._after
+        text_len = len(self.source_text)
+        while before and before[-1].start_idx >= idx:
+            match = before.pop()
+            after.append((match.start_idx - text_len, match.end_idx - text_len))
+        while after and after[-1][0] + text_len < idx:
+            start_idx, end_idx = after.pop()
+            before.append(
+                Match(start_idx=start_idx + text_len, end_idx=end_idx + text_len)
+            )
 
+    def apply_edit(self, start_idx: int, end_idx: int, new_text: str) -> list[Match]:
+        # Replaces `source_text[start_idx:end_idx]` with `new_text`, returns the matches
+        # found by searching around the edit again (the others only moved)
+        source_text = self.source_text
+        if not 0 <= start_idx <= end_idx <= len(source_text):
+            raise ValueError(
+                f"Edit `{start_idx}:{end_idx}` is not inside the text of "
+                f"{len(source_text)} chars!"
+            )
 
-def search(regex: str, source_text: str) -> Sequence[Match]:
-    return _search(_compile(regex), source_text)
+        lookback = self.expression_matcher.lookback
+        restart_idx = lookback.restart_idx(source_text, start_idx)
+        self._split_at(restart_idx)
+        before, after = self._before, self._after
+        if before and before[-1].end_idx > restart_idx:
+            # The search never went on from inside a match, so it starts again at it
+            restart_idx = before[-1].start_idx
+            self._split_at(restart_idx)
 
+        self.source_text = source_text = (
+            source_text[:start_idx] + new_text + source_text[end_idx:]
+        )
+        text_len = len(source_text)
 
-def compile(regex: str) -> ExpressionMatcher:
-    return ExpressionMatcher(match_exp=_compile(regex))
+        found: list[Match] = []
+        scan_from, stop_idx = restart_idx, start_idx + len(new_text)
+        while True:
+            for match in self.expression_matcher.finditer(
+                source_text, start_idx=scan_from, stop_idx=stop_idx
+            ):
+                found.append(match)
+                # Zero width matches (ex. `a*`) still move the search forward
+                scan_from = match.end_idx + (match.end_idx == match.start_idx)
+
+            # The search goes on from every index between the last match and `stop_idx`
+            synced_idx = max(scan_from, stop_idx)
+            if synced_idx > text_len:
+                after.clear()
+                break
+            # Matches from before the edit are replaced up to the synced index, if the
+            # last of them goes over it the search before the edit did not go on from
+            # there, so it has to get to the end of that match first
+            last_replaced = None
+            while after and after[-1][0] + text_len < synced_idx:
+                last_replaced = after.pop()
+            if last_replaced is None or last_replaced[1] + text_len <= synced_idx:
+                break
+            stop_idx = last_replaced[1] + text_len
+
+        before.extend(found)
+        return found
 
 
 def check(
-    regex: str, source_text: str, expected_matches: Sequence[Match], lazy: bool = False
+    regex: str,
+    source_text: str,
+    expected_matches: Sequence[Match],
+    lazy: bool = False,
+    engine: Engine = "tree",
 ):
     if not lazy:
         matches = search(regex, source_text)
     else:
-        matches = compile(regex).search(source_text)
+        matches = compile(regex).search(source_text, engine=engine)
 
     passed = len(matches) == len(expected_matches) and all(
         match == expected for match, expected in zip(matches, expected_matches)
@@ -69,6 +1118,282 @@ def check(
     )
 
 
+def check_lazy(regex: str, source_text: str, engine: Engine = "tree"):
+    expression_matcher = compile(regex, engine=engine)
+    expected_matches = expression_matcher.search(source_text)
+
+    matches = finditer(regex, source_text) if engine == "tree" else None
+    first_matches = list(itertools.islice(expression_matcher.finditer(source_text), 2))
+    passed = (
+        (matches is None or list(matches) == expected_matches)
+        and first_matches == expected_matches[:2]
+        and expression_matcher.first(source_text) == next(iter(expected_matches), None)
+        and expression_matcher.any(source_text) == bool(expected_matches)
+        and expression_matcher.count(source_text) == len(expected_matches)
+    )
+    logger.debug(
+        f"Lazy matches {first_matches}.. of {expected_matches} for {regex} in {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_parallel(regex: str, source_text: str, engine: Engine = "tree"):
+    expression_matcher = compile(regex, engine=engine)
+    expected_matches = expression_matcher.search(source_text)
+    matches = expression_matcher.search_parallel(
+        source_text, workers=2, min_shard_size=16
+    )
+
+    passed = matches == expected_matches
+    logger.debug(
+        f"Parallel search found {len(matches)} == {len(expected_matches)} matches for "
+        f"{regex} in {len(source_text)} chars <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_many(regex: str, source_texts: list[str], engine: Engine = "tree"):
+    expression_matcher = compile(regex, engine=engine)
+    expected_matches = [expression_matcher.search(text) for text in source_texts]
+
+    passed = (
+        list(expression_matcher.search_many(source_texts, chunksize=2))
+        == expected_matches
+        and list(expression_matcher.search_many(source_texts, "any", chunksize=2))
+        == [bool(matches) for matches in expected_matches]
+        and list(
+            expression_matcher.search_many(
+                iter(source_texts), "indices", chunksize=2, workers=2
+            )
+        )
+        == [text_idx for text_idx, matches in enumerate(expected_matches) if matches]
+    )
+    logger.debug(
+        f"Search many matches {expected_matches} for {regex} in {source_texts} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_budget(regex: str, source_text: str, max_steps: int, engine: Engine = "tree"):
+    try:
+        compile(regex, engine=engine).search(source_text, max_steps=max_steps)
+        steps = None
+    except matcher.BudgetExceededError as e:
+        steps = e.steps
+
+    passed = steps == max_steps + 1
+    logger.debug(
+        f"Search for {regex} with {engine} engine stopped after {steps} steps, budget "
+        f"{max_steps} <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_timeout(regex: str, source_text: str, engine: Engine = "tree"):
+    # A timeout of 0 runs out at the first look at the clock, however few steps every
+    # start index takes
+    try:
+        compile(regex, engine=engine).search(source_text, timeout=0.0)
+        passed = False
+    except matcher.BudgetExceededError:
+        passed = True
+    logger.debug(
+        f"BudgetExceededError for {regex} with {engine} engine and a timeout of 0 is "
+        f"correctly issued? <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+def check_counted(regex: str, source_text: str, expected_matches: Sequence[Match]):
+    # Every engine keeps repeat counts as counters, so ranges in the millions are no more
+    # work to compile or search with than small ones
+    for engine in ("tree", "nfa", "dfa", "codegen"):
+        matches = compile(regex, engine=engine).search(source_text)
+
+        passed = matches == expected_matches
+        logger.debug(
+            f"{engine} engine found {len(matches)} matches, first {matches[:1]} for "
+            f"{regex} in {len(source_text)} chars "
+            f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+            extra={"markup": False},
+        )
+
+
+def check_profile(regex: str, source_text: str, engine: Engine = "tree"):
+    expression_matcher = compile(regex, engine=engine, profile=True)
+    matches = [
+        *expression_matcher.search(source_text),
+        *expression_matcher.finditer(source_text),
+    ]
+    stats = expression_matcher.stats()
+
+    passed = (
+        matches == list(compile(regex, engine=engine).search(source_text)) * 2
+        and stats.searches == 2
+        and stats.matches == len(matches)
+        and (engine != "tree" or stats.steps > 0 and stats.start_positions > 0)
+    )
+    logger.debug(
+        f"Profiled {regex} in {source_text} with {engine} engine {stats.searches} searches, "
+        f"{stats.matches} matches, {stats.start_positions} start positions, {stats.steps} "
+        f"steps <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_stream(regex: str, chunks: list[str]):
+    import io
+
+    expression_matcher = compile(regex)
+    expected_matches = expression_matcher.search("".join(chunks))
+    matches = list(expression_matcher.search_stream(chunks))
+    file_matches = list(expression_matcher.search_stream(io.StringIO("".join(chunks))))
+
+    passed = matches == expected_matches and file_matches == expected_matches
+    logger.debug(
+        f"Stream matches {matches} == {expected_matches} for {regex} in {chunks} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+def check_async(regex: str, chunks: list[str]):
+    from concurrent.futures import ThreadPoolExecutor
+
+    expression_matcher = compile(regex)
+    expected_matches = expression_matcher.search("".join(chunks))
+    expected_byte_matches = expression_matcher.search("".join(chunks).encode("latin-1"))
+
+    async def source_chunks() -> AsyncIterator[str]:
+        for chunk in chunks:
+            yield chunk
+
+    async def run() -> tuple[Sequence[Match], Sequence[Match], Sequence[Match]]:
+        matches = await expression_matcher.asearch(source_chunks(), yield_every=2)
+        # Every chunk is offloaded to the executor
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            offloaded_matches = await expression_matcher.asearch(
+                source_chunks(), executor=executor, offload_min_len=1
+            )
+
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk.encode("latin-1"))
+        reader.feed_eof()
+        byte_matches = [match async for match in expression_matcher.afinditer(reader)]
+        return matches, offloaded_matches, byte_matches
+
+    matches, offloaded_matches, byte_matches = asyncio.run(run())
+    passed = (
+        matches == expected_matches
+        and offloaded_matches == expected_matches
+        and byte_matches == expected_byte_matches
+    )
+    logger.debug(
+        f"Async matches {matches} == {expected_matches} (and offloaded, and from a "
+        f"stream reader) for {regex} in {chunks} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+def check_set(patterns: list[str], source_text: str, engine: Engine = "tree"):
+    regex_set = compile_set(patterns, engine=engine)
+    set_matches = regex_set.search(source_text)
+    expected_set_matches = sorted(
+        (
+            SetMatch(pattern_id, start_idx, end_idx)
+            for pattern_id, pattern in enumerate(patterns)
+            for start_idx, end_idx in compile(pattern).search(source_text)
+        ),
+        key=lambda set_match: (set_match.start_idx, set_match.pattern_id),
+    )
+    matching_ids = regex_set.matching_ids(source_text)
+    expected_matching_ids = sorted({set_match[0] for set_match in expected_set_matches})
+
+    passed = (
+        set_matches == expected_set_matches and matching_ids == expected_matching_ids
+    )
+    logger.debug(
+        f"Set matches ({engine}) {set_matches} == {expected_set_matches} and matching ids "
+        f"{matching_ids} for {patterns} in {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+def check_bundle(regexes: list[str], source_text: str, engine: Engine = "tree"):
+    import os
+    import tempfile
+
+    matchers = {
+        regex: ExpressionMatcher(match_exp=_compile(regex), engine=engine)
+        for regex in regexes
+    }
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bundle_path = os.path.join(temp_dir, "patterns.trxb")
+        save_bundle(bundle_path, matchers)
+        purge()
+        matcher_bundle = load_bundle(bundle_path)
+
+    passed = dict(matcher_bundle) == matchers and all(
+        compile(regex, engine=engine) is matcher_bundle[regex]
+        and matcher_bundle[regex].search(source_text)
+        == matchers[regex].search(source_text)
+        for regex in regexes
+    )
+    logger.debug(
+        f"Bundle of {regexes} loads the same matchers, `compile` takes them from it "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+    purge()
+
+
+def check_bytes(regex: str, source_text: str, engine: Engine = "tree"):
+    import tempfile
+
+    # Latin-1 text has a byte per char, so matches are at the same offsets as in the str
+    source_bytes = source_text.encode("latin-1")
+    expression_matcher = compile(regex, engine=engine)
+    expected_matches = expression_matcher.search(source_text)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "source.txt")
+        with open(file_path, "wb") as file:
+            file.write(source_bytes)
+        file_matches = expression_matcher.search_file(file_path)
+
+    passed = (
+        expression_matcher.search(source_bytes)
+        == expression_matcher.search(memoryview(source_bytes))
+        == file_matches
+        == expected_matches
+    )
+    logger.debug(
+        f"{engine} engine matches {file_matches} in bytes, memoryview and file for "
+        f"{regex} <<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+def check_incremental(
+    regex: str,
+    source_text: str,
+    edits: list[tuple[int, int, str]],
+    engine: Engine = "tree",
+):
+    expression_matcher = compile(regex, engine=engine)
+    incremental_search = expression_matcher.incremental(source_text)
+    for start_idx, end_idx, new_text in edits:
+        incremental_search.apply_edit(start_idx, end_idx, new_text)
+        source_text = source_text[:start_idx] + new_text + source_text[end_idx:]
+    expected_matches = expression_matcher.search(source_text)
+
+    passed = incremental_search.matches == expected_matches
+    logger.debug(
+        f"Incremental matches {incremental_search.matches} == {expected_matches} for "
+        f"{regex} in {source_text} after {len(edits)} edits "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
 if __name__ == "__main__":
     import log
 
@@ -89,3 +1414,155 @@ if __name__ == "__main__":
         [Match(start_idx=0, end_idx=4), Match(start_idx=6, end_idx=10)],
     )
     check("e{2,4}", "$$OleeeOlaOleOleOla", [Match(start_idx=4, end_idx=7)], lazy=True)
+    check(
+        "[BCP]at",
+        "1BatCatPatRat",
+        [
+            Match(start_idx=1, end_idx=4),
+            Match(start_idx=4, end_idx=7),
+            Match(start_idx=7, end_idx=10),
+        ],
+        lazy=True,
+        engine="nfa",
+    )
+    check(
+        "e{2,4}",
+        "$$OleeeOlaOleOleOla",
+        [Match(start_idx=4, end_idx=7)],
+        lazy=True,
+        engine="nfa",
+    )
+    check(
+        "e{2,4}",
+        "$$OleeeOlaOleOleOla",
+        [Match(start_idx=4, end_idx=7)],
+        lazy=True,
+        engine="dfa",
+    )
+    check(
+        ".[BCP]at",
+        "1BatCatPatRat",
+        [Match(start_idx=0, end_idx=4), Match(start_idx=6, end_idx=10)],
+        lazy=True,
+        engine="codegen",
+    )
+    purge()
+    set_cache_size(2)
+    for regex_str in ["[BCP]at", "e{2,4}", "[BCP]at", "a*", "[BCP]at"]:
+        compile(regex_str)
+    logger.debug(
+        f"Compile cache {cache_info()} "
+        f"<<<<<<<<<<< {'SUCCESS' if cache_info() == CacheInfo(hits=2, misses=3, max_size=2, size=2) else 'FAIL'}"
+    )
+    set_cache_size(DEFAULT_CACHE_SIZE)
+
+    check_lazy("[BCP]at", "1BatCatPatRat")
+    check_lazy("ERROR.[0-9]+", "INFO 1\nERROR 2\nERROR 3", engine="nfa")
+    check_lazy("[a-c]+[xyz]", "abcx_ccaz_bb", engine="codegen")
+    check_lazy("a+", "bbb", engine="dfa")
+
+    # Shards are cut at fixed indexes, so matches run over into the next shard
+    check_parallel("[BCP]at.", "1BatCatPatRat\n" * 20)
+    check_parallel("[a-z]+[0-9]", ("abcdefgh" * 10 + "1_") * 4, engine="dfa")
+
+    log_lines = ["INFO 1", "ERROR 2", "WARN 3", "ERROR x", "INFO 5 ERROR 6"]
+    check_many("ERROR.[0-9]+", log_lines)
+    check_many("[0-9]+", log_lines, engine="codegen")
+
+    for engine in ("tree", "nfa", "dfa", "codegen"):
+        check_budget("a+[bc]", ("a" * 50 + "x") * 20, max_steps=500, engine=engine)
+    check_budget("a[bc]", "a" * 1000, max_steps=500, engine="shiftand")
+    for engine in ("tree", "nfa", "dfa", "codegen", "shiftand", "auto"):
+        check_timeout(".[a-z]{2}", "abc def " * 2000, engine=engine)
+    check_timeout("def", "abc def " * 2000, engine="literal")
+    check_timeout("a*b", "a" * 3000 + "xb", engine="codegen")
+
+    check_counted("a{1,5000000}c", "a" * 20_000 + "c", [Match(0, 20_001)])
+    check_counted(
+        "xa{2,9999999999}",
+        ("x" + "a" * 999) * 20,
+        [Match(idx * 1000, (idx + 1) * 1000) for idx in range(20)],
+    )
+    check_counted("[ab]{1000000}", "ab" * 500_000 + "c", [Match(0, 1_000_000)])
+    check_counted("[ab]{1000000,}c", "ab" * 499_999 + "c", [])
+
+    check_profile("[BCP]at", "1BatCatPatRat")
+    check_profile("[BCP]at", "1BatCatPatRat", engine="codegen")
+
+    check_stream("[BCP]at", ["1Ba", "tCatP", "a", "tRat"])
+    check_stream("ERROR.[0-9]+", ["INFO 1\nERR", "OR 2", "3\nERROR 4"])
+
+    check_bundle(
+        ["[BCP]at", "e{2,4}", "ERROR.[0-9]+", "[一-龥]+"], "1BatCatee ERROR 42"
+    )
+    check_bundle(["[a-c]+[xyz]", "a{9999999999}"], "abcx_ccaz_bb", engine="codegen")
+    check_stream("[a+b]c", ["aa", "ac_b", "c"])
+
+    check_async("[BCP]at", ["1Ba", "tCatP", "a", "tRat"])
+    check_async("ERROR.[0-9]+", ["INFO 1\nERR", "OR 2", "3\nERROR 4"])
+    check_async("a*", ["baa", "", "b"])
+    check_async("[a+b]c", ["aa", "ac_b", "c"])
+    check_async("x", [])
+
+    alert_patterns = [
+        "ERROR",
+        "ERROR.[0-9]+",
+        "took [0-9]{4,}ms",
+        "[a-f0-9]{8}",
+        "aa",
+        "x",
+        "[BCP]at",
+        ".*",
+        "timeout",
+    ]
+    alert_text = "INFO 1 ERROR 22 took 12345ms id deadbeef aaaa Cat ERROR x"
+    for engine in ("tree", "nfa", "dfa", "codegen"):
+        check_set(alert_patterns, alert_text, engine)
+    check_set(alert_patterns, "")
+    check_set([], "abc")
+
+    for engine in ("tree", "nfa", "dfa", "codegen"):
+        check_bytes("ERROR.[0-9]+ took [0-9]+ms", "INFO 1\nERROR 22 took 5ms\n", engine)
+        check_bytes("caf\xe9+.[a-z]{2,}", "caf\xe9\xe9 au lait, caf\xe9 noir", engine)
+    check_bytes("", "abc")
+    check_bytes("id=[0-9]{4}x", "id=1234x id=12345x id=\xe9234x", "shiftand")
+
+    check_incremental(
+        "[BCP]at", "1BatCatPatRat", [(5, 5, "x"), (0, 1, "C"), (13, 14, "")]
+    )
+    check_incremental(
+        "[a-z]+[0-9]", "ab1 cd2 ef3", [(2, 3, ""), (7, 7, "9")], "codegen"
+    )
+    # Joining two words into one match, and splitting it again
+    check_incremental("[a-z]+", "the quick fox", [(3, 4, ""), (5, 5, " ")], "nfa")
+    check_incremental("e{2,4}", "OleeeOla", [(4, 4, "e"), (4, 4, "e")], "auto")
+    check_incremental("a*", "baab", [(4, 4, "a"), (0, 0, "a"), (2, 3, "")])
+    check_incremental(
+        "ERROR.[0-9]+", "INFO 1\nERROR 2\n" * 200, [(1000, 1005, "ERROR")]
+    )
+
+    check(
+        "GA[AT][CG]TC",
+        "GAACTCGATGTCGAAGTC",
+        [Match(0, 6), Match(6, 12), Match(12, 18)],
+        lazy=True,
+        engine="shiftand",
+    )
+    check("e{2}", "eee_ee_e", [Match(1, 3), Match(4, 6)], lazy=True, engine="shiftand")
+    check(
+        "Cat", "1BatCatCatt", [Match(4, 7), Match(7, 10)], lazy=True, engine="literal"
+    )
+    check("aa", "aaaaa", [Match(0, 2), Match(2, 4)], lazy=True, engine="auto")
+    check("[a-z]+[0-9]", "ab1_c2", [Match(0, 3), Match(4, 6)], lazy=True, engine="auto")
+    check_bytes("ERROR", "INFO 1\nERROR 22\nERROR", "literal")
+    check_bytes("caf\xe9", "caf\xe9\xe9 au lait", "auto")
+
+    check(
+        "a*",
+        "baab",
+        [
+            Match(start_idx=0, end_idx=0),
+            Match(start_idx=1, end_idx=3),
+            Match(start_idx=3, end_idx=3),
+        ],
+    )
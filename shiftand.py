@@ -0,0 +1,210 @@
+from dataclasses import dataclass, field
+from enum import Enum
+import logging
+from string import Template
+import sys
+from typing import Callable, Iterator
+
+import matcher
+import nfa
+
+logger = logging.getLogger(__name__)
+
+# Every position is a bit of one int, past a machine word the shifts and ands get slower
+MAX_POSITIONS = 64
+
+
+class ShiftAndErrors(Enum):
+    NOT_FIXED_WIDTH = Template(
+        "Shift-And engine can only repeat a char an exact number of times (ex. `[0-9]{4}`), got `${step}`!"
+    )
+    TOO_MANY_POSITIONS = Template(
+        "Shift-And engine can match at most ${max_positions} chars, the pattern needs ${positions}!"
+    )
+    NO_POSITIONS = Template("Shift-And engine can not match a pattern of no chars!")
+
+
+@dataclass(frozen=True, slots=True)
+class Position:
+    char_set: nfa.CharSet
+    # Chars of the exact repeats right before this position, the (possessive) repeat
+    # would have taken them and then gone over its count, so they fail the match here
+    excluded: nfa.CharSet | None = None
+
+    def __contains__(self, char: matcher.Char) -> bool:
+        return char in self.char_set and (
+            self.excluded is None or char not in self.excluded
+        )
+
+
+@dataclass
+class Program:
+    positions: tuple[Position, ...]
+    # Patterns ending with an exact repeat only match where the next char is not one the
+    # repeat takes (or at the end of the text), checked by one more position that is not
+    # part of the match
+    lookahead: bool = False
+    # Bit mask of the positions every char seen so far matches, made on first use
+    masks: dict[matcher.Char, int] = field(default_factory=dict, repr=False)
+
+    @property
+    def width(self) -> int:
+        return len(self.positions) - self.lookahead
+
+    def mask(self, char: matcher.Char) -> int:
+        char_mask = 0
+        for position_idx, position in enumerate(self.positions):
+            if char in position:
+                char_mask |= 1 << position_idx
+        self.masks[char] = char_mask
+        return char_mask
+
+
+def compile(match_exp: matcher.Node) -> Program:
+    # Same steps as the NFA engine, with every exact repeat unrolled into a position per
+    # repeat, so all matches have the same width
+    positions: list[Position] = []
+    excluded: nfa.CharSet | None = None
+    for step in nfa.compile(match_exp).steps:
+        if not step.is_repeat:
+            positions.append(Position(char_set=step.char_set, excluded=excluded))
+            excluded = None
+            continue
+
+        if step.max_repeat_count != step.min_repeat_count:
+            raise nfa.UnsupportedPatternError(
+                ShiftAndErrors.NOT_FIXED_WIDTH.value.substitute(step=step),
+                reason="not fixed width",
+            )
+        assert step.max_repeat_count is not None
+        if step.max_repeat_count > 0:
+            positions.append(Position(char_set=step.char_set, excluded=excluded))
+            positions.extend(
+                Position(char_set=step.char_set)
+                for _ in range(step.max_repeat_count - 1)
+            )
+            excluded = step.char_set
+        else:
+            excluded = step.char_set if excluded is None else excluded | step.char_set
+
+    if not positions:
+        raise nfa.UnsupportedPatternError(
+            ShiftAndErrors.NO_POSITIONS.value.substitute(), reason="matches no chars"
+        )
+    lookahead = excluded is not None
+    if excluded is not None:
+        positions.append(
+            Position(char_set=nfa.CharSet(any_char=True), excluded=excluded)
+        )
+    if len(positions) > MAX_POSITIONS:
+        raise nfa.UnsupportedPatternError(
+            ShiftAndErrors.TOO_MANY_POSITIONS.value.substitute(
+                max_positions=MAX_POSITIONS, positions=len(positions)
+            ),
+            reason=f"longer than {MAX_POSITIONS} chars",
+        )
+
+    program = Program(positions=tuple(positions), lookahead=lookahead)
+    logger.debug(f"Complied Shift-And program: {program}")
+    return program
+
+
+def search(
+    program: Program,
+    source_text: matcher.Text,
+    next_candidate: Callable[[int], int] | None = None,
+    budget: matcher.Budget | None = None,
+) -> Iterator[nfa.Span]:
+    # Bit `i` of `state` is set if the chars up to the current one match the first `i + 1`
+    # positions for some start index, every char moves all of them on at once with a
+    # shift and an and (the bit shifted in is a match starting at this char). All matches
+    # have the same width, so the first to reach the last position also started first.
+    # Every char is a step of the budget.
+    text_len = len(source_text)
+    width, lookahead = program.width, program.lookahead
+    accept_bit = 1 << (len(program.positions) - 1)
+    masks, mask = program.masks, program.mask
+    steps = budget.steps if budget is not None else 0
+    check_at = budget.next_check() if budget is not None else sys.maxsize
+
+    state = 0
+    idx = 0
+    # Next index a match could start at, as last found by `next_candidate`
+    candidate_idx = -1
+    while idx < text_len:
+        steps += 1
+        if steps >= check_at:
+            assert budget is not None
+            check_at = budget.check(steps)
+
+        if not state and next_candidate is not None:
+            # No match is under way, so skip right to the next index one could start at
+            if idx > candidate_idx and (candidate_idx := next_candidate(idx)) < 0:
+                break
+            idx = candidate_idx
+
+        char = source_text[idx]
+        char_mask = masks.get(char)
+        if char_mask is None:
+            char_mask = mask(char)
+        state = ((state << 1) | 1) & char_mask
+        idx += 1
+
+        if state & accept_bit:
+            # The char after a lookahead is not part of the match, the search goes on
+            # from it
+            end_idx = idx - 1 if lookahead else idx
+            if budget is not None:
+                budget.steps = steps
+            yield (end_idx - width, end_idx)
+            state = 0
+            idx = end_idx
+
+    if budget is not None:
+        budget.steps = steps
+    # A match only waiting on its lookahead when the text ends is done
+    if lookahead and state & (accept_bit >> 1):
+        yield (text_len - width, text_len)
+
+
+def check(regex: str, source_text: str, expected_spans: list[nfa.Span] | None):
+    import optimizer
+    import parser
+
+    try:
+        program = compile(optimizer.optimize(parser.parse(regex, 0)))
+        spans = list(search(program, source_text))
+    except nfa.UnsupportedPatternError:
+        passed = expected_spans is None
+        logger.debug(
+            f"UnsupportedPatternError for {regex} is correctly issued? "
+            f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+        )
+        return
+
+    passed = spans == expected_spans
+    logger.debug(
+        f"Shift-And spans {spans} == {expected_spans} for {regex} in {source_text} "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("[BCP]at", "1BatCatPatRat", [(1, 4), (4, 7), (7, 10)])
+    check(".[BCP]at", "1BatCatPatRat", [(0, 4), (6, 10)])
+    check("GA[AT][CG]TC", "GAACTCGATGTCGAAGTC", [(0, 6), (6, 12), (12, 18)])
+    check("id=[0-9]{4}x", "id=1234x id=12345x id=123x", [(0, 8)])
+    # Going over the count fails the whole repeat, same as the tree matcher
+    check("e{2}", "eee_ee_e", [(1, 3), (4, 6)])
+    check("[a-f0-9]{8}", "deadbeef cafe0123456", [(0, 8), (12, 20)])
+    check("a{0}b", "aab_b", [(2, 3), (4, 5)])
+    check("[ab]{2}c", "abc_abbc_ab", [(0, 3), (5, 8)])
+    check("a+b", "aab", None)
+    check("e{2,4}", "eee", None)
+    check("a{0}", "b", None)
+    check("x{65}", "x" * 65, None)
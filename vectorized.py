@@ -0,0 +1,250 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from enum import Enum
+import logging
+from string import Template
+from typing import TYPE_CHECKING
+
+import matcher
+import nfa
+import prefilter
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    try:
+        import numpy as np
+    except ImportError:
+        # Only installed with the `numpy` extra, without it candidates are found by the
+        # prefilter alone
+        np = None
+
+logger = logging.getLogger(__name__)
+
+Text = matcher.Text
+
+# Chars at the start of the pattern every candidate is checked against
+DEFAULT_MAX_POSITIONS = 4
+# Texts are scanned this many start indexes at a time, so stopping early (ex. `first()`)
+# does not scan the whole text and the arrays stay small
+BLOCK_LEN = 64 * 1024
+# Shorter texts cost more to turn into arrays than checking them index by index
+MIN_TEXT_LEN = 1024
+
+
+class VectorizedErrors(Enum):
+    NO_NUMPY = Template(
+        "Vectorized candidate scan needs NumPy, install the `numpy` extra!"
+    )
+    NO_POSITIONS = Template(
+        "Vectorized candidate scan needs a pattern that starts with a char (ex. `[a-z]`), got `${match_exp}`!"
+    )
+
+
+def available() -> bool:
+    return np is not None
+
+
+def supports(source_text: Text) -> bool:
+    # A `memoryview` of anything but bytes gives items that are not its bytes
+    return not isinstance(source_text, memoryview) or source_text.itemsize == 1
+
+
+def preferred(search_prefilter: prefilter.Prefilter | None) -> bool:
+    # Literals of a few chars are found faster with `find`, a single char is common
+    # enough that checking the first chars of every candidate at once skips more
+    return search_prefilter is None or (
+        len(search_prefilter.prefix) < 2 and len(search_prefilter.inner) < 2
+    )
+
+
+def _lookup(char_set: nfa.CharSet) -> np.ndarray:
+    # True at the code of every char in the set, and False for the last entry that codes
+    # past the table are clipped to
+    codes = [matcher.code(char) for char in char_set.chars]
+    ranges = [
+        (matcher.code(first), matcher.code(last)) for first, last in char_set.ranges
+    ]
+    lookup = np.zeros(max([*codes, *(last for _, last in ranges), 0]) + 2, dtype=bool)
+    lookup[codes] = True
+    for first, last in ranges:
+        lookup[first : last + 1] = True
+    return lookup
+
+
+@dataclass(frozen=True)
+class CandidateMask:
+    # Char sets of the first chars of every match, in order, as lookup tables by char code
+    # (None for any char)
+    char_sets: tuple[nfa.CharSet, ...]
+    lookups: tuple[np.ndarray | None, ...] = field(repr=False, compare=False)
+
+    @property
+    def width(self) -> int:
+        return len(self.char_sets)
+
+    def mask(self, codes: np.ndarray) -> np.ndarray:
+        # True at every index of `codes` the first chars of a match could start at, the
+        # last `width - 1` codes are only there to be looked at by the later positions
+        starts_len = len(codes) - self.width + 1
+        starts_mask = np.ones(max(starts_len, 0), dtype=bool)
+        for offset, lookup in enumerate(self.lookups):
+            if lookup is None:
+                continue
+            window = codes[offset : offset + starts_len]
+            starts_mask &= lookup[np.minimum(window, len(lookup) - 1)]
+        return starts_mask
+
+    def finder(
+        self,
+        source_text: Text,
+        block_len: int = BLOCK_LEN,
+        stop_idx: int | None = None,
+    ) -> CandidateFinder:
+        return CandidateFinder(
+            candidate_mask=self,
+            source_text=source_text,
+            block_len=block_len,
+            stop_idx=stop_idx,
+        )
+
+
+@dataclass
+class CandidateFinder:
+    # Finds the indexes a match could start at, same as `prefilter.CandidateFinder`, by
+    # turning a block of the text into an array of char codes and masking it all at once
+    candidate_mask: CandidateMask
+    source_text: Text
+    block_len: int = BLOCK_LEN
+    # Candidates are only looked for before this index, the text past it is not scanned
+    stop_idx: int | None = None
+    # Candidates of the block of start indexes last scanned
+    candidates: list[int] = field(default_factory=list)
+    block_start_idx: int = 0
+    block_end_idx: int = 0
+
+    def codes(self, start_idx: int, end_idx: int) -> np.ndarray:
+        source_text = self.source_text
+        if isinstance(source_text, str):
+            # Surrogates are chars of a `str` too, and have a code like any other
+            return np.frombuffer(
+                source_text[start_idx:end_idx].encode("utf-32-le", "surrogatepass"),
+                dtype=np.uint32,
+            )
+        return np.frombuffer(
+            source_text, dtype=np.uint8, count=end_idx - start_idx, offset=start_idx
+        )
+
+    def scan_block(self, start_idx: int, last_start_idx: int):
+        end_idx = min(start_idx + self.block_len, last_start_idx + 1)
+        codes = self.codes(start_idx, end_idx + self.candidate_mask.width - 1)
+        starts_mask = self.candidate_mask.mask(codes)
+        self.candidates = (np.flatnonzero(starts_mask) + start_idx).tolist()
+        self.block_start_idx, self.block_end_idx = start_idx, end_idx
+
+    def __call__(self, idx: int) -> int:
+        # Smallest index >= `idx` a match could start at, -1 if there is none left
+        last_start_idx = len(self.source_text) - self.candidate_mask.width
+        if self.stop_idx is not None:
+            last_start_idx = min(last_start_idx, self.stop_idx - 1)
+        while idx <= last_start_idx:
+            if not self.block_start_idx <= idx < self.block_end_idx:
+                self.scan_block(idx, last_start_idx)
+            candidate_pos = bisect_left(self.candidates, idx)
+            if candidate_pos < len(self.candidates):
+                return self.candidates[candidate_pos]
+            idx = self.block_end_idx
+        return -1
+
+
+def compile(
+    match_exp: matcher.Node, max_positions: int = DEFAULT_MAX_POSITIONS
+) -> CandidateMask:
+    # The chars every match starts with, from the NFA steps up to the first repeat that
+    # can match a varying number of chars
+    if np is None:
+        raise nfa.UnsupportedPatternError(VectorizedErrors.NO_NUMPY.value.substitute())
+
+    char_sets: list[nfa.CharSet] = []
+    for step in nfa.compile(match_exp).steps:
+        if not step.is_repeat:
+            char_sets.append(step.char_set)
+        else:
+            char_sets.extend(
+                [step.char_set] * min(step.min_repeat_count, max_positions)
+            )
+            if step.max_repeat_count != step.min_repeat_count:
+                break
+        if len(char_sets) >= max_positions:
+            break
+
+    if not char_sets:
+        raise nfa.UnsupportedPatternError(
+            VectorizedErrors.NO_POSITIONS.value.substitute(match_exp=match_exp)
+        )
+    char_sets = char_sets[:max_positions]
+    candidate_mask = CandidateMask(
+        char_sets=tuple(char_sets),
+        lookups=tuple(
+            None if char_set.any_char else _lookup(char_set) for char_set in char_sets
+        ),
+    )
+    logger.debug(f"Complied candidate mask: {candidate_mask}")
+    return candidate_mask
+
+
+def check(regex: str, source_text: Text, block_len: int = 16):
+    import optimizer
+    import parser
+    import regex as regex_
+
+    match_exp = optimizer.optimize(parser.parse(regex, 0))
+    if not isinstance(source_text, str):
+        match_exp = regex_.compile(regex).bytes_matcher.match_exp
+    candidate_mask = compile(match_exp)
+    finder = candidate_mask.finder(source_text, block_len=block_len)
+    expected_matches = list(regex_._finditer(match_exp, source_text))
+    matches = list(regex_._finditer(match_exp, source_text, finder))
+
+    passed = matches == expected_matches
+    logger.debug(
+        f"Vectorized matches {matches} == {expected_matches} for {regex} in "
+        f"{source_text!r} (first {candidate_mask.width} chars checked) "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}",
+        extra={"markup": False},
+    )
+
+
+def check_unsupported(regex: str):
+    import optimizer
+    import parser
+
+    try:
+        compile(optimizer.optimize(parser.parse(regex, 0)))
+        passed = False
+    except nfa.UnsupportedPatternError:
+        passed = True
+    logger.debug(
+        f"UnsupportedPatternError for {regex} is correctly issued? "
+        f"<<<<<<<<<<< {'SUCCESS' if passed else 'FAIL'}"
+    )
+
+
+if __name__ == "__main__":
+    import log
+
+    log.setup()
+
+    check("[BCP]at", "1BatCatPatRat" * 5)
+    check(".[BCP]at", "1BatCatPatRat" * 5)
+    check("GA[AT][CG]TC", "GAACTCGATGTCGAAGTC" * 3, block_len=7)
+    check("[0-9]{2,}ms", "took 5ms took 12ms took 123ms" * 2)
+    check("id=[0-9]{4}x", "id=1234x id=12345x id=123x")
+    check("[a-c]+[xyz]", "abcx_ccaz_bb")
+    check("e{2}", "eee_ee_e")
+    check("[一-龥]+", "abc一二三 def 龥", block_len=3)
+    check("caf\xe9+", b"caf\xe9\xe9 au lait, caf\xe9")
+    check("[a-z]+", memoryview(b"abc 123 de"))
+    check("abcd", "abc")
+    check_unsupported("a*")
+    check_unsupported("[a+b]c")